@@ -0,0 +1,4 @@
+"""
+Benchmarks for the replay parsing, frame extraction, query evaluation and rendering paths, run on synthetic
+replays (see replay_generator), so that performance regressions can be measured between runs (see compare).
+"""
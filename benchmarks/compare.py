@@ -0,0 +1,66 @@
+"""
+Compares two benchmark result files (see benchmarks.run_benchmarks), printing the change of every benchmark's
+median time; the exit code is 1 if any benchmark got slower than the threshold, so it can be used in scripts.
+
+Usage example:
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> (list, list):
+    """
+    Returns the comparison rows (name, baseline median, current median, change in percent) and the names of the
+    benchmarks which got slower by more than threshold percent.
+    """
+    rows = []
+    regressions = []
+    for name, current_result in current["results"].items():
+        baseline_result = baseline["results"].get(name, None)
+        if baseline_result is None:
+            rows.append((name, None, current_result["median"], None))
+            continue
+        change = (current_result["median"] / baseline_result["median"] - 1) * 100
+        rows.append((name, baseline_result["median"], current_result["median"], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def format_milliseconds(seconds) -> str:
+    if seconds is None:
+        return "-"
+    return str(round(seconds * 1000, 2)) + " ms"
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    argument_parser.add_argument("baseline", help="the results to compare against")
+    argument_parser.add_argument("current", help="the new results")
+    argument_parser.add_argument("--threshold", type=float, default=10,
+                                 help="slowdown (in percent) reported as a regression (default: 10)")
+    arguments = argument_parser.parse_args(arguments)
+
+    with open(arguments.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(arguments.current, "r") as f:
+        current = json.load(f)
+    if baseline.get("parameters") != current.get("parameters"):
+        print("Warning: the results were produced with different parameters.", file=sys.stderr)
+
+    rows, regressions = compare_results(baseline, current, arguments.threshold)
+    name_width = max([len(row[0]) for row in rows] + [len("benchmark")])
+    print("benchmark".ljust(name_width) + "  " + "baseline".rjust(14) + "  " + "current".rjust(14) + "  change")
+    for name, baseline_median, current_median, change in rows:
+        change_text = "new" if change is None else ("+" if change >= 0 else "") + str(round(change, 1)) + "%"
+        if name in regressions:
+            change_text += "  REGRESSION"
+        print(name.ljust(name_width) + "  " + format_milliseconds(baseline_median).rjust(14) + "  "
+              + format_milliseconds(current_median).rjust(14) + "  " + change_text)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
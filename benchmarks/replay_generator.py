@@ -0,0 +1,164 @@
+"""
+Generates synthetic replays in the same json format as the real ones (the Frames / ActorUpdates structure read by
+replay_parser), so the benchmarks don't depend on the example replays.
+
+Usage example:
+    python -m benchmarks.replay_generator synthetic.json --seconds 300 --players 6 --goals 3
+"""
+import argparse
+import json
+import math
+import random
+
+import src.constants as constants
+
+# the actor ids of the teams and of the players' replication info, which never change during a game
+TEAM_ACTOR_IDS = (1, 2)
+FIRST_PLAYER_INFO_ACTOR_ID = 20
+# the actor which sends the game clock updates (which are ignored by the extraction)
+GAME_EVENT_ACTOR_ID = 7
+FIRST_SPAWNED_ACTOR_ID = 100
+
+GAME_EVENT_SECONDS_REMAINING = "TAGame.GameEvent_Soccar_TA:SecondsRemaining"
+BALL_TYPE_NAME = "Archetypes.Ball.Ball_Default"
+CAR_TYPE_NAME = "Archetypes.Car.Car_Default"
+PLAYER_INFO_TYPE_NAME = "TAGame.Default__PRI_TA"
+TEAM_CLASS_NAME = "TAGame.Team_Soccar_TA"
+BALL_HEIGHT = 93.0
+# the ball's last position before a goal: the real replays stop updating it as it crosses the goal line
+GOAL_BALL_Y = 5200.0
+
+
+def position_update(actor_id: int, x: float, y: float) -> dict:
+    return {
+        constants.ID: actor_id,
+        constants.ACTOR_STATE: {
+            constants.POSITION: {constants.AXIS_X: round(x, 2), constants.AXIS_Y: round(y, 2),
+                                 constants.AXIS_Z: BALL_HEIGHT},
+        },
+    }
+
+
+def first_frame_updates(player_count: int) -> list:
+    """
+    The updates of the first frame which define the teams and the players (see replay_parser.extract_player_info).
+    """
+    actor_updates = [
+        {constants.ID: TEAM_ACTOR_IDS[0], constants.CLASS_NAME: TEAM_CLASS_NAME,
+         constants.TYPE_NAME: constants.TEAM_1_TYPE_NAME},
+        {constants.ID: TEAM_ACTOR_IDS[1], constants.CLASS_NAME: TEAM_CLASS_NAME,
+         constants.TYPE_NAME: constants.TEAM_2_TYPE_NAME},
+    ]
+    for player_index in range(player_count):
+        actor_updates.append({
+            constants.ID: FIRST_PLAYER_INFO_ACTOR_ID + player_index,
+            constants.CLASS_NAME: constants.PLAYER_INFO_CLASS_NAME,
+            constants.TYPE_NAME: PLAYER_INFO_TYPE_NAME,
+            constants.PLAYER_INFO_PLAYER_NAME: "Player" + str(player_index + 1),
+            constants.PLAYER_INFO_PLAYER_TEAM: {"Flag": True, constants.ACTOR_ID: TEAM_ACTOR_IDS[player_index % 2]},
+        })
+    return actor_updates
+
+
+def generate_replay(seconds: float = 300, player_count: int = 6, frame_rate: float = 30,
+                    update_density: float = 0.75, goal_count: int = 3, seed: int = 1) -> dict:
+    """
+    Generates a replay of the given length, in which the ball and the players move on smooth (sinusoidal) paths
+    across the whole field.
+
+    Every actor sends a position update in a frame with the probability given by update_density, like in the real
+    replays, where only the moving actors are updated. Before each goal (spread evenly over the replay), the ball
+    goes into one of the goals (alternately); then the ball and the cars are destroyed and spawned again with new
+    actor ids, which the extraction must follow.
+    """
+    random_generator = random.Random(seed)
+    frame_count = int(seconds * frame_rate)
+    goal_frames = {int(frame_count * (goal_index + 1) / (goal_count + 1)) for goal_index in range(goal_count)}
+
+    next_actor_id = FIRST_SPAWNED_ACTOR_ID
+    ball_actor_id = None
+    car_actor_ids = []
+    frames = []
+    for frame_index in range(frame_count):
+        frame_time = frame_index / frame_rate
+        actor_updates = first_frame_updates(player_count) if frame_index == 0 else []
+        deleted_actor_ids = []
+
+        # spawn the ball and the cars at the start and after every goal, with new actor ids
+        spawned = frame_index == 0 or frame_index in goal_frames
+        if spawned:
+            if ball_actor_id is not None:
+                deleted_actor_ids = [ball_actor_id] + car_actor_ids
+            ball_actor_id = next_actor_id
+            car_actor_ids = list(range(next_actor_id + 1, next_actor_id + 1 + player_count))
+            next_actor_id += player_count + 1
+
+        # the ball
+        if spawned:
+            actor_update = position_update(ball_actor_id, 0, 0)
+            actor_update[constants.CLASS_NAME] = constants.BALL_CLASS_NAME
+            actor_update[constants.TYPE_NAME] = BALL_TYPE_NAME
+            actor_updates.append(actor_update)
+        elif frame_index + 1 in goal_frames:
+            goal_side = 1 if len([goal_frame for goal_frame in goal_frames if goal_frame <= frame_index]) % 2 else -1
+            actor_updates.append(position_update(ball_actor_id, 0, goal_side * GOAL_BALL_Y))
+        elif random_generator.random() < update_density:
+            actor_updates.append(position_update(ball_actor_id,
+                                                 constants.MAX_X * 0.9 * math.sin(frame_index / 97),
+                                                 constants.MAX_Y * 0.9 * math.sin(frame_index / 131)))
+
+        # the players' cars
+        for player_index, car_actor_id in enumerate(car_actor_ids):
+            x = constants.MAX_X * 0.85 * math.sin(frame_index / (50 + player_index * 7))
+            y = constants.MAX_Y * 0.95 * math.cos(frame_index / (60 + player_index * 11))
+            if spawned:
+                actor_update = position_update(car_actor_id, x, y)
+                actor_update[constants.CLASS_NAME] = constants.PLAYER_CAR_CLASS_NAME
+                actor_update[constants.TYPE_NAME] = CAR_TYPE_NAME
+                actor_update[constants.PLAYER_INFO_REFERENCE] = {
+                    "Flag": True, constants.ACTOR_ID: FIRST_PLAYER_INFO_ACTOR_ID + player_index
+                }
+                actor_updates.append(actor_update)
+            elif random_generator.random() < update_density:
+                actor_updates.append(position_update(car_actor_id, x, y))
+
+        # an update without a position, which the extraction has to skip
+        actor_updates.append({constants.ID: GAME_EVENT_ACTOR_ID,
+                              GAME_EVENT_SECONDS_REMAINING: int(seconds - frame_time)})
+
+        frames.append({
+            constants.TIME: round(frame_time, 4),
+            "Delta": round(1 / frame_rate, 4),
+            constants.DELETED_ACTOR_IDS: deleted_actor_ids,
+            constants.ACTOR_UPDATES: actor_updates,
+        })
+
+    return {
+        "Properties": {"TeamSize": player_count // 2, "NumFrames": frame_count},
+        constants.FRAMES: frames,
+    }
+
+
+def write_replay(file_name: str, **generator_parameters):
+    with open(file_name, "w") as f:
+        json.dump(generate_replay(**generator_parameters), f)
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Generate a synthetic json replay.")
+    argument_parser.add_argument("output", help="the replay file to write")
+    argument_parser.add_argument("--seconds", type=float, default=300, help="replay length (default: 300)")
+    argument_parser.add_argument("--players", type=int, default=6, help="number of players (default: 6)")
+    argument_parser.add_argument("--frame-rate", type=float, default=30, help="frames per second (default: 30)")
+    argument_parser.add_argument("--update-density", type=float, default=0.75,
+                                 help="probability of an actor being updated in a frame (default: 0.75)")
+    argument_parser.add_argument("--goals", type=int, default=3, help="number of goal resets (default: 3)")
+    argument_parser.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    arguments = argument_parser.parse_args(arguments)
+    write_replay(arguments.output, seconds=arguments.seconds, player_count=arguments.players,
+                 frame_rate=arguments.frame_rate, update_density=arguments.update_density,
+                 goal_count=arguments.goals, seed=arguments.seed)
+
+
+if __name__ == '__main__':
+    main()
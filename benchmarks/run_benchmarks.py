@@ -0,0 +1,270 @@
+"""
+Times the main paths of the analyzer on a synthetic replay and writes the results as json, so they can be
+compared between runs (see benchmarks.compare):
+    - read_replay_to_json: parsing the whole replay json;
+    - extract_player_info and extract_frames: extracting the players and the frames from the parsed replay;
+    - read_replay: streaming the replay file directly into a frame table;
+    - write_archive, load_archive and load_archive_range: writing the frame table as a frame archive, decoding
+      the whole archive and decoding a tenth of it (the sizes of the replay and of the archive are also written);
+    - query_add_message_N: evaluating N queries, one Query.add_message call per query and frame;
+    - query_manager_N: the same N queries evaluated as a single plan by a QueryManager;
+    - offline_queries_N: the same N queries evaluated over the whole frame table at once;
+    - parallel_queries_N: the same, with the queries split between one worker process per CPU;
+    - heatmaps: building the occupancy grids of the ball, the players and the teams at every cell size;
+    - move_players: drawing the players of every frame with MainFrame.move_players, on a canvas which draws nothing.
+
+Usage example (from the repository root):
+    python -m benchmarks.run_benchmarks --seconds 300 --query-counts 1 10 100 500 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import write_replay
+from src.frame_archive import FrameArchive, write_archive
+from src.main import MainFrame
+from src.offline_query_engine import evaluate_queries
+from src.parallel_query_engine import ParallelQueryEvaluator
+from src.query import Query
+from src.query_manager import QueryManager
+from src.query_sink import ListQuerySink
+from src.replay_heatmaps import ReplayHeatmaps
+from src.replay_renderer import ReplayRenderer
+
+RESULTS_FORMAT_VERSION = 1
+
+# the query conditions used by the query benchmarks, with {} replaced by a threshold which varies between queries
+QUERY_CONDITION_TEMPLATES = [
+    "ball.x < {}",
+    "ball.y > {} and player.1.x < midfield.x",
+    "player.2.x > {} or player.3.y < -{}",
+    "player.4.x - player.5.x > {}",
+    "player.1.x > {} and player.2.x > {} and player.3.x > {}",
+    "(ball.x - player.6.x) * (ball.x - player.6.x) + (ball.y - player.6.y) * (ball.y - player.6.y) < {} * {}",
+    "avg(ball.x, 5 seconds) > {}",
+    "max(player.1.y, 30 entries) < {}",
+]
+QUERY_TIME_WINDOWS = ["2 SECONDS", "10 ENTRIES", "0.5 SECONDS"]
+
+
+def generate_queries(query_count: int) -> list:
+    """
+    Generates a set of distinct queries, of varied shapes, which print now and then on the synthetic replays.
+    """
+    queries = []
+    for query_index in range(query_count):
+        condition = QUERY_CONDITION_TEMPLATES[query_index % len(QUERY_CONDITION_TEMPLATES)]
+        threshold = 100 + (query_index * 37) % 2000
+        queries.append("IF " + condition.format(*[threshold] * condition.count("{}")) + "\n"
+                       "FOR LAST " + QUERY_TIME_WINDOWS[query_index % len(QUERY_TIME_WINDOWS)] + "\n"
+                       "THEN PRINT(\"Query " + str(query_index + 1) + "\")\n"
+                       "EVERY 1 SECONDS")
+    return queries
+
+
+class NullCanvas:
+    """
+    A canvas which only counts the calls made to it, so the rendering path can be timed without a display.
+    """
+
+    def __init__(self):
+        self.item_count = 0
+        self.coords_calls = 0
+
+    def create_item(self, *args, **kwargs):
+        self.item_count += 1
+        return self.item_count
+
+    create_oval = create_item
+    create_rectangle = create_item
+    create_text = create_item
+
+    def coords(self, item, *args):
+        self.coords_calls += 1
+
+
+def time_function(function, repeat: int) -> dict:
+    """
+    Runs the function 'repeat' times and returns the timings, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "runs": repeat,
+    }
+
+
+def run_query_add_message(queries: list, frames: list):
+    for frame in frames:
+        for query in queries:
+            query.add_message(frame)
+
+
+def run_query_manager(query_manager: QueryManager, frames: list):
+    for frame in frames:
+        query_manager.add_message(frame)
+
+
+def run_move_players(main_frame: MainFrame, frames: list):
+    for frame in frames:
+        main_frame.move_players(frame[constants.FRAME_PLAYER])
+
+
+def run_benchmarks(replay_file: str, query_counts: list, repeat: int, log=None) -> (dict, dict):
+    """
+    Runs all the benchmarks on the given replay; returns the results, by benchmark name, and the sizes (in bytes)
+    of the replay file and of its frame archive.
+    """
+    results = {}
+    sizes = {}
+
+    def record(name: str, function, item_count: int = None, function_repeat: int = repeat):
+        results[name] = time_function(function, function_repeat)
+        if item_count:
+            results[name]["items"] = item_count
+            results[name]["median_per_item"] = results[name]["median"] / item_count
+        if log is not None:
+            log(name + ": " + str(round(results[name]["median"] * 1000, 2)) + " ms")
+
+    replay_json = replay_parser.read_replay_to_json(replay_file)
+    player_info = replay_parser.extract_player_info(replay_json[constants.FRAMES][0])
+    frame_count = len(replay_json[constants.FRAMES])
+
+    record("read_replay_to_json", lambda: replay_parser.read_replay_to_json(replay_file))
+    record("extract_player_info",
+           lambda: replay_parser.extract_player_info(replay_json[constants.FRAMES][0]))
+    record("extract_frames", lambda: replay_parser.extract_frames(replay_json, player_info), frame_count)
+    record("read_replay", lambda: replay_parser.read_replay(replay_file), frame_count)
+
+    _, frame_table = replay_parser.read_replay(replay_file)
+    frames = [frame_table.frame(frame_index) for frame_index in range(len(frame_table))]
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        archive_file = os.path.join(temporary_directory, "replay" + constants.ARCHIVE_EXTENSION)
+        record("write_archive", lambda: write_archive(archive_file, player_info, frame_table), frame_count)
+        record("load_archive", lambda: FrameArchive(archive_file).read_frame_table(), frame_count)
+        # a tenth of the replay, from its middle
+        start_time = frame_table.time[0] + (frame_table.time[-1] - frame_table.time[0]) * 0.45
+        end_time = frame_table.time[0] + (frame_table.time[-1] - frame_table.time[0]) * 0.55
+        record("load_archive_range", lambda: FrameArchive(archive_file).read_frame_table(start_time, end_time))
+        sizes["replay"] = os.path.getsize(replay_file)
+        sizes["archive"] = os.path.getsize(archive_file)
+        if log is not None:
+            log("archive size: " + str(sizes["archive"]) + " bytes ("
+                + str(round(sizes["replay"] / sizes["archive"], 1)) + "x smaller than the replay)")
+
+    for query_count in query_counts:
+        query_strings = generate_queries(query_count)
+
+        # the queries keep their evaluation state between runs, which doesn't change the work done per message
+        def add_message_function():
+            run_query_add_message(queries, frames)
+
+        def query_manager_function():
+            run_query_manager(query_manager, frames)
+
+        # the larger query sets are slow in the scalar paths, so they are only run once
+        scalar_repeat = repeat if query_count <= 10 else 1
+        queries = [Query(query_string) for query_string in query_strings]
+        record("query_add_message_" + str(query_count), add_message_function, frame_count * query_count,
+               scalar_repeat)
+
+        query_manager = QueryManager(ListQuerySink())
+        for query_string in query_strings:
+            query_manager.add_query(Query(query_string))
+        record("query_manager_" + str(query_count), query_manager_function, frame_count * query_count,
+               scalar_repeat)
+
+        record("offline_queries_" + str(query_count),
+               lambda: evaluate_queries([Query(query_string) for query_string in query_strings], frame_table),
+               frame_count * query_count)
+
+        # the worker processes are started (and parse the queries) before the timing
+        query_evaluator = ParallelQueryEvaluator("\n\n".join(query_strings))
+        try:
+            query_evaluator.evaluate(frame_table)
+            record("parallel_queries_" + str(query_count), lambda: query_evaluator.evaluate(frame_table),
+                   frame_count * query_count)
+        finally:
+            query_evaluator.close()
+
+    record("heatmaps", lambda: ReplayHeatmaps.from_frame_table(frame_table, player_info), frame_count)
+
+    # the main frame is not initialized (that would need a display), only its renderer is set up
+    main_frame = MainFrame.__new__(MainFrame)
+    main_frame.renderer = ReplayRenderer(NullCanvas(), player_info)
+    record("move_players", lambda: run_move_players(main_frame, frames), frame_count)
+    return results, sizes
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Run the benchmarks on a synthetic replay.")
+    argument_parser.add_argument("--replay", default=None,
+                                 help="benchmark this replay instead of a synthetic one")
+    argument_parser.add_argument("--seconds", type=float, default=300,
+                                 help="length of the synthetic replay (default: 300)")
+    argument_parser.add_argument("--players", type=int, default=6, help="number of players (default: 6)")
+    argument_parser.add_argument("--update-density", type=float, default=0.75,
+                                 help="probability of an actor being updated in a frame (default: 0.75)")
+    argument_parser.add_argument("--goals", type=int, default=3, help="number of goal resets (default: 3)")
+    argument_parser.add_argument("--query-counts", type=int, nargs="+", default=[1, 10, 100, 500],
+                                 help="the numbers of queries to evaluate (default: 1 10 100 500)")
+    argument_parser.add_argument("--repeat", type=int, default=5, help="runs of every benchmark (default: 5)")
+    argument_parser.add_argument("-o", "--output", default=None, help="results file (default: standard output)")
+    arguments = argument_parser.parse_args(arguments)
+
+    parameters = {
+        "seconds": arguments.seconds,
+        "players": arguments.players,
+        "update_density": arguments.update_density,
+        "goals": arguments.goals,
+        "query_counts": arguments.query_counts,
+        "repeat": arguments.repeat,
+    }
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        replay_file = arguments.replay
+        if replay_file is None:
+            replay_file = os.path.join(temporary_directory, "synthetic.json")
+            write_replay(replay_file, seconds=arguments.seconds, player_count=arguments.players,
+                         update_density=arguments.update_density, goal_count=arguments.goals)
+        else:
+            parameters = {"replay": replay_file, "query_counts": arguments.query_counts, "repeat": arguments.repeat}
+        results, sizes = run_benchmarks(replay_file, arguments.query_counts, arguments.repeat,
+                                        log=lambda line: print(line, file=sys.stderr))
+
+    output = {
+        "version": RESULTS_FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "parameters": parameters,
+        "results": results,
+        "sizes": sizes,
+    }
+    if arguments.output is None:
+        print(json.dumps(output, indent=2))
+    else:
+        with open(arguments.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Headless batch analysis: runs a file of queries (in the same IF / FOR / THEN / EVERY format used by the UI,
+separated by a blank line) against many replays, using a pool of worker processes, and streams the events
+printed by the queries to a JSONL or CSV file.
+
+For large query sets, the queries of every replay can instead be split between the worker processes, which share
+the replay's frames in memory (see parallel_query_engine), with --query-workers.
+
+Usage examples:
+    python -m src.batch_analyzer queries.txt "replaysJson/*.json" --workers 8 --output events.jsonl
+    python -m src.batch_analyzer detections.txt replay.json --query-workers 8 --output events.jsonl
+    python -m src.batch_analyzer detections.txt replay.json --explain
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import src.constants as constants
+import src.parallel_query_engine as parallel_query_engine
+import src.replay_parser as replay_parser
+from src.offline_query_engine import evaluate_queries
+from src.query import Query
+from src.query_parse_exception import QueryParseException
+from src.replay_cache import ReplayCache
+from src.replay_files import find_replay_files, report_progress
+
+OUTPUT_FORMAT_JSONL = "jsonl"
+OUTPUT_FORMAT_CSV = "csv"
+
+OUTPUT_REPLAY = "replay"
+OUTPUT_TIME = "time"
+OUTPUT_MESSAGE = "message"
+
+# the queries parsed by each worker process when the worker is started (also by the workers of the parallel query
+# evaluation, see parallel_query_engine), the cache of extracted replays and the rate at which the replays are
+# resampled (None to keep the replays' own frames)
+_worker_queries = []
+_worker_replay_cache = None
+_worker_tick_rate = None
+
+
+def split_queries(queries_text: str) -> list:
+    return queries_text.strip().split("\n\n")
+
+
+def parse_queries(queries_text: str) -> list:
+    """
+    Parses the queries from a text in which they are separated by a blank line.
+    """
+    queries = []
+    for query_index, query_text in enumerate(split_queries(queries_text), 1):
+        try:
+            queries.append(Query(query_text))
+        except QueryParseException as exception:
+            raise QueryParseException("Query #" + str(query_index) + ": " + str(exception))
+    return queries
+
+
+def init_worker(queries_text: str, cache_directory: str, tick_rate: float = None):
+    # the compiled queries can't be sent to the workers, so every worker parses them again, once
+    global _worker_queries, _worker_replay_cache, _worker_tick_rate
+    _worker_queries = parse_queries(queries_text)
+    if cache_directory is not None:
+        _worker_replay_cache = ReplayCache(cache_directory)
+    _worker_tick_rate = tick_rate
+
+
+def analyze_replay(replay_file: str) -> list:
+    """
+    Extracts the frames of a replay and returns the (time, message) events printed by the worker's queries.
+    """
+    player_info, extracted_frames = replay_parser.load_replay(replay_file, _worker_replay_cache)
+    if _worker_tick_rate is not None:
+        extracted_frames = extracted_frames.resample(_worker_tick_rate)
+    return evaluate_queries(_worker_queries, extracted_frames, player_info)
+
+
+def explain_queries(queries_text: str, replay_file: str, cache_directory: str = None) -> str:
+    """
+    Samples the queries' clauses on a replay (their pass rates over the whole replay, and their costs over its
+    first frames, see QueryCondition.plan_clauses), and returns the plan of every query's condition: its clauses
+    in the order in which they are evaluated, with their pass rates and costs.
+    """
+    queries = parse_queries(queries_text)
+    replay_cache = ReplayCache(cache_directory) if cache_directory is not None else None
+    player_info, extracted_frames = replay_parser.load_replay(replay_file, replay_cache)
+    frames = [extracted_frames.frame(frame_index)
+              for frame_index in range(min(len(extracted_frames), constants.CLAUSE_SAMPLE_MESSAGES))]
+
+    lines = []
+    for query_index, query in enumerate(queries, 1):
+        query.compiled_condition.bind_players(player_info)
+        query.compiled_condition.sample_clauses(extracted_frames)
+        for frame in frames:
+            query.add_message(frame)
+        lines.append("#" + str(query_index) + " " + query.print_string)
+        lines.append(query.compiled_condition.explain())
+    return "\n".join(lines)
+
+
+class EventWriter:
+    """
+    Writes the events printed by the queries, one line per event, in JSONL or CSV format.
+    """
+
+    def __init__(self, output_file, output_format: str):
+        self.output_file = output_file
+        self.csv_writer = None
+        if output_format == OUTPUT_FORMAT_CSV:
+            self.csv_writer = csv.writer(output_file)
+            self.csv_writer.writerow([OUTPUT_REPLAY, OUTPUT_TIME, OUTPUT_MESSAGE])
+
+    def write_events(self, replay_file: str, events: list):
+        for event_time, message in events:
+            if self.csv_writer is not None:
+                self.csv_writer.writerow([replay_file, event_time, message])
+            else:
+                self.output_file.write(json.dumps({
+                    OUTPUT_REPLAY: replay_file,
+                    OUTPUT_TIME: event_time,
+                    OUTPUT_MESSAGE: message,
+                }) + "\n")
+        self.output_file.flush()
+
+
+def run_batch(queries_text: str, replay_files: list, event_writer: EventWriter, workers: int = None,
+              show_progress: bool = True, cache_directory: str = None, tick_rate: float = None) -> int:
+    """
+    Analyzes the replays on a pool of worker processes, writing the events of every replay as soon as it is
+    done; returns the number of replays which could not be analyzed.
+    """
+    failed_replays = 0
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(queries_text, cache_directory, tick_rate)) as executor:
+        futures = {executor.submit(analyze_replay, replay_file): replay_file for replay_file in replay_files}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            replay_file = futures[future]
+            try:
+                events = future.result()
+                event_writer.write_events(replay_file, events)
+                status = str(len(events)) + " events"
+            except Exception as exception:
+                failed_replays += 1
+                status = "failed: " + repr(exception)
+            if show_progress:
+                report_progress(done_count, len(replay_files), replay_file, status, start_time)
+    return failed_replays
+
+
+def run_batch_parallel_queries(queries_text: str, replay_files: list, event_writer: EventWriter, query_workers: int,
+                               show_progress: bool = True, cache_directory: str = None,
+                               tick_rate: float = None) -> int:
+    """
+    Same as run_batch, but the replays are analyzed one at a time, the queries of every replay being evaluated on
+    a pool of worker processes which share the replay's frames (see ParallelQueryEvaluator); this is faster for
+    large query sets over few replays.
+    """
+    failed_replays = 0
+    start_time = time.perf_counter()
+    replay_cache = ReplayCache(cache_directory) if cache_directory is not None else None
+    query_evaluator = parallel_query_engine.ParallelQueryEvaluator(queries_text, query_workers)
+    try:
+        for done_count, replay_file in enumerate(replay_files, 1):
+            try:
+                player_info, extracted_frames = replay_parser.load_replay(replay_file, replay_cache)
+                if tick_rate is not None:
+                    extracted_frames = extracted_frames.resample(tick_rate)
+                events = query_evaluator.evaluate(extracted_frames, player_info)
+                event_writer.write_events(replay_file, events)
+                status = str(len(events)) + " events"
+            except Exception as exception:
+                failed_replays += 1
+                status = "failed: " + repr(exception)
+            if show_progress:
+                report_progress(done_count, len(replay_files), replay_file, status, start_time)
+    finally:
+        query_evaluator.close()
+    return failed_replays
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Run queries against a set of json replays.")
+    argument_parser.add_argument("query_file", help="file with the queries, separated by a blank line")
+    argument_parser.add_argument("replays", nargs="+",
+                                 help="replay files or glob patterns (e.g. 'replaysJson/*.json')")
+    argument_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                                 help="number of worker processes (default: the number of CPUs)")
+    argument_parser.add_argument("-o", "--output", default="-", help="output file (default: standard output)")
+    argument_parser.add_argument("-f", "--format", choices=[OUTPUT_FORMAT_JSONL, OUTPUT_FORMAT_CSV],
+                                 default=OUTPUT_FORMAT_JSONL, help="output format (default: jsonl)")
+    argument_parser.add_argument("-c", "--cache-dir", default=None,
+                                 help="directory in which the extracted replays are cached (default: no cache)")
+    argument_parser.add_argument("-r", "--tick-rate", type=float, default=None,
+                                 help="resample the replays at this many frames per second, interpolating the "
+                                      "positions (default: use the replays' own frames)")
+    argument_parser.add_argument("-Q", "--query-workers", type=int, default=None,
+                                 help="analyze the replays one at a time, splitting the queries between this many "
+                                      "worker processes which share the replay's frames (for large query sets)")
+    argument_parser.add_argument("--explain", action="store_true",
+                                 help="print the order in which the clauses of every query are evaluated, with their "
+                                      "pass rates and costs sampled on the first replay, instead of analyzing the "
+                                      "replays")
+    argument_parser.add_argument("-q", "--quiet", action="store_true", help="don't report the progress")
+    arguments = argument_parser.parse_args(arguments)
+
+    with open(arguments.query_file, "r") as f:
+        queries_text = f.read()
+    try:
+        # parse the queries once here as well, so that format errors are reported before any work is done
+        parse_queries(queries_text)
+    except QueryParseException as exception:
+        print("Query format error: " + str(exception), file=sys.stderr)
+        return 2
+
+    replay_files = find_replay_files(arguments.replays)
+    if not replay_files:
+        print("No replay files found.", file=sys.stderr)
+        return 2
+
+    if arguments.explain:
+        print(explain_queries(queries_text, replay_files[0], arguments.cache_dir))
+        return 0
+
+    if arguments.output == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(arguments.output, "w", newline="")
+    try:
+        event_writer = EventWriter(output_file, arguments.format)
+        if arguments.query_workers is not None:
+            failed_replays = run_batch_parallel_queries(queries_text, replay_files, event_writer,
+                                                        arguments.query_workers, not arguments.quiet,
+                                                        arguments.cache_dir, arguments.tick_rate)
+        else:
+            failed_replays = run_batch(queries_text, replay_files, event_writer, arguments.workers,
+                                       not arguments.quiet, arguments.cache_dir, arguments.tick_rate)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    return 1 if failed_replays else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 # Strings that indicate values in the replay json
 FRAMES = "Frames"
 ACTOR_UPDATES = "ActorUpdates"
+DELETED_ACTOR_IDS = "DeletedActorIds"
 CLASS_NAME = "ClassName"
 TYPE_NAME = "TypeName"
 POSITION = "Position"
@@ -12,6 +13,49 @@ PLAYER_INFO_PLAYER_NAME = "Engine.PlayerReplicationInfo:PlayerName"
 PLAYER_INFO_PLAYER_TEAM = "Engine.PlayerReplicationInfo:Team"
 PLAYER_INFO_REFERENCE = "Engine.Pawn:PlayerReplicationInfo"
 
+# The size (in characters) of the chunks read from a replay file while streaming its frames
+REPLAY_READ_CHUNK_SIZE = 1 << 20
+
+# The cache of extracted replays: its directory, its maximum size in bytes (the least recently used replays are
+# evicted when it is exceeded), and the version of its format (cached replays with other versions are ignored)
+REPLAY_CACHE_DIRECTORY = "../replaysCache"
+REPLAY_CACHE_MAX_SIZE = 512 * 1024 * 1024
+REPLAY_CACHE_FORMAT_VERSION = 5
+
+# The compressed frame archives (see frame_archive.py): their file extension, the number of frames in a block (the
+# unit of compression and of random access), the fixed-point scales of the times (1/10 ms) and of the positions
+# (1/100 unit), and the zlib compression level of the blocks
+ARCHIVE_EXTENSION = ".rla"
+ARCHIVE_BLOCK_FRAMES = 1024
+ARCHIVE_TIME_SCALE = 10000
+ARCHIVE_POSITION_SCALE = 100
+ARCHIVE_COMPRESSION_LEVEL = 6
+
+# The position heatmaps of a replay (see replay_heatmaps.py): the sizes of their cells in game units, one grid per
+# size (the cells are slightly shrunk so a whole number of them spans the field), and the file in which they are
+# kept in a replay's cache entry
+HEATMAP_CELL_SIZES = (512, 256, 128)
+HEATMAP_FILE_NAME = "heatmaps.npz"
+
+# The file in which the profiling statistics of the queries are written when a replay finishes (None to disable it)
+QUERY_PROFILE_FILE = "../queryProfile.json"
+
+# The maximum number of query timelines (the events printed by a query over a whole replay) kept in memory, so the
+# unchanged queries are not evaluated again when the replay is started again (see query_timeline.py)
+QUERY_TIMELINE_CACHE_SIZE = 512
+# How often (in ms) the UI checks whether the queries' events over the replay are evaluated, before starting it
+QUERY_TIMELINE_POLL_INTERVAL_MS = 50
+
+# The number of messages for which all the clauses of a query condition are evaluated and timed, before they are
+# reordered by their cost and pass rate (see QueryCondition.plan_clauses)
+CLAUSE_SAMPLE_MESSAGES = 256
+
+# Live ingestion (see live_ingestion.py): the maximum size of a streamed frame (one json line), and the number of
+# frames / results which can wait between the stages of a stream before the previous stage has to wait too
+LIVE_MAX_LINE_SIZE = 16 * 1024 * 1024
+LIVE_FRAME_QUEUE_SIZE = 256
+LIVE_RESULT_QUEUE_SIZE = 1024
+
 # Class & Type names used when searching for a particular type of actor in a frame
 BALL_CLASS_NAME = "TAGame.Ball_TA"
 PLAYER_CAR_CLASS_NAME = "TAGame.Car_TA"
@@ -31,6 +75,8 @@ FRAME_BALL = "ball"
 FRAME_X = "x"
 FRAME_Y = "y"
 FRAME_PLAYER = "player"
+FRAME_AGE = "age"
+FRAME_EVENTS = "events"
 
 # Values used in the player information list
 STORED_PLAYER_ID = "Id"
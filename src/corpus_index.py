@@ -0,0 +1,298 @@
+"""
+Corpus index: an SQLite database with summary statistics of every replay of a corpus (players, duration, ball
+position ranges, event counts), so the replays worth analyzing can be picked out of thousands before running any
+query on them.
+
+The index is built incrementally: a replay is only extracted again if its file changed (its modification time or
+size, and then its content hash, differ from the indexed ones). The ball positions are in the coordinates used by
+the query conditions (x along the length of the field, the orange goal being at the negative x).
+
+Usage examples:
+    python -m src.corpus_index index corpus.db "replaysJson/*.json" --workers 8
+    python -m src.corpus_index find corpus.db --player Alx --team orange --min duration 300 --min goal_count 5
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.event_table import EventTable
+from src.frame_table import FrameTable
+from src.replay_cache import ReplayCache
+from src.replay_files import find_replay_files, report_progress
+from src.spatial import TEAM_BLUE, TEAM_ORANGE
+
+# the summary statistics of a replay, as the columns of the replays table
+SUMMARY_COLUMNS = (
+    "duration",
+    "frame_count",
+    "player_count",
+    "ball_min_x",
+    "ball_max_x",
+    "ball_min_y",
+    "ball_max_y",
+    # the share of the frames in which the ball is in the orange half
+    "ball_orange_half_share",
+    "kickoff_count",
+    "goal_count",
+    "orange_goal_count",
+    "blue_goal_count",
+    "touch_count",
+    "possession_change_count",
+)
+
+# the summary columns which are indexed (the others are filtered by scanning the replays table)
+INDEXED_COLUMNS = ("duration", "goal_count", "touch_count", "player_count")
+
+SCHEMA = [
+    "CREATE TABLE replays (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, mtime REAL NOT NULL, "
+    "size INTEGER NOT NULL, hash TEXT NOT NULL, indexed_at REAL NOT NULL, "
+    + ", ".join(column + (" INTEGER" if column.endswith("_count") else " REAL") for column in SUMMARY_COLUMNS) + ")",
+    "CREATE TABLE players (replay_id INTEGER NOT NULL REFERENCES replays(id) ON DELETE CASCADE, "
+    "number INTEGER NOT NULL, name TEXT NOT NULL, team TEXT NOT NULL, PRIMARY KEY (replay_id, number))",
+    "CREATE INDEX players_name ON players (name COLLATE NOCASE, team)",
+    "CREATE INDEX replays_hash ON replays (hash)",
+] + ["CREATE INDEX replays_" + column + " ON replays (" + column + ")" for column in INDEXED_COLUMNS]
+
+
+def summarize_replay(player_info: list, frame_table: FrameTable) -> dict:
+    """
+    Computes the summary statistics of an extracted replay (see SUMMARY_COLUMNS).
+    """
+    frame_count = len(frame_table)
+    # note: the frames' coordinates are reversed, compared to the conditions' ones
+    min_position, max_position = replay_parser.find_min_and_max_of_field(frame_table)
+    ball_valid_count = int(np.count_nonzero(frame_table.ball_valid))
+    ball_orange_half_count = int(np.count_nonzero(frame_table.ball_valid & (frame_table.ball_y < 0)))
+
+    events = frame_table.events if frame_table.events is not None else EventTable()
+    goal_teams = [events.teams[event_index] for event_index in events.type_indices[EventTable.GOAL]]
+    return {
+        "duration": float(frame_table.time[-1] - frame_table.time[0]) if frame_count else 0,
+        "frame_count": frame_count,
+        "player_count": len(player_info),
+        "ball_min_x": min_position[constants.FRAME_Y] if ball_valid_count else None,
+        "ball_max_x": max_position[constants.FRAME_Y] if ball_valid_count else None,
+        "ball_min_y": min_position[constants.FRAME_X] if ball_valid_count else None,
+        "ball_max_y": max_position[constants.FRAME_X] if ball_valid_count else None,
+        "ball_orange_half_share": ball_orange_half_count / ball_valid_count if ball_valid_count else None,
+        "kickoff_count": len(events.type_indices[EventTable.KICKOFF]),
+        "goal_count": len(goal_teams),
+        "orange_goal_count": goal_teams.count(EventTable.TEAM_ORANGE),
+        "blue_goal_count": goal_teams.count(EventTable.TEAM_BLUE),
+        "touch_count": len(events.type_indices[EventTable.TOUCH]),
+        "possession_change_count": len(events.type_indices[EventTable.POSSESSION_CHANGE]),
+    }
+
+
+def summarize_replay_file(replay_file: str, cache_directory: str = None) -> (os.stat_result, str, list, dict):
+    """
+    Extracts a replay file (through the replay cache, if given) and returns the file's stat and content hash, as
+    they were before the extraction, its players' information and its summary statistics; this runs in the
+    indexing worker processes.
+    """
+    file_stat = os.stat(replay_file)
+    replay_hash = ReplayCache.replay_hash(replay_file)
+    replay_cache = ReplayCache(cache_directory) if cache_directory is not None else None
+    player_info, frame_table = replay_parser.load_replay(replay_file, replay_cache)
+    return file_stat, replay_hash, player_info, summarize_replay(player_info, frame_table)
+
+
+class CorpusIndex:
+    """
+    The SQLite database of a corpus' replays: a replays table, with the file's identity (path, modification time,
+    size and content hash) and the summary statistics of every replay, and a players table, with the name and the
+    team (orange or blue) of every player of every replay.
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, database_file: str):
+        self.connection = sqlite3.connect(database_file)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        # the summaries of another format are computed differently, so they are dropped
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != CorpusIndex.FORMAT_VERSION:
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS players")
+                self.connection.execute("DROP TABLE IF EXISTS replays")
+                for statement in SCHEMA:
+                    self.connection.execute(statement)
+                self.connection.execute("PRAGMA user_version = " + str(CorpusIndex.FORMAT_VERSION))
+
+    def close(self):
+        self.connection.close()
+
+    def needs_indexing(self, replay_file: str) -> bool:
+        """
+        Returns whether the replay file is new or changed since it was indexed; a file whose modification time
+        changed but whose content didn't is only marked with its new modification time.
+        """
+        file_stat = os.stat(replay_file)
+        row = self.connection.execute("SELECT mtime, size, hash FROM replays WHERE path = ?",
+                                      (os.path.abspath(replay_file),)).fetchone()
+        if row is None:
+            return True
+        mtime, size, replay_hash = row
+        if mtime == file_stat.st_mtime and size == file_stat.st_size:
+            return False
+        if size != file_stat.st_size or ReplayCache.replay_hash(replay_file) != replay_hash:
+            return True
+        with self.connection:
+            self.connection.execute("UPDATE replays SET mtime = ? WHERE path = ?",
+                                    (file_stat.st_mtime, os.path.abspath(replay_file)))
+        return False
+
+    def store_replay(self, replay_file: str, file_stat: os.stat_result, replay_hash: str, player_info: list,
+                     summary: dict):
+        path = os.path.abspath(replay_file)
+        with self.connection:
+            self.connection.execute("DELETE FROM replays WHERE path = ?", (path,))
+            cursor = self.connection.execute(
+                "INSERT INTO replays (path, mtime, size, hash, indexed_at, " + ", ".join(SUMMARY_COLUMNS)
+                + ") VALUES (?, ?, ?, ?, ?, " + ", ".join("?" * len(SUMMARY_COLUMNS)) + ")",
+                (path, file_stat.st_mtime, file_stat.st_size, replay_hash, time.time())
+                + tuple(summary[column] for column in SUMMARY_COLUMNS))
+            self.connection.executemany(
+                "INSERT INTO players (replay_id, number, name, team) VALUES (?, ?, ?, ?)",
+                [(cursor.lastrowid, player_index + 1, player[constants.STORED_PLAYER_NAME],
+                  TEAM_ORANGE if player[constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1
+                  else TEAM_BLUE)
+                 for player_index, player in enumerate(player_info)])
+
+    def remove_missing(self) -> int:
+        """
+        Removes the replays whose files don't exist anymore; returns their number.
+        """
+        missing_paths = [(path,) for path, in self.connection.execute("SELECT path FROM replays")
+                         if not os.path.isfile(path)]
+        with self.connection:
+            self.connection.executemany("DELETE FROM replays WHERE path = ?", missing_paths)
+        return len(missing_paths)
+
+    def index_replays(self, replay_files: list, workers: int = None, cache_directory: str = None,
+                      show_progress: bool = True) -> (int, int, int):
+        """
+        Indexes the new and changed replay files, extracting them on a pool of worker processes; returns the
+        number of indexed, unchanged and failed replays.
+        """
+        changed_files = [replay_file for replay_file in replay_files if self.needs_indexing(replay_file)]
+        failed_replays = 0
+        if changed_files:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(summarize_replay_file, replay_file, cache_directory): replay_file
+                           for replay_file in changed_files}
+                for done_count, future in enumerate(as_completed(futures), 1):
+                    replay_file = futures[future]
+                    try:
+                        self.store_replay(replay_file, *future.result())
+                        status = "indexed"
+                    except Exception as exception:
+                        failed_replays += 1
+                        status = "failed: " + repr(exception)
+                    if show_progress:
+                        report_progress(done_count, len(changed_files), replay_file, status)
+        return len(changed_files) - failed_replays, len(replay_files) - len(changed_files), failed_replays
+
+    def find_replays(self, player: str = None, team: str = None, minimums: dict = None,
+                     maximums: dict = None) -> list:
+        """
+        Returns the paths of the replays matching all the given filters: a player (by name, case insensitive),
+        the team the player played for (orange or blue; without a player, any player of the team), and the
+        minimum / maximum values of summary columns (see SUMMARY_COLUMNS), e.g. {"duration": 300}.
+        """
+        conditions = []
+        parameters = []
+        if player is not None or team is not None:
+            player_conditions = []
+            if player is not None:
+                player_conditions.append("players.name = ? COLLATE NOCASE")
+                parameters.append(player)
+            if team is not None:
+                player_conditions.append("players.team = ?")
+                parameters.append(team)
+            conditions.append("replays.id IN (SELECT replay_id FROM players WHERE "
+                              + " AND ".join(player_conditions) + ")")
+        for bounds, comparison in ((minimums, " >= ?"), (maximums, " <= ?")):
+            for column, value in (bounds or {}).items():
+                if column not in SUMMARY_COLUMNS:
+                    raise ValueError("Unknown summary column '" + column + "'.")
+                conditions.append("replays." + column + comparison)
+                parameters.append(value)
+
+        statement = "SELECT path FROM replays"
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        return [path for path, in self.connection.execute(statement + " ORDER BY path", parameters)]
+
+    def replay_summary(self, path: str) -> dict:
+        row = self.connection.execute("SELECT " + ", ".join(SUMMARY_COLUMNS) + " FROM replays WHERE path = ?",
+                                      (os.path.abspath(path),)).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row)) if row is not None else None
+
+
+def parse_bounds(bounds: list) -> dict:
+    return {column: float(value) for column, value in bounds or []}
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Index the summary statistics of a corpus of json "
+                                                          "replays, and find replays by their statistics.")
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="index new and changed replays")
+    index_parser.add_argument("database", help="the SQLite index file")
+    index_parser.add_argument("replays", nargs="+", help="replay files or glob patterns (e.g. 'replaysJson/*.json')")
+    index_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                              help="number of worker processes (default: the number of CPUs)")
+    index_parser.add_argument("-c", "--cache-dir", default=None,
+                              help="directory in which the extracted replays are cached (default: no cache)")
+    index_parser.add_argument("--prune", action="store_true", help="remove the replays whose files are gone")
+    index_parser.add_argument("-q", "--quiet", action="store_true", help="don't report the progress")
+
+    find_parser = subparsers.add_parser("find", help="print the paths of the matching replays")
+    find_parser.add_argument("database", help="the SQLite index file")
+    find_parser.add_argument("-p", "--player", default=None, help="a player's name (case insensitive)")
+    find_parser.add_argument("-t", "--team", choices=[TEAM_ORANGE, TEAM_BLUE], default=None,
+                             help="the team of the player (or of any player, without --player)")
+    find_parser.add_argument("--min", nargs=2, action="append", metavar=("COLUMN", "VALUE"),
+                             help="minimum value of a summary column (" + ", ".join(SUMMARY_COLUMNS) + ")")
+    find_parser.add_argument("--max", nargs=2, action="append", metavar=("COLUMN", "VALUE"),
+                             help="maximum value of a summary column")
+    arguments = argument_parser.parse_args(arguments)
+
+    corpus_index = CorpusIndex(arguments.database)
+    try:
+        if arguments.command == "index":
+            if arguments.prune:
+                removed_replays = corpus_index.remove_missing()
+                if not arguments.quiet:
+                    print("Removed " + str(removed_replays) + " missing replays.", file=sys.stderr)
+            replay_files = find_replay_files(arguments.replays)
+            indexed_replays, unchanged_replays, failed_replays = corpus_index.index_replays(
+                replay_files, arguments.workers, arguments.cache_dir, not arguments.quiet)
+            if not arguments.quiet:
+                print("Indexed " + str(indexed_replays) + " replays, " + str(unchanged_replays) + " unchanged, "
+                      + str(failed_replays) + " failed.", file=sys.stderr)
+            return 1 if failed_replays else 0
+
+        try:
+            paths = corpus_index.find_replays(arguments.player, arguments.team, parse_bounds(arguments.min),
+                                              parse_bounds(arguments.max))
+        except ValueError as exception:
+            print(str(exception), file=sys.stderr)
+            return 2
+        for path in paths:
+            print(path)
+        return 0
+    finally:
+        corpus_index.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+import src.constants as constants
+
+
+class EventTable:
+    """
+    The game events of a replay, in time order: kickoffs, goals, ball touches and possession changes. Every event
+    has a time, a type, the number of the player involved (0 if none) and the team involved (0 if none).
+
+    Besides the list of events, the table gives the values derived from the events at any time of the replay
+    (see FRAME_VALUES), e.g. the team which last touched the ball or the seconds since the last kickoff; they are
+    exposed to the query conditions as operands (last_touch.team, since_kickoff etc.).
+    """
+
+    KICKOFF = 1
+    GOAL = 2
+    TOUCH = 3
+    POSSESSION_CHANGE = 4
+    EVENT_TYPES = (KICKOFF, GOAL, TOUCH, POSSESSION_CHANGE)
+
+    NO_TEAM = 0
+    TEAM_ORANGE = 1
+    TEAM_BLUE = 2
+
+    COLUMNS = ("time", "type", "player", "team")
+    FILE_PREFIX = "events_"
+
+    # the values derived from the events -> (the event type they come from, the event field they are)
+    FRAME_VALUES = {
+        "last_touch_team": (TOUCH, "team"),
+        "last_touch_player": (TOUCH, "player"),
+        "last_goal_team": (GOAL, "team"),
+        "since_touch": (TOUCH, "since"),
+        "since_kickoff": (KICKOFF, "since"),
+        "since_goal": (GOAL, "since"),
+    }
+
+    def __init__(self):
+        self.times = []
+        self.types = []
+        self.players = []
+        self.teams = []
+
+        # event type -> the times and the indices of its events
+        self.type_times = {event_type: [] for event_type in EventTable.EVENT_TYPES}
+        self.type_indices = {event_type: [] for event_type in EventTable.EVENT_TYPES}
+
+    def add_event(self, event_time: float, event_type: int, player: int = 0, team: int = NO_TEAM):
+        # the events can be read while they are added (see ReplayLoader), so an event's index is added before
+        # its time, which is what makes it visible
+        self.times.append(event_time)
+        self.types.append(event_type)
+        self.players.append(player)
+        self.teams.append(team)
+        self.type_indices[event_type].append(len(self.times) - 1)
+        self.type_times[event_type].append(event_time)
+
+    def __len__(self):
+        return len(self.times)
+
+    def frame_values(self, frame_time: float) -> dict:
+        """
+        Returns the values derived from the events up to the given time, by name (a value is missing if there
+        is no event of its type yet).
+        """
+        values = {}
+        for name, (event_type, field) in EventTable.FRAME_VALUES.items():
+            type_times = self.type_times[event_type]
+            position = bisect_right(type_times, frame_time)
+            if position == 0:
+                continue
+            event_index = self.type_indices[event_type][position - 1]
+            if field == "since":
+                values[name] = frame_time - self.times[event_index]
+            elif field == "team":
+                values[name] = self.teams[event_index]
+            else:
+                values[name] = self.players[event_index]
+        return values
+
+    def frame_column(self, name: str, frame_times: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Vectorized version of frame_values, for a single value over many frames; returns the values and a mask of
+        the frames in which the value exists.
+        """
+        event_type, field = EventTable.FRAME_VALUES[name]
+        type_times = np.array(self.type_times[event_type], dtype=np.float64)
+        if len(type_times) == 0:
+            return np.zeros(len(frame_times)), np.zeros(len(frame_times), dtype=bool)
+
+        event_indices = np.array(self.type_indices[event_type][:len(type_times)], dtype=np.int64)
+        positions = np.searchsorted(type_times, frame_times, side="right")
+        valid = positions > 0
+        event_indices = event_indices[np.maximum(positions - 1, 0)]
+        if field == "since":
+            values = frame_times - type_times[np.maximum(positions - 1, 0)]
+        elif field == "team":
+            values = np.array(self.teams[:len(self.times)], dtype=np.float64)[event_indices]
+        else:
+            values = np.array(self.players[:len(self.times)], dtype=np.float64)[event_indices]
+        return np.where(valid, values, 0), valid
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, EventTable.FILE_PREFIX + "time.npy"), np.array(self.times, dtype=np.float64))
+        np.save(os.path.join(directory, EventTable.FILE_PREFIX + "type.npy"), np.array(self.types, dtype=np.int8))
+        np.save(os.path.join(directory, EventTable.FILE_PREFIX + "player.npy"), np.array(self.players, dtype=np.int8))
+        np.save(os.path.join(directory, EventTable.FILE_PREFIX + "team.npy"), np.array(self.teams, dtype=np.int8))
+
+    @classmethod
+    def load(cls, directory: str):
+        columns = {}
+        for column_name in EventTable.COLUMNS:
+            columns[column_name] = np.load(os.path.join(directory, EventTable.FILE_PREFIX + column_name + ".npy"))
+        event_table = cls()
+        for event_time, event_type, player, team in zip(columns["time"].tolist(), columns["type"].tolist(),
+                                                        columns["player"].tolist(), columns["team"].tolist()):
+            event_table.add_event(event_time, event_type, player, team)
+        return event_table
+
+
+class EventDetector:
+    """
+    Detects the game events while the frames are extracted (see replay_parser.iterate_extracted_frames), in the
+    same single pass over the replay:
+        - a kickoff, whenever a ball actor is spawned (a new ball is spawned for every kickoff);
+        - a goal, when the ball is destroyed (the goal reset, before the ball of the next kickoff is spawned) while
+          its last known position is within GOAL_LINE_DISTANCE of a goal line; the team which scored is the one
+          attacking that goal. The ball's position isn't reliable enough to detect the goal itself: the replays
+          stop updating it as it crosses the line (it never goes past y = 5213.3 in the real ones). The goal's
+          time is the time of the frame in which the ball is destroyed, so the events stay in the frames' order;
+        - a touch, when a player gets close enough to the ball to touch it (the closest player within
+          TOUCH_DISTANCE, in 3D, so a ball flying over a car doesn't touch it), unless it was already touching it
+          in the previous frame;
+        - a possession change, when the ball is touched by the other team than the one which touched it last.
+    The positions are in the frames' coordinates: the field's length is along y, and the orange goal is at the
+    negative y. The heights of the ball and the cars are not part of the frames, so they are given separately.
+    """
+
+    GOAL_LINE_Y = 5120
+    # a little more than the distance the ball can travel between two of its position updates
+    GOAL_LINE_DISTANCE = 500
+    # the distance between the ball's center and a car's center at which the car touches the ball
+    TOUCH_DISTANCE = 200
+
+    def __init__(self, player_info: list):
+        # player number (string) -> team
+        self.player_teams = {}
+        for player_index, player in enumerate(player_info):
+            if player[constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1:
+                self.player_teams[str(player_index + 1)] = EventTable.TEAM_ORANGE
+            else:
+                self.player_teams[str(player_index + 1)] = EventTable.TEAM_BLUE
+
+        self.events = EventTable()
+        # the y of the ball's last known position (None if the ball isn't known)
+        self.ball_y = None
+        self.touching_player = None
+        self.possession_team = EventTable.NO_TEAM
+
+    def ball_spawned(self, frame_time: float):
+        self.events.add_event(frame_time, EventTable.KICKOFF)
+        self.touching_player = None
+
+    def ball_destroyed(self, frame_time: float):
+        ball_y = self.ball_y
+        self.ball_y = None
+        if ball_y is None or abs(ball_y) < EventDetector.GOAL_LINE_Y - EventDetector.GOAL_LINE_DISTANCE:
+            return
+        # the orange goal is at the negative y, so a ball in it means that the blue team scored
+        scoring_team = EventTable.TEAM_BLUE if ball_y < 0 else EventTable.TEAM_ORANGE
+        self.events.add_event(frame_time, EventTable.GOAL, team=scoring_team)
+
+    def add_frame(self, extracted_frame: dict, heights: dict):
+        """
+        Detects the events of an extracted frame; heights holds the last known height of the ball ("ball") and of
+        the players (by player number, as a string).
+        """
+        ball_position = extracted_frame.get(constants.FRAME_BALL, None)
+        if ball_position is None:
+            return
+        frame_time = extracted_frame[constants.FRAME_TIME]
+        self.ball_y = ball_position[constants.FRAME_Y]
+
+        # the closest player which can touch the ball, if any
+        touching_player = None
+        touching_distance = EventDetector.TOUCH_DISTANCE
+        ball_height = heights.get(constants.FRAME_BALL, 0)
+        for player_key, player_position in extracted_frame[constants.FRAME_PLAYER].items():
+            distance = np.sqrt((player_position[constants.FRAME_X] - ball_position[constants.FRAME_X]) ** 2
+                               + (player_position[constants.FRAME_Y] - ball_position[constants.FRAME_Y]) ** 2
+                               + (heights.get(player_key, 0) - ball_height) ** 2)
+            if distance <= touching_distance:
+                touching_player = player_key
+                touching_distance = distance
+
+        if touching_player is not None and touching_player != self.touching_player:
+            team = self.player_teams.get(touching_player, EventTable.NO_TEAM)
+            self.events.add_event(frame_time, EventTable.TOUCH, int(touching_player), team)
+            if team != self.possession_team:
+                self.possession_team = team
+                self.events.add_event(frame_time, EventTable.POSSESSION_CHANGE, int(touching_player), team)
+        self.touching_player = touching_player
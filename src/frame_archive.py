@@ -0,0 +1,282 @@
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import src.constants as constants
+from src.event_table import EventTable
+from src.frame_table import FrameTable
+
+
+class FrameArchive:
+    """
+    A compact file format for extracted replays, which only holds what the frame table holds (the frame times, the
+    ball and player positions, their validity and ages, and the game events), so a large corpus of replays can be
+    kept without the raw json.
+
+    The values are quantized to fixed-point integers (the times to ARCHIVE_TIME_SCALE, the positions to
+    ARCHIVE_POSITION_SCALE) and every column is delta-encoded, so the slowly changing columns become runs of small
+    numbers; the frames are grouped in blocks of ARCHIVE_BLOCK_FRAMES frames, which are compressed separately. An
+    index of the blocks (their first frame, their time range and their position in the file) is written at the end
+    of the file, so any time range can be decoded without reading the other blocks.
+
+    The ages are stored as the times of the positions' updates, so the decoded ages are exactly the decoded frame
+    times minus the decoded update times, as when the frames are extracted. The layout of the file:
+        - header: magic, format version, player count, block size, frame count;
+        - the players' information, as json;
+        - the game events (times, types, players and teams);
+        - the compressed blocks;
+        - the block index, and a footer holding the index's position.
+    """
+
+    MAGIC = b"RLFA"
+    FORMAT_VERSION = 1
+
+    HEADER = struct.Struct("<4sHHIQ")
+    LENGTH = struct.Struct("<I")
+    FOOTER = struct.Struct("<QI4s")
+    BLOCK_INDEX_DTYPE = np.dtype([("first_frame", "<u8"), ("frame_count", "<u4"), ("start_time", "<f8"),
+                                  ("end_time", "<f8"), ("offset", "<u8"), ("size", "<u4")])
+
+    def __init__(self, file_name: str):
+        """
+        Reads the archive's header, players' information, events and block index; the blocks are only read when
+        their frames are decoded.
+        """
+        self.file_name = file_name
+        with open(file_name, "rb") as f:
+            magic, version, self.player_count, self.block_frames, self.frame_count = \
+                FrameArchive.HEADER.unpack(f.read(FrameArchive.HEADER.size))
+            if magic != FrameArchive.MAGIC:
+                raise ValueError(file_name + " is not a frame archive")
+            if version != FrameArchive.FORMAT_VERSION:
+                raise ValueError(file_name + " has the unsupported archive version " + str(version))
+            self.player_info = json.loads(f.read(FrameArchive.read_length(f)).decode())
+            self.events = FrameArchive.read_events(f)
+
+            f.seek(-FrameArchive.FOOTER.size, os.SEEK_END)
+            index_offset, block_count, magic = FrameArchive.FOOTER.unpack(f.read(FrameArchive.FOOTER.size))
+            if magic != FrameArchive.MAGIC:
+                raise ValueError(file_name + " is truncated")
+            f.seek(index_offset)
+            self.block_index = np.frombuffer(f.read(block_count * FrameArchive.BLOCK_INDEX_DTYPE.itemsize),
+                                             dtype=FrameArchive.BLOCK_INDEX_DTYPE)
+
+    @staticmethod
+    def read_length(f) -> int:
+        return FrameArchive.LENGTH.unpack(f.read(FrameArchive.LENGTH.size))[0]
+
+    @staticmethod
+    def read_events(f) -> EventTable:
+        event_count = FrameArchive.read_length(f)
+        times = np.frombuffer(f.read(event_count * 8), dtype="<i8") / constants.ARCHIVE_TIME_SCALE
+        types, players, teams = np.frombuffer(f.read(event_count * 3), dtype=np.int8).reshape(3, event_count)
+        events = EventTable()
+        for event_time, event_type, player, team in zip(times.tolist(), types.tolist(), players.tolist(),
+                                                        teams.tolist()):
+            events.add_event(event_time, event_type, player, team)
+        return events
+
+    def __len__(self):
+        return self.frame_count
+
+    @property
+    def block_count(self) -> int:
+        return len(self.block_index)
+
+    def find_blocks(self, start_time: float = None, end_time: float = None) -> range:
+        """
+        Returns the indices of the blocks holding frames between the given times (both included; None for the
+        start / the end of the replay).
+        """
+        first_block = 0
+        last_block = self.block_count
+        if start_time is not None:
+            first_block = int(np.searchsorted(self.block_index["end_time"], start_time, side="left"))
+        if end_time is not None:
+            last_block = int(np.searchsorted(self.block_index["start_time"], end_time, side="right"))
+        return range(first_block, max(first_block, last_block))
+
+    def iterate_blocks(self, start_time: float = None, end_time: float = None):
+        """
+        Decodes the blocks holding frames between the given times one at a time, and yields their columns (see
+        decode_block), without the frames outside the time range.
+        """
+        with open(self.file_name, "rb") as f:
+            for block in self.find_blocks(start_time, end_time):
+                f.seek(int(self.block_index["offset"][block]))
+                columns = self.decode_block(f.read(int(self.block_index["size"][block])),
+                                            int(self.block_index["frame_count"][block]))
+                in_range = np.ones(len(columns["time"]), dtype=bool)
+                if start_time is not None:
+                    in_range &= columns["time"] >= start_time
+                if end_time is not None:
+                    in_range &= columns["time"] <= end_time
+                if not in_range.all():
+                    columns = {column_name: column[in_range] for column_name, column in columns.items()}
+                yield columns
+
+    def read_frame_table(self, start_time: float = None, end_time: float = None) -> FrameTable:
+        """
+        Returns the frames between the given times (both included; None for the start / the end of the replay) as
+        a frame table, along with the replay's game events; only the blocks holding these frames are decoded.
+        """
+        block_columns = list(self.iterate_blocks(start_time, end_time))
+        if block_columns:
+            frame_table = FrameTable.from_columns(
+                {column_name: np.concatenate([columns[column_name] for columns in block_columns])
+                 for column_name in FrameTable.COLUMNS})
+        else:
+            frame_table = FrameTable(self.player_count)
+        frame_table.events = self.events
+        return frame_table
+
+    def iterate_frames(self, start_time: float = None, end_time: float = None):
+        """
+        Yields the frames between the given times one at a time, in the dict format produced by
+        replay_parser.extract_frames (along with the values derived from the game events, see FrameTable.frame);
+        only one block is decoded at a time.
+        """
+        for columns in self.iterate_blocks(start_time, end_time):
+            frame_table = FrameTable.from_columns(columns)
+            frame_table.events = self.events
+            for frame_index in range(len(frame_table)):
+                yield frame_table.frame(frame_index)
+
+    def decode_block(self, data: bytes, frame_count: int) -> dict:
+        """
+        Decompresses a block and returns its frame table columns (see FrameTable.COLUMNS).
+        """
+        data = zlib.decompress(data)
+        cell_count = frame_count * self.player_count
+        offset = 0
+
+        def read_column(dtype: str, count: int) -> np.ndarray:
+            nonlocal offset
+            column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += column.nbytes
+            return column
+
+        def read_deltas(dtype: str, shape: tuple) -> np.ndarray:
+            # the player columns are stored player by player, so the deltas are along the frames of every player
+            return np.cumsum(read_column(dtype, int(np.prod(shape))).reshape(shape), axis=-1)
+
+        time = read_deltas("<i8", (frame_count,))
+        ball_x = read_deltas("<i4", (frame_count,))
+        ball_y = read_deltas("<i4", (frame_count,))
+        ball_update = read_deltas("<i8", (frame_count,))
+        player_x = read_deltas("<i4", (self.player_count, frame_count)).T
+        player_y = read_deltas("<i4", (self.player_count, frame_count)).T
+        player_update = read_deltas("<i8", (self.player_count, frame_count)).T
+        ball_valid = np.unpackbits(read_column("u1", (frame_count + 7) // 8), count=frame_count).astype(bool)
+        player_valid = np.unpackbits(read_column("u1", (cell_count + 7) // 8), count=cell_count).astype(bool)
+        player_valid = player_valid.reshape(self.player_count, frame_count).T
+
+        times = time / constants.ARCHIVE_TIME_SCALE
+        return {
+            "time": times,
+            "ball_x": np.where(ball_valid, ball_x / constants.ARCHIVE_POSITION_SCALE, 0),
+            "ball_y": np.where(ball_valid, ball_y / constants.ARCHIVE_POSITION_SCALE, 0),
+            "ball_valid": ball_valid,
+            "ball_age": np.where(ball_valid, times - ball_update / constants.ARCHIVE_TIME_SCALE, 0),
+            "player_x": np.where(player_valid, player_x / constants.ARCHIVE_POSITION_SCALE, 0),
+            "player_y": np.where(player_valid, player_y / constants.ARCHIVE_POSITION_SCALE, 0),
+            "player_valid": player_valid,
+            "player_age": np.where(player_valid, times[:, None] - player_update / constants.ARCHIVE_TIME_SCALE, 0),
+        }
+
+
+def quantize(values: np.ndarray, scale: int, dtype: str) -> np.ndarray:
+    return np.round(values * scale).astype(dtype)
+
+
+def delta_encode(values: np.ndarray) -> bytes:
+    # the first value is kept as is (the difference from 0), so every block can be decoded on its own
+    return np.diff(values, axis=-1, prepend=np.zeros(values.shape[:-1] + (1,), dtype=values.dtype)).tobytes()
+
+
+def encode_block(frame_table: FrameTable, start: int, end: int) -> bytes:
+    """
+    Quantizes, delta-encodes and compresses the frames from start to end (excluded) of the frame table.
+    """
+    time = quantize(frame_table.time[start:end], constants.ARCHIVE_TIME_SCALE, "<i8")
+    ball_valid = frame_table.ball_valid[start:end]
+    player_valid = frame_table.player_valid[start:end].T
+    # the invalid cells are stored as 0 (including their update times), so they don't break the runs of deltas
+    ball_update = np.where(ball_valid, quantize(frame_table.time[start:end] - frame_table.ball_age[start:end],
+                                                constants.ARCHIVE_TIME_SCALE, "<i8"), 0)
+    player_update = np.where(player_valid,
+                             quantize(frame_table.time[start:end, None] - frame_table.player_age[start:end],
+                                      constants.ARCHIVE_TIME_SCALE, "<i8").T, 0)
+
+    parts = [
+        delta_encode(time),
+        delta_encode(np.where(ball_valid, quantize(frame_table.ball_x[start:end], constants.ARCHIVE_POSITION_SCALE,
+                                                   "<i4"), 0)),
+        delta_encode(np.where(ball_valid, quantize(frame_table.ball_y[start:end], constants.ARCHIVE_POSITION_SCALE,
+                                                   "<i4"), 0)),
+        delta_encode(ball_update),
+        delta_encode(np.where(player_valid, quantize(frame_table.player_x[start:end].T,
+                                                     constants.ARCHIVE_POSITION_SCALE, "<i4"), 0)),
+        delta_encode(np.where(player_valid, quantize(frame_table.player_y[start:end].T,
+                                                     constants.ARCHIVE_POSITION_SCALE, "<i4"), 0)),
+        delta_encode(player_update),
+        np.packbits(ball_valid).tobytes(),
+        np.packbits(player_valid.ravel()).tobytes(),
+    ]
+    return zlib.compress(b"".join(parts), constants.ARCHIVE_COMPRESSION_LEVEL)
+
+
+def encode_events(events: EventTable) -> bytes:
+    event_count = len(events.times) if events is not None else 0
+    if event_count == 0:
+        return FrameArchive.LENGTH.pack(0)
+    times = quantize(np.array(events.times[:event_count], dtype=np.float64), constants.ARCHIVE_TIME_SCALE, "<i8")
+    fields = np.array([events.types[:event_count], events.players[:event_count], events.teams[:event_count]],
+                      dtype=np.int8)
+    return FrameArchive.LENGTH.pack(event_count) + times.tobytes() + fields.tobytes()
+
+
+def write_archive(file_name: str, player_info: list, frame_table: FrameTable,
+                  block_frames: int = constants.ARCHIVE_BLOCK_FRAMES):
+    """
+    Writes an extracted replay (its players' information and its frame table, with its game events) as a frame
+    archive (see FrameArchive). The archive is written to a temporary file first, so a half written archive is
+    never read.
+    """
+    temporary_file_name = file_name + ".tmp"
+    # the time range of every block is the one of its decoded (quantized) times
+    block_times = quantize(frame_table.time, constants.ARCHIVE_TIME_SCALE, "<i8") / constants.ARCHIVE_TIME_SCALE
+    block_index = np.zeros((len(frame_table) + block_frames - 1) // block_frames,
+                           dtype=FrameArchive.BLOCK_INDEX_DTYPE)
+    with open(temporary_file_name, "wb") as f:
+        f.write(FrameArchive.HEADER.pack(FrameArchive.MAGIC, FrameArchive.FORMAT_VERSION, frame_table.player_count,
+                                         block_frames, len(frame_table)))
+        player_info_json = json.dumps(player_info).encode()
+        f.write(FrameArchive.LENGTH.pack(len(player_info_json)) + player_info_json)
+        f.write(encode_events(frame_table.events))
+
+        for block, start in enumerate(range(0, len(frame_table), block_frames)):
+            end = min(start + block_frames, len(frame_table))
+            data = encode_block(frame_table, start, end)
+            block_index[block] = (start, end - start, block_times[start], block_times[end - 1], f.tell(), len(data))
+            f.write(data)
+
+        index_offset = f.tell()
+        f.write(block_index.tobytes())
+        f.write(FrameArchive.FOOTER.pack(index_offset, len(block_index), FrameArchive.MAGIC))
+    os.replace(temporary_file_name, file_name)
+
+
+def is_archive_file(file_name: str) -> bool:
+    return file_name.endswith(constants.ARCHIVE_EXTENSION)
+
+
+def load_archive(file_name: str) -> (list, FrameTable):
+    """
+    Returns the players' information and the whole frame table of a frame archive, like replay_parser.read_replay.
+    """
+    frame_archive = FrameArchive(file_name)
+    return frame_archive.player_info, frame_archive.read_frame_table()
@@ -0,0 +1,305 @@
+import os
+
+import numpy as np
+
+import src.constants as constants
+
+
+class FrameTable:
+    """
+    Columnar storage for the extracted frames of a replay.
+
+    Instead of one dict per frame, every value is stored in a contiguous array:
+        - time: the frame time offsets;
+        - ball_x, ball_y: the ball position on each axis;
+        - ball_valid: True for the frames in which the ball position is known;
+        - ball_age: the seconds since the ball position was last updated (0 if it was updated in the frame);
+        - player_x, player_y: the players' positions, one column per player (player N is column N - 1);
+        - player_valid: True for the frames in which a player's position is known;
+        - player_age: the seconds since each player's position was last updated.
+
+    The values of invalid cells are meaningless (0) and must be ignored.
+
+    The game events detected while extracting the frames (see event_table.EventTable), if any, are kept in the
+    events attribute; their values at every frame are exposed like the other columns (see operand_column).
+    """
+
+    INITIAL_CAPACITY = 1024
+    COLUMNS = ("time", "ball_x", "ball_y", "ball_valid", "ball_age", "player_x", "player_y", "player_valid",
+               "player_age")
+
+    # when resampling, positions are not interpolated between two updates further apart than this (e.g. while
+    # the ball is respawned after a goal); the older position is held instead
+    RESAMPLE_MAX_INTERPOLATION_GAP = 1.0
+
+    def __init__(self, player_count: int, capacity: int = INITIAL_CAPACITY):
+        self.player_count = player_count
+        self.size = 0
+        self.events = None
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity: int):
+        for column_name, new_column in self._new_columns(capacity).items():
+            setattr(self, "_" + column_name, new_column)
+
+    def _new_columns(self, capacity: int) -> dict:
+        columns = {}
+        for column_name in FrameTable.COLUMNS:
+            dtype = bool if column_name.endswith("_valid") else np.float64
+            if column_name.startswith("player_"):
+                columns[column_name] = np.zeros((capacity, self.player_count), dtype=dtype)
+            else:
+                columns[column_name] = np.zeros(capacity, dtype=dtype)
+        return columns
+
+    def _grow(self):
+        # the new columns are filled before replacing the old ones, so the frames appended so far can be read at
+        # any time (e.g. while the frames are appended by another thread, see ReplayLoader)
+        new_columns = self._new_columns(len(self._time) * 2)
+        for column_name, new_column in new_columns.items():
+            new_column[:self.size] = getattr(self, "_" + column_name)[:self.size]
+        for column_name, new_column in new_columns.items():
+            setattr(self, "_" + column_name, new_column)
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        """
+        Builds a frame table around existing columns (e.g. memory mapped ones), without copying them.
+        """
+        frame_table = cls.__new__(cls)
+        frame_table.player_count = columns["player_x"].shape[1]
+        frame_table.size = len(columns["time"])
+        frame_table.events = None
+        for column_name in FrameTable.COLUMNS:
+            setattr(frame_table, "_" + column_name, columns[column_name])
+        return frame_table
+
+    def snapshot(self):
+        """
+        Returns a frame table over the frames appended so far, which doesn't grow with this one (e.g. to evaluate
+        the frames extracted so far while the others are still being appended, see ReplayLoader); the columns
+        are not copied.
+        """
+        size = self.size
+        snapshot_table = FrameTable.from_columns({column_name: getattr(self, "_" + column_name)[:size]
+                                                  for column_name in FrameTable.COLUMNS})
+        snapshot_table.events = self.events
+        return snapshot_table
+
+    def save(self, directory: str):
+        """
+        Saves every column in its own .npy file in the given directory, so they can be memory mapped when loaded.
+        """
+        for column_name in FrameTable.COLUMNS:
+            np.save(os.path.join(directory, column_name + ".npy"), getattr(self, column_name))
+
+    @classmethod
+    def load(cls, directory: str, memory_map: bool = True):
+        mmap_mode = "r" if memory_map else None
+        columns = {}
+        for column_name in FrameTable.COLUMNS:
+            columns[column_name] = np.load(os.path.join(directory, column_name + ".npy"), mmap_mode=mmap_mode)
+        return cls.from_columns(columns)
+
+    @classmethod
+    def from_frames(cls, extracted_frames, player_count: int):
+        """
+        Builds a frame table from extracted frames in the dict format (see replay_parser.extract_frames).
+        """
+        frame_table = cls(player_count)
+        for extracted_frame in extracted_frames:
+            frame_table.append_frame(extracted_frame)
+        return frame_table
+
+    def append_frame(self, extracted_frame: dict):
+        # the frame's values are written before increasing the size, so readers never see a partial frame
+        if self.size == len(self._time):
+            self._grow()
+        index = self.size
+
+        self._time[index] = extracted_frame[constants.FRAME_TIME]
+
+        ball_position = extracted_frame.get(constants.FRAME_BALL, None)
+        if ball_position is not None:
+            self._ball_x[index] = ball_position[constants.FRAME_X]
+            self._ball_y[index] = ball_position[constants.FRAME_Y]
+            self._ball_valid[index] = True
+            self._ball_age[index] = ball_position.get(constants.FRAME_AGE, 0)
+
+        for player_key, player_position in extracted_frame[constants.FRAME_PLAYER].items():
+            column = int(player_key) - 1
+            self._player_x[index, column] = player_position[constants.FRAME_X]
+            self._player_y[index, column] = player_position[constants.FRAME_Y]
+            self._player_valid[index, column] = True
+            self._player_age[index, column] = player_position.get(constants.FRAME_AGE, 0)
+
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    # column accessors, only covering the frames stored so far
+    @property
+    def time(self) -> np.ndarray:
+        return self._time[:self.size]
+
+    @property
+    def ball_x(self) -> np.ndarray:
+        return self._ball_x[:self.size]
+
+    @property
+    def ball_y(self) -> np.ndarray:
+        return self._ball_y[:self.size]
+
+    @property
+    def ball_valid(self) -> np.ndarray:
+        return self._ball_valid[:self.size]
+
+    @property
+    def ball_age(self) -> np.ndarray:
+        return self._ball_age[:self.size]
+
+    @property
+    def player_x(self) -> np.ndarray:
+        return self._player_x[:self.size]
+
+    @property
+    def player_y(self) -> np.ndarray:
+        return self._player_y[:self.size]
+
+    @property
+    def player_valid(self) -> np.ndarray:
+        return self._player_valid[:self.size]
+
+    @property
+    def player_age(self) -> np.ndarray:
+        return self._player_age[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column_name).nbytes for column_name in FrameTable.COLUMNS)
+
+    def operand_column(self, frame_path: tuple) -> (np.ndarray, np.ndarray):
+        """
+        Returns the values and the validity mask of the column found at the given path in the dict format of
+        a frame, e.g. (ball, x), (player, "3", y) or (events, since_kickoff).
+        """
+        if frame_path[0] == constants.FRAME_EVENTS:
+            if self.events is None:
+                return np.zeros(self.size), np.zeros(self.size, dtype=bool)
+            return self.events.frame_column(frame_path[1], self.time)
+        if frame_path[0] == constants.FRAME_BALL:
+            if frame_path[1] == constants.FRAME_X:
+                return self.ball_x, self.ball_valid
+            if frame_path[1] == constants.FRAME_AGE:
+                return self.ball_age, self.ball_valid
+            return self.ball_y, self.ball_valid
+        column = int(frame_path[1]) - 1
+        if frame_path[2] == constants.FRAME_X:
+            return self.player_x[:, column], self.player_valid[:, column]
+        if frame_path[2] == constants.FRAME_AGE:
+            return self.player_age[:, column], self.player_valid[:, column]
+        return self.player_y[:, column], self.player_valid[:, column]
+
+    @staticmethod
+    def resample_column(times: np.ndarray, new_times: np.ndarray, x: np.ndarray, y: np.ndarray,
+                        valid: np.ndarray, age: np.ndarray) -> tuple:
+        """
+        Resamples the position of one actor at the new times, interpolating linearly between its updates (the
+        frames in which its age is 0); returns the new x, y, valid and age columns.
+        """
+        updated = valid & (age == 0)
+        update_times = times[updated]
+        if len(update_times) == 0:
+            zeros = np.zeros(len(new_times))
+            return zeros, zeros, np.zeros(len(new_times), dtype=bool), zeros
+
+        # the last update at or before every new time
+        previous_updates = np.maximum(np.searchsorted(update_times, new_times, side="right") - 1, 0)
+        next_updates = np.minimum(previous_updates + 1, len(update_times) - 1)
+        hold = update_times[next_updates] - update_times[previous_updates] > FrameTable.RESAMPLE_MAX_INTERPOLATION_GAP
+
+        new_columns = []
+        for values in (x[updated], y[updated]):
+            new_values = np.interp(new_times, update_times, values)
+            new_values[hold] = values[previous_updates[hold]]
+            new_columns.append(new_values)
+        new_valid = new_times >= update_times[0]
+        new_age = np.where(new_valid, new_times - update_times[previous_updates], 0)
+        return new_columns[0], new_columns[1], new_valid, new_age
+
+    def resample(self, tick_rate: float):
+        """
+        Returns a new frame table with the frames at a fixed rate (tick_rate frames per second), from the first
+        frame's time to the last one's; the positions are interpolated linearly between the actors' updates.
+        """
+        times = self.time
+        tick_count = int(np.floor((times[-1] - times[0]) * tick_rate)) + 1 if self.size else 0
+        new_times = times[0] + np.arange(tick_count) / tick_rate if self.size else np.zeros(0)
+
+        columns = {"time": new_times}
+        columns["ball_x"], columns["ball_y"], columns["ball_valid"], columns["ball_age"] = \
+            FrameTable.resample_column(times, new_times, self.ball_x, self.ball_y, self.ball_valid, self.ball_age)
+        for column_name in ("player_x", "player_y", "player_valid", "player_age"):
+            columns[column_name] = np.zeros((tick_count, self.player_count),
+                                            dtype=bool if column_name == "player_valid" else np.float64)
+        for column in range(self.player_count):
+            columns["player_x"][:, column], columns["player_y"][:, column], columns["player_valid"][:, column], \
+                columns["player_age"][:, column] = \
+                FrameTable.resample_column(times, new_times, self.player_x[:, column], self.player_y[:, column],
+                                           self.player_valid[:, column], self.player_age[:, column])
+        resampled_table = FrameTable.from_columns(columns)
+        resampled_table.events = self.events
+        return resampled_table
+
+    def index_at_time(self, frame_time: float) -> int:
+        """
+        Returns the index of the last frame at or before the given time (binary searching the sorted frame times),
+        or -1 if the time is before the first frame.
+        """
+        return int(np.searchsorted(self.time, frame_time, side="right")) - 1
+
+    # row accessors, returning the values of a single frame in the dict format used by the UI and the queries
+    def frame_time(self, index: int) -> float:
+        return float(self._time[index])
+
+    def ball_position(self, index: int):
+        """
+        Returns the ball position in the given frame as {x, y}, or None if it is unknown.
+        """
+        if not self._ball_valid[index]:
+            return None
+        return {
+            constants.FRAME_X: float(self._ball_x[index]),
+            constants.FRAME_Y: float(self._ball_y[index]),
+            constants.FRAME_AGE: float(self._ball_age[index]),
+        }
+
+    def player_positions(self, index: int) -> dict:
+        """
+        Returns the known player positions in the given frame, as {player number (string): {x, y}}.
+        """
+        player_positions = {}
+        for column in np.flatnonzero(self._player_valid[index]):
+            player_positions[str(column + 1)] = {
+                constants.FRAME_X: float(self._player_x[index, column]),
+                constants.FRAME_Y: float(self._player_y[index, column]),
+                constants.FRAME_AGE: float(self._player_age[index, column]),
+            }
+        return player_positions
+
+    def frame(self, index: int) -> dict:
+        """
+        Returns the given frame in the same dict format produced by replay_parser.extract_frames, along with the
+        values derived from the game events at that time (if the events are known).
+        """
+        extracted_frame = {
+            constants.FRAME_TIME: self.frame_time(index),
+            constants.FRAME_PLAYER: self.player_positions(index),
+        }
+        ball_position = self.ball_position(index)
+        if ball_position is not None:
+            extracted_frame[constants.FRAME_BALL] = ball_position
+        if self.events is not None:
+            extracted_frame[constants.FRAME_EVENTS] = self.events.frame_values(extracted_frame[constants.FRAME_TIME])
+        return extracted_frame
@@ -0,0 +1,261 @@
+"""
+Live ingestion: runs a file of queries (in the same format used by the UI and the batch analysis) against replay
+frames streamed as newline-delimited json, evaluating them as the frames arrive, e.g. while a match is played or
+parsed. Every line holds a replay frame in the replay json format, and the first frame of a stream must hold the
+players' information, like the first frame of a replay file (see replay_streamer, which streams a replay file
+this way).
+
+The frames are read from a TCP socket, a Unix socket (one stream per connection) or the standard input (which must
+be a pipe). Every stream is handled by its own pipeline of asyncio tasks, connected by bounded queues:
+    reader -> (replay frames) -> evaluator -> (printed results) -> writer
+When a stage falls behind, the queue in front of it fills up and the previous stage waits as well, all the way back
+to the reader, which stops reading from the stream (so the sender is slowed down by the socket's flow control). The
+memory used by a stream is bounded, however slow the output is.
+
+Usage examples:
+    python -m src.live_ingestion queries.txt --tcp 127.0.0.1:9000 --output events.jsonl
+    python -m src.replay_streamer replay.json --speed 0 | python -m src.live_ingestion queries.txt --stdin
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.batch_analyzer import EventWriter, OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_JSONL, parse_queries
+from src.event_table import EventDetector
+from src.query_manager import QueryManager
+from src.query_parse_exception import QueryParseException
+from src.query_sink import ListQuerySink
+
+# put in the queues after the last frame / result of a stream
+END_OF_STREAM = None
+
+
+class LiveStream:
+    """
+    Evaluates the queries on a single stream of replay frames. The frames go through the same extraction as the
+    replay files (see replay_parser.FrameExtractor), including the detection of the game events, and the extracted
+    frames are passed to a QueryManager, with its own freshly parsed queries (as the queries keep their evaluation
+    state).
+    """
+
+    def __init__(self, name: str, queries_text: str, event_writer: EventWriter, write_lock: asyncio.Lock,
+                 frame_queue_size: int = constants.LIVE_FRAME_QUEUE_SIZE,
+                 result_queue_size: int = constants.LIVE_RESULT_QUEUE_SIZE):
+        self.name = name
+        self.queries_text = queries_text
+        self.event_writer = event_writer
+        # the event writer can be shared by multiple streams, which must not write at the same time
+        self.write_lock = write_lock
+
+        self.frame_queue = asyncio.Queue(frame_queue_size)
+        self.result_queue = asyncio.Queue(result_queue_size)
+        self.frame_count = 0
+        self.result_count = 0
+
+    async def run(self, reader: asyncio.StreamReader):
+        tasks = [asyncio.ensure_future(self.read_frames(reader)),
+                 asyncio.ensure_future(self.evaluate_frames()),
+                 asyncio.ensure_future(self.write_results())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # if a stage failed (e.g. a malformed frame), the others would wait for it forever
+            for task in tasks:
+                task.cancel()
+
+    async def read_frames(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line:
+                await self.frame_queue.put(json.loads(line))
+        await self.frame_queue.put(END_OF_STREAM)
+
+    async def evaluate_frames(self):
+        frame = await self.frame_queue.get()
+        if frame is END_OF_STREAM:
+            await self.result_queue.put(END_OF_STREAM)
+            return
+
+        player_info = replay_parser.extract_player_info(frame)
+        event_detector = EventDetector(player_info)
+        frame_extractor = replay_parser.FrameExtractor(player_info, event_detector=event_detector)
+        query_sink = ListQuerySink()
+        query_manager = QueryManager(query_sink, player_info=player_info)
+        for query in parse_queries(self.queries_text):
+            query_manager.add_query(query)
+
+        while frame is not END_OF_STREAM:
+            extracted_frame = frame_extractor.extract_frame(frame)
+            extracted_frame[constants.FRAME_EVENTS] = \
+                event_detector.events.frame_values(extracted_frame[constants.FRAME_TIME])
+            query_manager.add_message(extracted_frame)
+            self.frame_count += 1
+
+            for result in query_sink.results:
+                await self.result_queue.put(result)
+            query_sink.clear()
+            frame = await self.frame_queue.get()
+        await self.result_queue.put(END_OF_STREAM)
+
+    async def write_results(self):
+        stream_ended = False
+        while not stream_ended:
+            # write all the results which are waiting at once
+            results = [await self.result_queue.get()]
+            while not self.result_queue.empty():
+                results.append(self.result_queue.get_nowait())
+            if results[-1] is END_OF_STREAM:
+                stream_ended = True
+                results.pop()
+
+            if results:
+                # the output can be slow (e.g. a pipe read by a slow consumer), so it is written from another
+                # thread, while the stream keeps being read and evaluated (until the queues are full)
+                async with self.write_lock:
+                    await asyncio.to_thread(self.event_writer.write_events, self.name, results)
+                self.result_count += len(results)
+
+
+class LiveIngestion:
+    """
+    Accepts the streams of replay frames, from a socket or from the standard input, and evaluates the queries on
+    each of them (see LiveStream); the results of all the streams are written by the same event writer, labeled
+    with the name of their stream.
+    """
+
+    def __init__(self, queries_text: str, event_writer: EventWriter, show_progress: bool = True,
+                 stream_limit: int = None):
+        self.queries_text = queries_text
+        self.event_writer = event_writer
+        self.show_progress = show_progress
+        # the number of streams after which the ingestion stops (None to keep accepting streams)
+        self.stream_limit = stream_limit
+
+        self.write_lock = None
+        self.connection_count = 0
+        self.stream_count = 0
+        self.failed_streams = 0
+        self.finished = None
+
+    def report(self, text: str):
+        if self.show_progress:
+            print(text, file=sys.stderr)
+
+    async def ingest_stream(self, name: str, reader: asyncio.StreamReader):
+        live_stream = LiveStream(name, self.queries_text, self.event_writer, self.write_lock)
+        self.report(name + " - connected")
+        try:
+            await live_stream.run(reader)
+            status = "done"
+        except Exception as exception:
+            self.failed_streams += 1
+            status = "failed: " + repr(exception)
+        self.report(name + " - " + status + " (" + str(live_stream.frame_count) + " frames, "
+                    + str(live_stream.result_count) + " events)")
+
+        self.stream_count += 1
+        if self.stream_limit is not None and self.stream_count >= self.stream_limit:
+            self.finished.set()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connection_count += 1
+        peer_name = writer.get_extra_info("peername")
+        if isinstance(peer_name, tuple):
+            name = peer_name[0] + ":" + str(peer_name[1])
+        else:
+            name = "connection " + str(self.connection_count)
+        try:
+            await self.ingest_stream(name, reader)
+        finally:
+            writer.close()
+
+    def start(self):
+        # the asyncio primitives must be created in the event loop which uses them
+        self.write_lock = asyncio.Lock()
+        self.finished = asyncio.Event()
+
+    async def serve(self, server):
+        async with server:
+            if self.stream_limit is None:
+                await server.serve_forever()
+            else:
+                await self.finished.wait()
+
+    async def serve_tcp(self, host: str, port: int):
+        self.start()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=constants.LIVE_MAX_LINE_SIZE)
+        self.report("Listening on " + host + ":" + str(port))
+        await self.serve(server)
+
+    async def serve_unix(self, path: str):
+        self.start()
+        server = await asyncio.start_unix_server(self.handle_connection, path, limit=constants.LIVE_MAX_LINE_SIZE)
+        self.report("Listening on " + path)
+        await self.serve(server)
+
+    async def ingest_stdin(self):
+        self.start()
+        reader = asyncio.StreamReader(limit=constants.LIVE_MAX_LINE_SIZE)
+        await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        await self.ingest_stream("stdin", reader)
+
+
+def parse_address(address: str) -> (str, int):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Run queries against replay frames streamed as "
+                                                          "newline-delimited json.")
+    argument_parser.add_argument("query_file", help="file with the queries, separated by a blank line")
+    source = argument_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tcp", metavar="HOST:PORT", help="accept the streams on this TCP address")
+    source.add_argument("--unix", metavar="PATH", help="accept the streams on this Unix socket")
+    source.add_argument("--stdin", action="store_true", help="read a single stream from the standard input")
+    argument_parser.add_argument("-o", "--output", default="-", help="output file (default: standard output)")
+    argument_parser.add_argument("-f", "--format", choices=[OUTPUT_FORMAT_JSONL, OUTPUT_FORMAT_CSV],
+                                 default=OUTPUT_FORMAT_JSONL, help="output format (default: jsonl)")
+    argument_parser.add_argument("--once", action="store_true",
+                                 help="stop after the first stream (default: keep accepting streams)")
+    argument_parser.add_argument("-q", "--quiet", action="store_true", help="don't report the streams")
+    arguments = argument_parser.parse_args(arguments)
+
+    with open(arguments.query_file, "r") as f:
+        queries_text = f.read()
+    try:
+        # parse the queries once here, so that format errors are reported before any stream is accepted
+        parse_queries(queries_text)
+    except QueryParseException as exception:
+        print("Query format error: " + str(exception), file=sys.stderr)
+        return 2
+
+    if arguments.output == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(arguments.output, "w", newline="")
+    live_ingestion = LiveIngestion(queries_text, EventWriter(output_file, arguments.format), not arguments.quiet,
+                                   1 if arguments.once else None)
+    try:
+        if arguments.tcp is not None:
+            asyncio.run(live_ingestion.serve_tcp(*parse_address(arguments.tcp)))
+        elif arguments.unix is not None:
+            asyncio.run(live_ingestion.serve_unix(arguments.unix))
+        else:
+            asyncio.run(live_ingestion.ingest_stdin())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    return 1 if live_ingestion.failed_streams else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
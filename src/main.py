@@ -1,15 +1,35 @@
-from threading import Thread
-from tkinter import Tk, Canvas, Frame, BOTH, Label, Button, INSERT
+from tkinter import Tk, Canvas, Frame, BOTH, Label, Button, INSERT, END, Scale, OptionMenu, Entry, StringVar, \
+    DoubleVar, HORIZONTAL, Toplevel, messagebox
 from tkinter.scrolledtext import ScrolledText
 
 import src.constants as constants
 import src.replay_parser as replay_parser
 from src.query import Query
+from src.query_sink import TkQuerySink
+from src.query_timeline import QueryTimelineCache
+from src.replay_cache import ReplayCache
+from src.replay_heatmaps import ReplayHeatmaps, load_heatmaps
+from src.replay_loader import ReplayLoader
+from src.replay_renderer import HeatmapOverlay, ReplayRenderer
 
 # This is the file that will be parsed as a replay by the application and displayed;
 # In the 'replaysJson' folder, there are a lot of replays to choose from.
 PATH_TO_JSON = "../replaysJson/example.json"
 
+# The playback speeds which can be chosen in the UI
+PLAYBACK_SPEEDS = ["0.25x", "0.5x", "1x", "2x", "4x", "8x", "16x"]
+
+# How often the profiler panel is refreshed, in milliseconds
+PROFILER_REFRESH_INTERVAL_MS = 500
+
+# How often the progress of the background frame extraction is checked, in milliseconds
+LOADING_CHECK_INTERVAL_MS = 200
+
+# The heatmap menu's choice which hides the heatmap overlay
+HEATMAP_OFF = "no heatmap"
+
+WINDOW_TITLE = "RL Replay Analyzer"
+
 
 class MainFrame(Frame):
     def __init__(self):
@@ -24,73 +44,140 @@ class MainFrame(Frame):
         self.query_tutorial = None
         self.query_input = None
         self.query_output = None
+        self.query_sink = None
         self.query_tutorial_label = None
         self.query_input_label = None
         self.query_output_label = None
+        self.speed_label = None
+        self.speed_menu = None
+        self.speed_variable = None
+        self.scrub_bar = None
+        self.scrub_variable = None
+        self.jump_label = None
+        self.jump_input = None
+        self.jump_button = None
+        self.profiler_button = None
+        self.profiler_window = None
+        self.profiler_text = None
+        self.heatmap_menu = None
+        self.heatmap_variable = None
+        self.heatmap_size_menu = None
+        self.heatmap_size_variable = None
+
+        # playback state init
+        self.playback_speed = 1
+        self.scrubbing = False
 
         # replay objects init
-        self.replay_json = replay_parser.read_replay_to_json(PATH_TO_JSON)
-        self.player_info = replay_parser.extract_player_info(self.replay_json[constants.FRAMES][0])
-        self.extracted_frames = replay_parser.extract_frames(self.replay_json, self.player_info)
-        self.ball_object = None
-        self.player_objects = []
-        self.player_text_objects = []
-        for _ in self.player_info:
-            self.player_objects.append(None)
-            self.player_text_objects.append(None)
+        # only the first frame is read here; the rest of the frames are extracted in the background, while the
+        # UI is already up (and the replay can already be played)
+        self.replay_loader = ReplayLoader(PATH_TO_JSON, ReplayCache())
+        self.player_info, self.extracted_frames = self.replay_loader.start()
+        self.renderer = None
+        self.heatmap_overlay = None
+        self.replay_player = None
+        self.profiler = None
+        # the queries' events over the replay, kept between the runs so only the edited queries are evaluated again
+        self.query_timeline_cache = QueryTimelineCache()
 
         # UI drawing
         self.init_ui()
 
     def handle_start_button(self):
-        thread = Thread(target=replay_parser.replay_extracted_frames, args=(self.extracted_frames, self))
-        thread.start()
+        # the replay is played on the Tk main loop, so no other thread ever touches the UI (the replay player is
+        # set once the replay starts)
+        replay_parser.replay_extracted_frames(self.extracted_frames, self)
+
+    def seek(self, replay_time):
+        if self.replay_player is not None and self.replay_player.running:
+            self.replay_player.seek(replay_time)
+
+    def handle_speed_change(self, speed):
+        self.playback_speed = float(speed.rstrip("x"))
+        if self.replay_player is not None and self.replay_player.running:
+            self.replay_player.set_speed(self.playback_speed)
+
+    def handle_scrub_press(self, _):
+        # don't move the scrub bar while it's being dragged
+        self.scrubbing = True
+
+    def handle_scrub_release(self, _):
+        self.scrubbing = False
+        self.seek(self.scrub_variable.get())
+
+    def handle_jump_button(self):
+        # the time can be given as seconds or as mm:ss
+        replay_time = 0
+        try:
+            for time_part in self.jump_input.get().strip().split(":"):
+                replay_time = replay_time * 60 + float(time_part)
+        except ValueError:
+            return
+        self.seek(replay_time)
+
+    def handle_heatmap_change(self, _):
+        if self.heatmap_overlay is None:
+            return
+        entity = self.heatmap_variable.get()
+        self.heatmap_overlay.show(int(self.heatmap_size_variable.get()), None if entity == HEATMAP_OFF else entity)
+
+    def check_replay_loading(self):
+        # extend the scrub bar to the frames extracted so far
+        self.scrub_bar.config(to=self.extracted_frames.frame_time(len(self.extracted_frames) - 1))
+        if not self.replay_loader.is_complete():
+            self.master.title(WINDOW_TITLE + " (loading frames: " + str(len(self.extracted_frames)) + ")")
+            self.after(LOADING_CHECK_INTERVAL_MS, self.check_replay_loading)
+            return
+        self.master.title(WINDOW_TITLE)
+
+        # the heatmaps are computed (or loaded from the replay cache) once the whole replay is loaded
+        self.heatmap_overlay = HeatmapOverlay(self.canvas, load_heatmaps(self.extracted_frames, self.player_info,
+                                                                         self.replay_loader.replay_cache,
+                                                                         self.replay_loader.replay_hash))
+        self.heatmap_menu.config(state="normal")
+        self.heatmap_size_menu.config(state="normal")
+        if self.replay_loader.error is not None:
+            messagebox.showwarning("Replay loading error",
+                                   "Only the first " + str(len(self.extracted_frames)) + " frames could be loaded: "
+                                   + str(self.replay_loader.error))
+
+    def handle_profiler_button(self):
+        # the profiler panel is a separate window, showing the statistics of the current (or last) run
+        if self.profiler_window is not None and self.profiler_window.winfo_exists():
+            self.profiler_window.lift()
+            return
+        self.profiler_window = Toplevel(self.master)
+        self.profiler_window.title("Query profiler")
+        self.profiler_text = ScrolledText(self.profiler_window, wrap='word', height=40, width=70)
+        self.profiler_text.pack(fill=BOTH, expand=1)
+        self.refresh_profiler()
+
+    def refresh_profiler(self):
+        if self.profiler_window is None or not self.profiler_window.winfo_exists():
+            self.profiler_window = None
+            return
+        self.profiler_text.config(state="normal")
+        self.profiler_text.delete("1.0", END)
+        if self.profiler is None:
+            self.profiler_text.insert(INSERT, "Start a replay to profile its queries.")
+        else:
+            self.profiler_text.insert(INSERT, self.profiler.format_summary())
+        self.profiler_text.config(state="disabled")
+        self.profiler_window.after(PROFILER_REFRESH_INTERVAL_MS, self.refresh_profiler)
 
     def move_ball(self, new_position):
-        if self.ball_object is not None:
-            self.canvas.delete(self.ball_object)
-        self.ball_object = self.canvas.create_oval(new_position[constants.FRAME_Y] - 8,
-                                                   new_position[constants.FRAME_X] - 8,
-                                                   new_position[constants.FRAME_Y] + 8,
-                                                   new_position[constants.FRAME_X] + 8,
-                                                   outline='red', fill='darkGreen')
+        self.renderer.move_ball(new_position)
 
     def move_players(self, player_positions):
-        for i in range(0, len(self.player_objects)):
-            # player index
-            player_index = str(i + 1)
-
-            # move to the next player if this player is not found in this frame
-            if player_positions.get(player_index, None) is None:
-                continue
-
-            # delete the current player object if it exists, since we create a new one
-            if self.player_objects[i] is not None:
-                self.canvas.delete(self.player_objects[i])
-            if self.player_text_objects[i] is not None:
-                self.canvas.delete(self.player_text_objects[i])
-
-            # player color
-            if self.player_info[i][constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1:
-                player_fill = "orange"
-            else:
-                player_fill = "blue"
-
-            # player position
-            player_position = replay_parser.position_to_screen_coord(player_positions[player_index])
-
-            # draw the player rectangle
-            self.player_objects[i] = self.canvas.create_rectangle(player_position[constants.FRAME_Y] - 16,
-                                                                  player_position[constants.FRAME_X] - 16,
-                                                                  player_position[constants.FRAME_Y] + 16,
-                                                                  player_position[constants.FRAME_X] + 16,
-                                                                  outline='red', fill=player_fill)
-
-            # draw the player text over the rectangle
-            self.player_text_objects[i] = self.canvas.create_text(player_position[constants.FRAME_Y],
-                                                                  player_position[constants.FRAME_X],
-                                                                  font=("Helvetica", 28), text=player_index,
-                                                                  fill="white")
+        self.renderer.move_players(player_positions)
+
+    def draw_frame(self, ball_position, player_positions):
+        """
+        Draws the ball (if its position is known) and the players at the given positions, in game units.
+        """
+        if ball_position is not None:
+            self.move_ball(replay_parser.position_to_screen_coord(ball_position))
+        self.move_players(player_positions)
 
     def set_time(self, new_time):
         minutes = round(new_time) // 60
@@ -104,10 +191,12 @@ class MainFrame(Frame):
             time += "0"
         time += str(seconds)
         self.timer_label['text'] = time
+        if self.scrub_variable is not None and not self.scrubbing:
+            self.scrub_variable.set(new_time)
 
     def init_ui(self):
         # canvas init
-        self.master.title("RL Replay Analyzer")
+        self.master.title(WINDOW_TITLE)
         self.pack(fill=BOTH, expand=1)
         self.canvas = Canvas(self)
 
@@ -139,12 +228,9 @@ class MainFrame(Frame):
                                      bounding_box[2] + 5, middle_y + 80,
                                      fill='blue')
 
-        # ball placing in the position from the first frame
-        ball_position = replay_parser.position_to_screen_coord(self.extracted_frames[0][constants.FRAME_BALL])
-        self.move_ball(ball_position)
-
-        # player placing in the position from the first frame
-        self.move_players(self.extracted_frames[0][constants.FRAME_PLAYER])
+        # ball and player placing in the position from the first frame
+        self.renderer = ReplayRenderer(self.canvas, self.player_info)
+        self.draw_frame(self.extracted_frames.ball_position(0), self.extracted_frames.player_positions(0))
 
         # timer
         self.timer_label = Label(self.master, text="00:00", font=("Helvetica", 30))
@@ -171,6 +257,8 @@ class MainFrame(Frame):
         self.query_output = ScrolledText(self.master, undo=True, wrap='word', height=16, width=41,
                                          state="disabled")
         self.query_output.place(x=1240, y=538, anchor='e')
+        self.query_sink = TkQuerySink(self.query_output)
+        self.query_sink.start()
 
         # start button
         self.start_button = Button(self.master, text="Start replay",
@@ -178,8 +266,54 @@ class MainFrame(Frame):
                                    font=("Helvetica", 30), width=13)
         self.start_button.place(x=1580, y=670, anchor='se')
 
+        # playback speed menu
+        self.speed_label = Label(self.master, text="Speed:")
+        self.speed_label.place(x=25, y=725, anchor='w')
+        self.speed_variable = StringVar(self.master, value="1x")
+        self.speed_menu = OptionMenu(self.master, self.speed_variable, *PLAYBACK_SPEEDS,
+                                     command=self.handle_speed_change)
+        self.speed_menu.place(x=75, y=725, anchor='w')
+
+        # scrub bar, spanning the whole replay
+        self.scrub_variable = DoubleVar(self.master, value=0)
+        self.scrub_bar = Scale(self.master, variable=self.scrub_variable, orient=HORIZONTAL, showvalue=0,
+                               from_=self.extracted_frames.frame_time(0),
+                               to=self.extracted_frames.frame_time(len(self.extracted_frames) - 1),
+                               resolution=0.1, length=620)
+        self.scrub_bar.place(x=170, y=725, anchor='w')
+        self.scrub_bar.bind("<ButtonPress-1>", self.handle_scrub_press)
+        self.scrub_bar.bind("<ButtonRelease-1>", self.handle_scrub_release)
+
+        # jump to time input
+        self.jump_label = Label(self.master, text="Jump to (mm:ss):")
+        self.jump_label.place(x=810, y=725, anchor='w')
+        self.jump_input = Entry(self.master, width=8)
+        self.jump_input.place(x=920, y=725, anchor='w')
+        self.jump_button = Button(self.master, text="Go", command=self.handle_jump_button)
+        self.jump_button.place(x=990, y=725, anchor='w')
+
+        # heatmap overlay menus (the entity and the cell size), enabled once the whole replay is loaded
+        self.heatmap_variable = StringVar(self.master, value=HEATMAP_OFF)
+        self.heatmap_menu = OptionMenu(self.master, self.heatmap_variable, HEATMAP_OFF,
+                                       *ReplayHeatmaps.entities(self.player_info), command=self.handle_heatmap_change)
+        self.heatmap_menu.config(state="disabled")
+        self.heatmap_menu.place(x=1030, y=725, anchor='w')
+        self.heatmap_size_variable = StringVar(self.master, value=str(constants.HEATMAP_CELL_SIZES[0]))
+        self.heatmap_size_menu = OptionMenu(self.master, self.heatmap_size_variable,
+                                            *[str(cell_size) for cell_size in constants.HEATMAP_CELL_SIZES],
+                                            command=self.handle_heatmap_change)
+        self.heatmap_size_menu.config(state="disabled")
+        self.heatmap_size_menu.place(x=1160, y=725, anchor='w')
+
+        # profiler panel button
+        self.profiler_button = Button(self.master, text="Profiler", command=self.handle_profiler_button)
+        self.profiler_button.place(x=1580, y=725, anchor='e')
+
         self.canvas.pack(fill=BOTH, expand=1)
 
+        # follow the background extraction of the frames
+        self.check_replay_loading()
+
 
 def main():
     # dump frames to file
@@ -193,7 +327,7 @@ def main():
 
     root = Tk()
     main_frame = MainFrame()
-    root.geometry("1600x700")
+    root.geometry("1600x760")
     root.resizable(False, False)
     root.mainloop()
 
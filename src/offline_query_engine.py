@@ -0,0 +1,116 @@
+import numpy as np
+
+from src.frame_table import FrameTable
+from src.query import Query
+
+
+def find_window_fits(query: Query, times: np.ndarray, correct: np.ndarray) -> np.ndarray:
+    """
+    Given the times and condition results of the frames which change a query's state (the ones in which the
+    condition is correct or incorrect), returns a mask of the frames at which the condition has held
+    'FOR the LAST x SECONDS/ENTRIES'.
+
+    Every incorrect frame resets the query state, so the correct frames form runs; the entries counter is the
+    position inside the run, and the first entry time is the time of the run's first frame.
+    """
+    positions = np.arange(len(correct))
+    correct_count = np.cumsum(correct)
+
+    # the correct frames counted before the last reset, and the position of the run's first frame
+    reset_count = np.maximum.accumulate(np.where(correct, 0, correct_count))
+    run_start = np.maximum.accumulate(np.where(correct, 0, positions + 1))
+    run_start = np.minimum(run_start, len(correct) - 1)
+
+    if query.time_window_type == Query.TIME_WINDOW_ENTRIES:
+        fits = correct_count - reset_count >= query.time_window_value
+    else:
+        fits = times - times[run_start] >= query.time_window_value
+    return correct & fits
+
+
+def throttle_prints(query: Query, candidate_times: np.ndarray) -> np.ndarray:
+    """
+    Applies the EVERY clause: returns the indices of the candidate times at which the message is actually
+    printed, given that it's printed AT MOST every 'delay' seconds (the first print is measured from time 0).
+    """
+    printed_indices = []
+    last_print_time = 0
+    start = 0
+    while start < len(candidate_times):
+        # binary search the next print, then fix the index so it uses the same comparison as Query.add_message
+        index = start + int(np.searchsorted(candidate_times[start:], last_print_time + query.delay))
+        while index > start and candidate_times[index - 1] - last_print_time >= query.delay:
+            index -= 1
+        while index < len(candidate_times) and candidate_times[index] - last_print_time < query.delay:
+            index += 1
+        if index == len(candidate_times):
+            break
+        printed_indices.append(index)
+        last_print_time = candidate_times[index]
+        start = index + 1
+    return np.array(printed_indices, dtype=np.int64)
+
+
+def evaluate_query_frames(query: Query, frame_table: FrameTable, condition_columns: tuple = None) \
+        -> (np.ndarray, np.ndarray):
+    """
+    Evaluates a query over all the frames of a replay at once, and returns the indices of the frames at which
+    it prints its message and the indices of the frames at which its condition cannot be evaluated.
+    The condition's correct / incomplete / error columns are computed here, unless they are given.
+    """
+    if condition_columns is None:
+        condition_columns = query.compiled_condition.evaluate_columns(frame_table)
+    correct, incomplete, errors = condition_columns
+
+    # the incomplete and the broken frames don't change the query's state
+    state_frames = np.flatnonzero(~incomplete & ~errors)
+    if len(state_frames) == 0:
+        return np.zeros(0, dtype=np.int64), np.flatnonzero(errors)
+    times = frame_table.time[state_frames]
+    fits = find_window_fits(query, times, correct[state_frames])
+
+    candidate_frames = state_frames[fits]
+    printed_frames = candidate_frames[throttle_prints(query, times[fits])]
+    return printed_frames, np.flatnonzero(errors)
+
+
+def evaluate_queries(queries: list, frame_table: FrameTable, player_info: list = None) -> list:
+    """
+    Evaluates the given queries over a whole replay without playing it, and returns the list of
+    (time, message) events the queries print, in the same order they are printed while the replay is played.
+    The players' information (if given) is bound to the queries, for the spatial operands which need the teams.
+    """
+    if player_info is not None:
+        for query in queries:
+            query.compiled_condition.bind_players(player_info)
+
+    query_frames = []
+    for query in queries:
+        printed_frames, error_frames = evaluate_query_frames(query, frame_table)
+        query_frames.append((printed_frames, error_frames, query.print_string))
+    frame_indices, messages = merge_query_frames(query_frames)
+    times = frame_table.time[frame_indices]
+    return [(float(time), message) for time, message in zip(times, messages)]
+
+
+def merge_query_frames(query_frames: list) -> (np.ndarray, list):
+    """
+    Merges the events of several queries, given as (printed frame indices, error frame indices, message) for
+    every query, into the order they are printed in while the replay is played: by frame, then by query. Returns
+    the frame indices of the merged events and their messages.
+    """
+    frame_indices = []
+    query_indices = []
+    messages = []
+    for query_index, (printed_frames, error_frames, print_string) in enumerate(query_frames):
+        for event_frames, message in ((printed_frames, print_string), (error_frames, Query.ERROR_MESSAGE)):
+            frame_indices.append(event_frames)
+            query_indices.append(np.full(len(event_frames), query_index))
+            messages.extend([message] * len(event_frames))
+
+    if not messages:
+        return np.zeros(0, dtype=np.int64), []
+    frame_indices = np.concatenate(frame_indices)
+    query_indices = np.concatenate(query_indices)
+    order = np.lexsort((query_indices, frame_indices))
+    return frame_indices[order], [messages[index] for index in order]
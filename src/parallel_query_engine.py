@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+import src.batch_analyzer as batch_analyzer
+from src.event_table import EventTable
+from src.frame_table import FrameTable
+from src.offline_query_engine import evaluate_query_frames, merge_query_frames
+
+# the shared memory of the replay each worker process currently evaluates its queries on (along with the frame
+# table built on it); the queries are parsed when the worker is started, as for the batch analysis (see
+# batch_analyzer.init_worker)
+_worker_shared_memory = None
+_worker_frame_table = None
+
+
+class SharedFrameTable:
+    """
+    A copy of a frame table's columns (and game events) in a single shared memory segment, so worker processes
+    can evaluate queries on the replay without copying its frames: a worker attaches to the segment by its name,
+    and builds a frame table whose columns are views on it (see attach).
+
+    The segment is created by the process owning the replay, which must close it (see close) once the workers
+    are done with it.
+    """
+
+    # the columns are aligned in the segment, so the views on them are as fast as regular arrays
+    COLUMN_ALIGNMENT = 64
+
+    def __init__(self, frame_table: FrameTable):
+        # column name -> (offset in the segment, shape, dtype)
+        self.layout = {}
+        size = 0
+        for column_name in FrameTable.COLUMNS:
+            column = getattr(frame_table, column_name)
+            self.layout[column_name] = (size, column.shape, column.dtype.str)
+            size += -(-column.nbytes // SharedFrameTable.COLUMN_ALIGNMENT) * SharedFrameTable.COLUMN_ALIGNMENT
+
+        self.shared_memory = SharedMemory(create=True, size=max(size, 1))
+        for column_name, column in SharedFrameTable.column_views(self.shared_memory, self.layout).items():
+            column[...] = getattr(frame_table, column_name)
+
+        events = frame_table.events
+        self.events = None
+        if events is not None:
+            event_count = len(events.times)
+            self.events = (events.times[:event_count], events.types[:event_count], events.players[:event_count],
+                           events.teams[:event_count])
+
+    @staticmethod
+    def column_views(shared_memory: SharedMemory, layout: dict) -> dict:
+        return {column_name: np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf, offset=offset)
+                for column_name, (offset, shape, dtype) in layout.items()}
+
+    def descriptor(self) -> tuple:
+        """
+        Returns what a worker needs to attach to the frame table (see attach); it is small enough to be sent with
+        every task.
+        """
+        return self.shared_memory.name, self.layout, self.events
+
+    @staticmethod
+    def attach(descriptor: tuple) -> (SharedMemory, FrameTable):
+        """
+        Attaches to the shared memory segment of a frame table, and returns the segment and a frame table whose
+        columns are (read-only) views on it.
+        """
+        name, layout, events = descriptor
+        try:
+            # the segment belongs to the process which created it, so the workers don't track it (Python 3.13+)
+            shared_memory = SharedMemory(name, track=False)
+        except TypeError:
+            shared_memory = SharedMemory(name)
+        columns = SharedFrameTable.column_views(shared_memory, layout)
+        for column in columns.values():
+            column.flags.writeable = False
+        frame_table = FrameTable.from_columns(columns)
+        if events is not None:
+            frame_table.events = EventTable()
+            for event in zip(*events):
+                frame_table.events.add_event(*event)
+        return shared_memory, frame_table
+
+    def close(self):
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+def attach_worker(descriptor: tuple) -> FrameTable:
+    """
+    Returns the frame table shared with the given descriptor, attaching the worker to it (and detaching it from
+    the previous replay's) if it is not attached yet.
+    """
+    global _worker_shared_memory, _worker_frame_table
+    if _worker_shared_memory is not None and _worker_shared_memory.name == descriptor[0]:
+        return _worker_frame_table
+    if _worker_shared_memory is not None:
+        # the views on the previous segment must be released before it can be closed
+        _worker_frame_table = None
+        _worker_shared_memory.close()
+    _worker_shared_memory, _worker_frame_table = SharedFrameTable.attach(descriptor)
+    return _worker_frame_table
+
+
+def evaluate_partition(descriptor: tuple, player_info: list, first_query: int, last_query: int) -> list:
+    """
+    Evaluates the worker's queries from first_query to last_query (excluded) over the shared frame table, and
+    returns the (printed frame indices, error frame indices) of every query.
+    """
+    frame_table = attach_worker(descriptor)
+    query_frames = []
+    for query in batch_analyzer._worker_queries[first_query:last_query]:
+        if player_info is not None:
+            query.compiled_condition.bind_players(player_info)
+        query_frames.append(evaluate_query_frames(query, frame_table))
+    return query_frames
+
+
+class ParallelQueryEvaluator:
+    """
+    Evaluates a large set of queries over whole replays on a pool of worker processes, for the query sets which
+    are too slow to evaluate on a single core (see offline_query_engine.evaluate_queries, which gives the same
+    results on one core).
+
+    The workers parse the queries once, when they are started (with the batch analysis' worker initializer, see
+    batch_analyzer.init_worker, without a replay cache). For every replay, the frame table is copied once
+    into shared memory (see SharedFrameTable), the queries are split in contiguous partitions which the workers
+    evaluate on views of the shared columns, and the events of all the partitions are merged in the order they
+    are printed while the replay is played.
+    """
+
+    # the number of partitions per worker: more partitions than workers balance the slower queries between them
+    PARTITIONS_PER_WORKER = 4
+
+    def __init__(self, queries_text: str, workers: int = None):
+        """
+        The queries are given as a text in which they are separated by a blank line (see
+        batch_analyzer.parse_queries).
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        self.queries = batch_analyzer.parse_queries(queries_text)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=batch_analyzer.init_worker,
+                                            initargs=(queries_text, None))
+        self.partition_count = min(len(self.queries), workers * ParallelQueryEvaluator.PARTITIONS_PER_WORKER)
+
+    def partitions(self) -> list:
+        bounds = np.linspace(0, len(self.queries), self.partition_count + 1).astype(int)
+        return [(int(first_query), int(last_query)) for first_query, last_query in zip(bounds[:-1], bounds[1:])
+                if last_query > first_query]
+
+    def evaluate(self, frame_table: FrameTable, player_info: list = None) -> list:
+        """
+        Returns the list of (time, message) events the queries print over the replay, in the same order as
+        offline_query_engine.evaluate_queries.
+        """
+        shared_frame_table = SharedFrameTable(frame_table)
+        try:
+            descriptor = shared_frame_table.descriptor()
+            futures = [self.executor.submit(evaluate_partition, descriptor, player_info, first_query, last_query)
+                       for first_query, last_query in self.partitions()]
+            query_frames = []
+            for future in futures:
+                query_frames.extend(future.result())
+        finally:
+            shared_frame_table.close()
+
+        frame_indices, messages = merge_query_frames(
+            [(printed_frames, error_frames, query.print_string)
+             for (printed_frames, error_frames), query in zip(query_frames, self.queries)])
+        times = frame_table.time[frame_indices]
+        return [(float(time), message) for time, message in zip(times, messages)]
+
+    def close(self):
+        self.executor.shutdown()
@@ -1,6 +1,8 @@
 import re
+from time import perf_counter_ns
 
 from src import constants
+from src.query_condition import QueryCondition
 from src.query_parse_exception import QueryParseException
 
 
@@ -22,7 +24,23 @@ class Query:
             - ...
             - player.6.x;
             - player.6.y;
+            - ball.age / player.1.age / ... (the seconds since the position was last updated in the replay;
+              the last known positions are carried forward between the updates);
             - midfield.x (the position at the middle of the field on the X axis: 0);
+            - last_touch.team / last_goal.team (the team which last touched the ball / scored: team.orange or
+              team.blue), last_touch.player (the number of the player who last touched the ball);
+            - since_kickoff / since_goal / since_touch (the seconds since the last kickoff / goal / touch);
+        as well as aggregate functions of an expression over its own time window (x SECONDS or x ENTRIES):
+            - avg(expression, x SECONDS) (the average value);
+            - min(expression, x SECONDS) / max(expression, x SECONDS);
+            - sum(expression, x SECONDS);
+            - count(expression, x SECONDS) (the number of entries in which the expression is true);
+        and spatial functions, computed from the positions of all the players at once:
+            - dist(a, b) (the distance between ball, player.N, orange or blue - a team meaning its centroid);
+            - in_zone(entity, zone) (zone: orange_third, middle_third, blue_third, orange_half, blue_half or, for
+              the players, defensive_third, offensive_third, defensive_half, offensive_half);
+            - closest_to_ball(team) / closest_dist_to_ball(team) (team: orange, blue or any);
+            - centroid_x(team) / centroid_y(team);
 
     TIME_WINDOW can be:
         LAST x SECONDS (where 'x' is a number)
@@ -39,6 +57,11 @@ class Query:
         FOR LAST 20 SECONDS
         THEN PRINT("Left team too defensive")
         EVERY 0.5 SECONDS
+
+        IF avg(ball.x, 10 SECONDS) > 1000
+        FOR LAST 1 ENTRIES
+        THEN PRINT("Ball kept in the right half")
+        EVERY 5 SECONDS
     """
 
     QUERY_IF = "if"
@@ -49,31 +72,12 @@ class Query:
     TIME_WINDOW_ENTRIES = "entries"
     TIME_WINDOW_SECONDS = "seconds"
     INSTRUCTION_PRINT = "print"
-    PARSED_OPERAND_VALUES = [
-        "ball.x",
-        "ball.y",
-        "player.1.x",
-        "player.1.y",
-        "player.2.x",
-        "player.2.y",
-        "player.3.x",
-        "player.3.y",
-        "player.4.x",
-        "player.4.y",
-        "player.5.x",
-        "player.5.y",
-        "player.6.x",
-        "player.6.y",
-    ]
-    STATIC_OPERAND_VALUES = {
-        "midfield.x": 0,
-    }
-    PLACEHOLDER = "PLACEHOLDER"
-
-    CONDITION_CORRECT = "Correct"
-    CONDITION_INCORRECT = "Incorrect"
-    CONDITION_INCOMPLETE = "Incomplete"
-    CONDITION_ERROR = "Error"
+    CONDITION_CORRECT = QueryCondition.CORRECT
+    CONDITION_INCORRECT = QueryCondition.INCORRECT
+    CONDITION_INCOMPLETE = QueryCondition.INCOMPLETE
+    CONDITION_ERROR = QueryCondition.ERROR
+
+    ERROR_MESSAGE = "Error evaluating query condition!"
 
     TUTORIAL_TEXT = "QUERY FORMAT:\n" \
                     "  IF condition\n" \
@@ -89,7 +93,22 @@ class Query:
                     "  - ball.y;\n" \
                     "  - player.1/2/3/4/5/6.x;\n" \
                     "  - player.1/2/3/4/5/6.y;\n" \
+                    "  - ball.age, player.1/2/3/4/5/6.age (seconds since the position was last updated);\n" \
                     "  - midfield.x (0);\n" \
+                    "  - last_touch.team, last_goal.team (team.orange or team.blue), last_touch.player;\n" \
+                    "  - since_kickoff, since_goal, since_touch (seconds since the last one);\n" \
+                    "- aggregate functions, over their own window of the last x SECONDS/ENTRIES:\n" \
+                    "  - avg(expression, x SECONDS);\n" \
+                    "  - min/max/sum(expression, x ENTRIES);\n" \
+                    "  - count(condition, x SECONDS) (the entries in which the condition is true);\n" \
+                    "  e.g. avg(ball.x, 10 SECONDS) > 1000\n" \
+                    "- spatial functions:\n" \
+                    "  - dist(a, b), with a/b: ball, player.1-6, orange, blue (team centroid);\n" \
+                    "  - in_zone(entity, zone), with zone: orange_third, middle_third, blue_third, orange_half, " \
+                    "blue_half, defensive_third, offensive_third, defensive_half, offensive_half;\n" \
+                    "  - closest_to_ball(team), closest_dist_to_ball(team), with team: orange, blue, any;\n" \
+                    "  - centroid_x(team), centroid_y(team);\n" \
+                    "  e.g. closest_dist_to_ball(orange) < 500\n" \
                     "- x: number\n" \
                     "- time_window: 'SECONDS' or 'ENTRIES'\n" \
                     "- message: a string printed when the condition is true 'FOR the LAST x SECONDS/ENTRIES'\n" \
@@ -117,6 +136,7 @@ class Query:
 
         # init the query parameters
         self.condition = ""
+        self.compiled_condition = None
         self.time_window_value = -1
         self.time_window_type = ""
         self.print_string = ""
@@ -128,10 +148,13 @@ class Query:
         self.last_entry_time = 0
         self.last_print_time = 0
 
+        # the query's profiling statistics (see QueryProfiler), or None if it isn't profiled
+        self.stats = None
+
         # parse the query parameters' actual values from the given string
         self.parse_query()
         self.validate_parameters()
-        self.invert_coordinates_in_condition()
+        self.compiled_condition = QueryCondition(self.condition)
 
     def parse_query(self):
         # lowercase everything, we don't use any capital letters
@@ -228,75 +251,55 @@ class Query:
         self.delay = Query.validate_number(self.delay,
                                            "DELAY (EVERY) must be a number.")
 
-    def invert_coordinates(self, value):
-        self.condition = self.condition.replace(value + ".x", Query.PLACEHOLDER)
-        self.condition = self.condition.replace(value + ".y", value + ".x")
-        self.condition = self.condition.replace(Query.PLACEHOLDER, value + ".y")
-
-    def invert_coordinates_in_condition(self):
+    def get_state(self) -> tuple:
         """
-        We must invert any coordinates (ball.x with ball.y), and so on,
-        because the frames' coordinates are reversed.
+        Returns a snapshot of the query evaluation variables (including the condition's aggregate windows), which
+        can be restored with set_state.
         """
-        self.invert_coordinates("ball")
-        self.invert_coordinates("player.1")
-        self.invert_coordinates("player.2")
-        self.invert_coordinates("player.3")
-        self.invert_coordinates("player.4")
-        self.invert_coordinates("player.5")
-        self.invert_coordinates("player.6")
+        return self.fit_entries, self.first_entry_time, self.last_entry_time, self.last_print_time, \
+            self.compiled_condition.get_state()
 
-    def evaluate_condition_for_message(self, message: dict):
-        enhanced_condition = self.condition
-        # replace all the static values in the condition
-        for static_operand in Query.STATIC_OPERAND_VALUES.items():
-            enhanced_condition = enhanced_condition.replace(static_operand[0], str(static_operand[1]))
-
-        # replace all the parsed values in the condition (values found in the given message)
-        for parsed_operand in Query.PARSED_OPERAND_VALUES:
-            try:
-                parsed_operand_value = message
-                for operand_key in parsed_operand.split("."):
-                    parsed_operand_value = parsed_operand_value[operand_key]
-                enhanced_condition = enhanced_condition.replace(parsed_operand, str(parsed_operand_value))
-            except KeyError:
-                # if the operand is correct, but we can't find it in the message because there is
-                # no update yet, we return it as incomplete
-                if parsed_operand in self.condition:
-                    return Query.CONDITION_INCOMPLETE
+    def set_state(self, state: tuple):
+        self.fit_entries, self.first_entry_time, self.last_entry_time, self.last_print_time, condition_state = state
+        self.compiled_condition.set_state(condition_state)
 
-        try:
-            # evaluate the condition without any builtins to prevent any injections
-            if eval(enhanced_condition, {'__builtin__': None}):
-                return Query.CONDITION_CORRECT
-            else:
-                return Query.CONDITION_INCORRECT
-        except (SyntaxError, ZeroDivisionError, NameError, TypeError, KeyError):
-            # return CONDITION_ERROR if the eval failed because of any issues; we will print a message
-            # for the user to know that the query's condition is broken for this particular event
-            return Query.CONDITION_ERROR
+    def evaluate_condition_for_message(self, message: dict):
+        return self.compiled_condition.evaluate(message)
 
     def add_message(self, message: dict):
+        start_time = perf_counter_ns() if self.stats is not None else 0
+
         # evaluate the query condition, based on the new message
         condition_result = self.evaluate_condition_for_message(message)
+        result = self.apply_condition_result(condition_result, message[constants.FRAME_TIME])
+
+        if self.stats is not None:
+            self.stats.add_evaluation(perf_counter_ns() - start_time, condition_result,
+                                      result is not None and condition_result == Query.CONDITION_CORRECT)
+        return result
 
+    def apply_condition_result(self, condition_result: str, message_time: float):
+        """
+        Updates the query evaluation state given the result of the condition for a message, and returns the
+        string to be printed for the message (or None).
+        """
         # check if the condition can be evaluated or if it is syntactically incorrect
         if condition_result == Query.CONDITION_ERROR:
-            return "Error evaluating query condition!"
+            return Query.ERROR_MESSAGE
         elif condition_result == Query.CONDITION_CORRECT:
             # if the condition is true, we update the query evaluation parameters and check if we should
             # print the message in the query's 'THEN' clause
 
             # update query evaluation parameters
             if self.fit_entries == 0:
-                self.first_entry_time = message[constants.FRAME_TIME]
-            self.last_entry_time = message[constants.FRAME_TIME]
+                self.first_entry_time = message_time
+            self.last_entry_time = message_time
             self.fit_entries += 1
 
             # check if we should print the message, according to the time window type, value and delay
-            if self.time_window_type == Query.TIME_WINDOW_ENTRIES and self.fit_entries >= self.time_window_value or \
-                    self.time_window_type == Query.TIME_WINDOW_SECONDS and \
-                    self.last_entry_time - self.first_entry_time >= self.time_window_value and \
+            if (self.time_window_type == Query.TIME_WINDOW_ENTRIES and self.fit_entries >= self.time_window_value or
+                    self.time_window_type == Query.TIME_WINDOW_SECONDS and
+                    self.last_entry_time - self.first_entry_time >= self.time_window_value) and \
                     self.last_entry_time - self.last_print_time >= self.delay:
                 self.last_print_time = self.last_entry_time
                 return self.print_string
@@ -0,0 +1,929 @@
+import ast
+import copy
+import hashlib
+import operator
+import re
+from collections import deque
+from time import perf_counter_ns
+
+import numpy as np
+
+from src import constants
+from src.event_table import EventTable
+from src.query_parse_exception import QueryParseException
+from src.spatial import SpatialOperand, SpatialPositions
+
+
+class QueryCondition:
+    """
+    The compiled form of a query's CONDITION.
+
+    The condition is parsed only once, into a Python AST which is validated against the allowed operands and
+    operators. Its top-level clauses (e.g. 'a', 'b' and 'c' in 'a and b and c') are then compiled into functions
+    which receive the values of the operands they use, so evaluating the condition for a frame only means reading
+    those values from the frame and calling the functions.
+
+    The operands are written with dots in the condition (e.g. 'player.1.x'), which is not a valid Python name,
+    so they are first replaced with identifiers (e.g. 'player_1_x').
+
+    The condition can also use aggregate functions over a time window, e.g. 'avg(ball.x, 10 seconds) > 1000' or
+    'max(player.1.y, 50 entries) < 0' (see AggregateWindow); every aggregate is replaced with an identifier as
+    well, and its value is computed before evaluating the clauses, like an operand's.
+
+    The same goes for the spatial functions (e.g. 'dist(player.1, ball) < 500', see SpatialOperand), which are
+    computed from the positions of all the players at once.
+
+    The operands are only resolved when a clause needs them (see MessageOperands), and the clauses are evaluated
+    in the order in which they are most likely to decide the result for the least work: the first messages are
+    sampled to measure every clause's cost and pass rate, and the clauses are then reordered (see plan_clauses).
+    A clause with a missing operand is unknown; the condition is only incomplete if no other clause decides its
+    result (e.g. a false clause makes a conjunction incorrect, even if another clause is unknown).
+    """
+
+    # operand -> path to its value in an extracted frame
+    # note: the frames' coordinates are reversed, so the operands' x refers to the frames' y and vice versa
+    PARSED_OPERAND_VALUES = {
+        "ball.x": (constants.FRAME_BALL, constants.FRAME_Y),
+        "ball.y": (constants.FRAME_BALL, constants.FRAME_X),
+        "ball.age": (constants.FRAME_BALL, constants.FRAME_AGE),
+        "player.1.x": (constants.FRAME_PLAYER, "1", constants.FRAME_Y),
+        "player.1.y": (constants.FRAME_PLAYER, "1", constants.FRAME_X),
+        "player.1.age": (constants.FRAME_PLAYER, "1", constants.FRAME_AGE),
+        "player.2.x": (constants.FRAME_PLAYER, "2", constants.FRAME_Y),
+        "player.2.y": (constants.FRAME_PLAYER, "2", constants.FRAME_X),
+        "player.2.age": (constants.FRAME_PLAYER, "2", constants.FRAME_AGE),
+        "player.3.x": (constants.FRAME_PLAYER, "3", constants.FRAME_Y),
+        "player.3.y": (constants.FRAME_PLAYER, "3", constants.FRAME_X),
+        "player.3.age": (constants.FRAME_PLAYER, "3", constants.FRAME_AGE),
+        "player.4.x": (constants.FRAME_PLAYER, "4", constants.FRAME_Y),
+        "player.4.y": (constants.FRAME_PLAYER, "4", constants.FRAME_X),
+        "player.4.age": (constants.FRAME_PLAYER, "4", constants.FRAME_AGE),
+        "player.5.x": (constants.FRAME_PLAYER, "5", constants.FRAME_Y),
+        "player.5.y": (constants.FRAME_PLAYER, "5", constants.FRAME_X),
+        "player.5.age": (constants.FRAME_PLAYER, "5", constants.FRAME_AGE),
+        "player.6.x": (constants.FRAME_PLAYER, "6", constants.FRAME_Y),
+        "player.6.y": (constants.FRAME_PLAYER, "6", constants.FRAME_X),
+        "player.6.age": (constants.FRAME_PLAYER, "6", constants.FRAME_AGE),
+        # the values derived from the game events (see EventTable.FRAME_VALUES)
+        "last_touch.team": (constants.FRAME_EVENTS, "last_touch_team"),
+        "last_touch.player": (constants.FRAME_EVENTS, "last_touch_player"),
+        "last_goal.team": (constants.FRAME_EVENTS, "last_goal_team"),
+        "since_touch": (constants.FRAME_EVENTS, "since_touch"),
+        "since_kickoff": (constants.FRAME_EVENTS, "since_kickoff"),
+        "since_goal": (constants.FRAME_EVENTS, "since_goal"),
+    }
+    STATIC_OPERAND_VALUES = {
+        "midfield.x": 0,
+        "team.orange": EventTable.TEAM_ORANGE,
+        "team.blue": EventTable.TEAM_BLUE,
+        "true": True,
+        "false": False,
+    }
+    OPERAND_PATTERN = re.compile(r"\b(?:(?:ball|player\.\d+|midfield|last_touch|last_goal|team)\.[a-z_]+"
+                                 r"|since_[a-z_]+)\b")
+
+    # the time window of an aggregate function (e.g. ', 10 seconds)'), which is turned into two arguments
+    AGGREGATE_WINDOW_PATTERN = re.compile(r",\s*(\d+(?:\.\d+)?)\s+(seconds|entries)\s*\)", re.IGNORECASE)
+
+    ALLOWED_BOOLEAN_OPERATORS = (ast.And, ast.Or)
+    ALLOWED_COMPARISON_OPERATORS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+    ALLOWED_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+    ALLOWED_UNARY_OPERATORS = (ast.Not, ast.USub, ast.UAdd)
+
+    COLUMN_OPERATORS = {
+        ast.Eq: operator.eq,
+        ast.NotEq: operator.ne,
+        ast.Lt: operator.lt,
+        ast.LtE: operator.le,
+        ast.Gt: operator.gt,
+        ast.GtE: operator.ge,
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Div: np.true_divide,
+        ast.FloorDiv: np.floor_divide,
+        ast.Mod: np.mod,
+        ast.USub: np.negative,
+        ast.UAdd: np.positive,
+    }
+    DIVISION_OPERATORS = (ast.Div, ast.FloorDiv, ast.Mod)
+
+    # the exceptions which mean that the condition is broken for a particular frame (e.g. a division by 0)
+    EVALUATION_ERRORS = (ArithmeticError, TypeError, ValueError)
+
+    CORRECT = "Correct"
+    INCORRECT = "Incorrect"
+    INCOMPLETE = "Incomplete"
+    ERROR = "Error"
+
+    def __init__(self, condition: str):
+        self.condition = condition
+
+        # identifier -> operand (or aggregate key), for the operands and the aggregates written in the condition
+        self.identifiers = {}
+
+        # the aggregate functions and the spatial operands used by the condition
+        self.aggregates = []
+        self.spatial_operands = []
+
+        self.expression = self.parse_condition()
+
+        # the parsed operands which must be read from a message (including the ones used inside the aggregates)
+        self.operands = []
+        self.operand_paths = []
+        for node in ast.walk(self.expression):
+            if isinstance(node, ast.Name) and self.identifiers[node.id] in QueryCondition.PARSED_OPERAND_VALUES:
+                self.add_operand(self.identifiers[node.id])
+        for aggregate in self.aggregates:
+            for operand in aggregate.operands:
+                if operand in QueryCondition.PARSED_OPERAND_VALUES:
+                    self.add_operand(operand)
+
+        # the operands' paths and the spatial operands, by key, to resolve them lazily (see MessageOperands)
+        self.paths_by_operand = dict(zip(self.operands, self.operand_paths))
+        self.spatial_operands_by_key = {spatial_operand.key: spatial_operand
+                                        for spatial_operand in self.spatial_operands}
+
+        self.is_disjunction = isinstance(self.expression, ast.BoolOp) and isinstance(self.expression.op, ast.Or)
+        self.clauses = self.compile_clauses()
+        # the order in which the clauses are evaluated (see plan_clauses), the number of messages sampled (in which
+        # the clauses were timed and their results counted), and the number of frames of the vectorized sample
+        self.clause_order = list(self.clauses)
+        self.sampled_messages = 0
+        self.sampled_frames = 0
+        # the statistics the current order was planned from: the pass rates of the vectorized sample (or of the
+        # sampled messages), and the measured costs (or the estimated ones); None until the clauses are planned
+        self.planned_from_frames = None
+        self.planned_from_timings = None
+
+    @staticmethod
+    def operand_identifier(operand: str) -> str:
+        return operand.replace(".", "_")
+
+    def add_operand(self, operand: str):
+        if operand not in self.operands:
+            self.operands.append(operand)
+            self.operand_paths.append(QueryCondition.PARSED_OPERAND_VALUES[operand])
+
+    def replace_operand(self, match) -> str:
+        operand = match.group(0)
+        if operand not in QueryCondition.PARSED_OPERAND_VALUES and \
+                operand not in QueryCondition.STATIC_OPERAND_VALUES:
+            raise QueryParseException("Unknown operand '" + operand + "' in the condition.")
+        identifier = QueryCondition.operand_identifier(operand)
+        self.identifiers[identifier] = operand
+        return identifier
+
+    def parse_condition(self) -> ast.expr:
+        source = SpatialOperand.CALL_PATTERN.sub(SpatialOperand.quote_arguments, self.condition.strip())
+        source = QueryCondition.OPERAND_PATTERN.sub(self.replace_operand, source)
+        source = QueryCondition.AGGREGATE_WINDOW_PATTERN.sub(
+            lambda match: ", " + match.group(1) + ", \"" + match.group(2).lower() + "\")", source)
+        try:
+            expression = ast.parse(source, mode="eval").body
+        except SyntaxError:
+            raise QueryParseException("The condition is not a valid expression.")
+        return self.validate_node(expression)
+
+    def validate_node(self, node: ast.expr, allow_aggregates: bool = True) -> ast.expr:
+        """
+        Checks that the node only uses the allowed operands and operators, and returns it with the static
+        operands replaced by their values and the aggregates replaced by their identifiers.
+        """
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, QueryCondition.ALLOWED_BOOLEAN_OPERATORS):
+            node.values = [self.validate_node(value, allow_aggregates) for value in node.values]
+        elif isinstance(node, ast.Compare) and \
+                all(isinstance(op, QueryCondition.ALLOWED_COMPARISON_OPERATORS) for op in node.ops):
+            node.left = self.validate_node(node.left, allow_aggregates)
+            node.comparators = [self.validate_node(comparator, allow_aggregates) for comparator in node.comparators]
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, QueryCondition.ALLOWED_BINARY_OPERATORS):
+            node.left = self.validate_node(node.left, allow_aggregates)
+            node.right = self.validate_node(node.right, allow_aggregates)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, QueryCondition.ALLOWED_UNARY_OPERATORS):
+            node.operand = self.validate_node(node.operand, allow_aggregates)
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float, bool):
+            pass
+        elif isinstance(node, ast.Name):
+            return self.validate_name(node)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+                node.func.id in SpatialOperand.FUNCTION_ARGUMENT_COUNTS:
+            return self.validate_spatial_operand(node)
+        elif isinstance(node, ast.Call) and allow_aggregates:
+            return self.validate_aggregate(node)
+        else:
+            raise QueryParseException("The condition contains an unsupported expression: '"
+                                      + ast.unparse(node) + "'.")
+        return node
+
+    def validate_name(self, node: ast.Name) -> ast.expr:
+        operand = self.identifiers.get(node.id, node.id)
+        if operand in QueryCondition.STATIC_OPERAND_VALUES:
+            constant = ast.copy_location(ast.Constant(QueryCondition.STATIC_OPERAND_VALUES[operand]), node)
+            # the constant remembers the operand it replaces, to show the clauses as written (see StaticOperandNames)
+            constant.static_identifier = node.id
+            return constant
+        if operand not in QueryCondition.PARSED_OPERAND_VALUES:
+            raise QueryParseException("Unknown operand '" + operand + "' in the condition.")
+        self.identifiers[node.id] = operand
+        return node
+
+    def validate_aggregate(self, node: ast.Call) -> ast.expr:
+        """
+        Checks an aggregate function call (FUNCTION(expression, x SECONDS/ENTRIES), already rewritten as
+        FUNCTION(expression, x, "seconds"/"entries")), and replaces it with the aggregate's identifier.
+        """
+        if not isinstance(node.func, ast.Name) or node.func.id.lower() not in AggregateWindow.FUNCTIONS:
+            raise QueryParseException("Unknown function '" + ast.unparse(node.func) + "' in the condition.")
+        if node.keywords or len(node.args) != 3 or \
+                not isinstance(node.args[1], ast.Constant) or type(node.args[1].value) not in (int, float) or \
+                not isinstance(node.args[2], ast.Constant) or \
+                node.args[2].value not in (AggregateWindow.WINDOW_SECONDS, AggregateWindow.WINDOW_ENTRIES):
+            raise QueryParseException("Aggregate functions must be written as FUNCTION(expression, x SECONDS) "
+                                      "or FUNCTION(expression, x ENTRIES).")
+
+        expression = self.validate_node(node.args[0], allow_aggregates=False)
+        aggregate = AggregateWindow(node.func.id.lower(), expression, node.args[1].value, node.args[2].value,
+                                    self.identifiers)
+        if all(existing_aggregate.key != aggregate.key for existing_aggregate in self.aggregates):
+            self.aggregates.append(aggregate)
+        self.identifiers[aggregate.identifier] = aggregate.key
+        return ast.copy_location(ast.Name(aggregate.identifier, ast.Load()), node)
+
+    def validate_spatial_operand(self, node: ast.Call) -> ast.expr:
+        """
+        Checks a spatial function call (whose arguments were turned into strings before parsing), and replaces it
+        with the spatial operand's identifier.
+        """
+        if node.keywords or not all(isinstance(argument, ast.Constant) and isinstance(argument.value, str)
+                                    for argument in node.args):
+            raise QueryParseException("The arguments of '" + node.func.id + "' must be names, "
+                                      "e.g. dist(player.1, ball).")
+        # the operands written as arguments (e.g. 'ball.x') were already replaced with their identifiers
+        spatial_operand = SpatialOperand(node.func.id, [self.identifiers.get(argument.value, argument.value)
+                                                        for argument in node.args])
+        if all(existing_operand.key != spatial_operand.key for existing_operand in self.spatial_operands):
+            self.spatial_operands.append(spatial_operand)
+        self.identifiers[spatial_operand.identifier] = spatial_operand.key
+        return ast.copy_location(ast.Name(spatial_operand.identifier, ast.Load()), node)
+
+    def bind_players(self, player_info: list):
+        """
+        Gives the spatial operands the players' information, which they need to know the players' teams.
+        """
+        for spatial_operand in self.spatial_operands:
+            spatial_operand.bind_players(player_info)
+
+    @staticmethod
+    def compile_function(expression: ast.expr, argument_identifiers: list):
+        """
+        Compiles a validated expression into a function taking the values of the given identifiers as arguments;
+        the function runs without any builtins, as it doesn't need them.
+        """
+        arguments = ast.arguments(posonlyargs=[], kwonlyargs=[], kw_defaults=[], defaults=[],
+                                  args=[ast.arg(identifier) for identifier in argument_identifiers])
+        function = ast.Expression(ast.Lambda(arguments, expression))
+        ast.fix_missing_locations(function)
+        return eval(compile(function, "<query condition>", "eval"), {"__builtins__": {}})
+
+    def compile_clauses(self) -> list:
+        """
+        Splits the condition in its top-level clauses (the values of its top-level 'and' / 'or') and compiles
+        every clause on its own.
+        """
+        if isinstance(self.expression, ast.BoolOp):
+            clause_expressions = self.expression.values
+        else:
+            clause_expressions = [self.expression]
+        return [ConditionClause(clause_expression, self.identifiers, self.spatial_operands_by_key)
+                for clause_expression in clause_expressions]
+
+    def plan_clauses(self):
+        """
+        Reorders the clauses by their cost and pass rate, so the clauses most likely to decide the result for the
+        least work are evaluated first (see ConditionClause.rank). The clauses which may fail (the ones with a
+        division) keep their place, and the others are only reordered between them: the result doesn't depend on
+        the order of the clauses which can't fail, but it could change which clause fails first.
+
+        The pass rates are taken from the larger sample: the vectorized one (see sample_clauses) or the sampled
+        messages. The clauses' measured costs are only used if they were all timed (see evaluate_operands), as the
+        estimated costs are in other units.
+        """
+        use_frame_results = self.sampled_frames > self.sampled_messages
+        use_timings = all(clause.timing.count for clause in self.clauses)
+        clause_order = []
+        reorderable_clauses = []
+        for clause in self.clauses + [None]:
+            if clause is None or clause.may_fail:
+                clause_order.extend(sorted(reorderable_clauses,
+                                           key=lambda reorderable_clause: reorderable_clause.rank(
+                                               self.is_disjunction, use_frame_results, use_timings)))
+                reorderable_clauses = []
+                if clause is not None:
+                    clause_order.append(clause)
+            else:
+                reorderable_clauses.append(clause)
+        self.clause_order = clause_order
+        self.planned_from_frames = use_frame_results
+        self.planned_from_timings = use_timings
+
+    def sample_clauses(self, frame_table):
+        """
+        Samples the clauses' pass rates over the frames of a replay (e.g. the frames extracted so far) with the
+        vectorized evaluation, and plans the clauses' order from them, before any message is evaluated. The
+        results of a previous vectorized sample are replaced.
+        """
+        self.evaluate_columns(frame_table, sample=True)
+        self.plan_clauses()
+
+    def explain(self) -> str:
+        """
+        Returns the clauses in the order in which they are evaluated, along with their observed pass rates, the
+        frames in which they were unknown or failed, and their cost, to see why a condition is slow.
+        """
+        header = ("ANY" if self.is_disjunction else "ALL") + " of " + str(len(self.clauses)) + " clauses, "
+        if self.planned_from_frames is None:
+            use_frame_results = False
+            header += "in written order (not planned yet), " + str(self.sampled_messages) + " messages sampled:"
+        else:
+            use_frame_results = self.planned_from_frames
+            if use_frame_results:
+                header += "pass rates over " + str(self.sampled_frames) + " frames (vectorized sample), "
+            else:
+                header += "pass rates over " + str(self.sampled_messages) + " sampled messages, "
+            header += ("costs timed" if self.planned_from_timings else "costs estimated") + ":"
+        lines = [header]
+        for position, clause in enumerate(self.clause_order, 1):
+            results = clause.frame_results if use_frame_results else clause.message_results
+            known_count = results[True] + results[False]
+            pass_rate = str(round(results[True] / known_count * 100, 1)) + "%" if known_count else "-"
+            cost = str(round(clause.timing.total_ns / clause.timing.count)) + " ns" if clause.timing.count \
+                else "~" + str(clause.estimated_cost)
+            lines.append("  " + str(position) + ". [#" + str(self.clauses.index(clause) + 1) + "] " + clause.source
+                         + ": passed " + pass_rate + " of " + str(known_count) + ", unknown "
+                         + str(results[QueryCondition.INCOMPLETE]) + ", errors "
+                         + str(results[QueryCondition.ERROR]) + ", cost " + cost
+                         + (" (may fail, kept in place)" if clause.may_fail else ""))
+        return "\n".join(lines)
+
+    @staticmethod
+    def resolve_operand(message: dict, operand_path: tuple):
+        """
+        Returns the value found at the operand path in the given message, or None if it is missing.
+        """
+        value = message
+        for key in operand_path:
+            value = value.get(key, None)
+            if value is None:
+                return None
+        return value
+
+    def update_aggregates(self, operand_values: dict, message_time: float):
+        """
+        Adds a message (given by its operand values) to the aggregates' windows, and stores the aggregates' values
+        in operand_values, by aggregate key.
+        """
+        for aggregate in self.aggregates:
+            operand_values[aggregate.key] = aggregate.add_message(operand_values, message_time)
+
+    def get_state(self) -> tuple:
+        return tuple(aggregate.get_state() for aggregate in self.aggregates)
+
+    def set_state(self, state: tuple):
+        for aggregate, aggregate_state in zip(self.aggregates, state):
+            aggregate.set_state(aggregate_state)
+
+    def evaluate_operands(self, operand_values: dict, clause_results: dict) -> str:
+        """
+        Evaluates the condition given the values of its operands and aggregates (None for the missing ones), which
+        can be resolved as the clauses need them (see MessageOperands). The clauses' results are looked up in /
+        stored into clause_results, by clause key, so the clauses shared by multiple conditions are evaluated only
+        once per message.
+
+        The clauses are evaluated in the planned order until one of them decides the result (like Python's 'and'
+        / 'or'); the unknown clauses (with a missing operand) are skipped.
+        """
+        if self.sampled_messages < constants.CLAUSE_SAMPLE_MESSAGES:
+            return self.sample_operands(operand_values, clause_results)
+
+        unknown = False
+        for clause in self.clause_order:
+            clause_result = clause_results.get(clause.key, None)
+            if clause_result is None:
+                clause_result = clause.evaluate(operand_values)
+                clause_results[clause.key] = clause_result
+            if clause_result == self.is_disjunction:
+                return QueryCondition.CORRECT if self.is_disjunction else QueryCondition.INCORRECT
+            if clause_result == QueryCondition.ERROR:
+                return QueryCondition.ERROR
+            if clause_result == QueryCondition.INCOMPLETE:
+                # an operand is correct, but it is not in the message because there is no update for it yet
+                unknown = True
+        if unknown:
+            return QueryCondition.INCOMPLETE
+        return QueryCondition.INCORRECT if self.is_disjunction else QueryCondition.CORRECT
+
+    def sample_operands(self, operand_values: dict, clause_results: dict) -> str:
+        """
+        Same as evaluate_operands, for the first messages: all the clauses are evaluated (even after the result is
+        decided) and timed, and their results are counted, so their order can be planned once the sample is
+        complete (see plan_clauses).
+        """
+        condition_result = None
+        unknown = False
+        for clause in self.clause_order:
+            clause_result = clause_results.get(clause.key, None)
+            if clause_result is None:
+                start_time = perf_counter_ns()
+                clause_result = clause.evaluate(operand_values)
+                clause.timing.add(perf_counter_ns() - start_time)
+                clause_results[clause.key] = clause_result
+            clause.message_results[clause_result] += 1
+
+            if condition_result is not None:
+                continue
+            if clause_result == QueryCondition.INCOMPLETE:
+                unknown = True
+            elif clause_result == QueryCondition.ERROR:
+                condition_result = QueryCondition.ERROR
+            elif clause_result == self.is_disjunction:
+                condition_result = QueryCondition.CORRECT if self.is_disjunction else QueryCondition.INCORRECT
+
+        self.sampled_messages += 1
+        if self.sampled_messages == constants.CLAUSE_SAMPLE_MESSAGES:
+            self.plan_clauses()
+        if condition_result is not None:
+            return condition_result
+        if unknown:
+            return QueryCondition.INCOMPLETE
+        return QueryCondition.INCORRECT if self.is_disjunction else QueryCondition.CORRECT
+
+    def evaluate(self, message: dict) -> str:
+        """
+        Evaluates the condition for a message; the message is also added to the aggregates' windows. The other
+        operands are only resolved if a clause needs them, unless there is a single clause (which needs them all).
+        """
+        if len(self.clauses) > 1:
+            operand_values = MessageOperands(message, self.paths_by_operand, self.spatial_operands_by_key)
+        else:
+            operand_values = {}
+            for operand, operand_path in self.paths_by_operand.items():
+                operand_values[operand] = QueryCondition.resolve_operand(message, operand_path)
+            if self.spatial_operands:
+                positions = SpatialPositions.from_message(message)
+                for spatial_operand in self.spatial_operands:
+                    operand_values[spatial_operand.key] = spatial_operand.evaluate_message(positions)
+        self.update_aggregates(operand_values, message[constants.FRAME_TIME])
+        return self.evaluate_operands(operand_values, {})
+
+    @staticmethod
+    def column_truth(values):
+        return np.asarray(values) != 0
+
+    @staticmethod
+    def column_number(values):
+        # booleans are numbers in Python, but NumPy refuses to subtract / negate them
+        values = np.asarray(values)
+        if values.dtype == bool:
+            return values.astype(np.float64)
+        return values
+
+    def evaluate_node_columns(self, node: ast.expr, columns: dict):
+        """
+        Evaluates a validated node for all the frames at once, with the same semantics as Python; returns the
+        values and a mask of the frames in which evaluating the node would have raised an error (a division by 0).
+        Only the errors which Python would actually reach are reported (e.g. not after an 'and' which is false).
+        """
+        if isinstance(node, ast.Constant):
+            return node.value, False
+        if isinstance(node, ast.Name):
+            return columns[node.id], False
+        if isinstance(node, ast.BoolOp):
+            result, errors = self.evaluate_node_columns(node.values[0], columns)
+            # the frames in which Python would go on evaluating the next value
+            pending = QueryCondition.column_truth(result)
+            if isinstance(node.op, ast.Or):
+                pending = ~pending
+            for value_node in node.values[1:]:
+                values, value_errors = self.evaluate_node_columns(value_node, columns)
+                result = np.where(pending, values, result)
+                errors = errors | pending & value_errors
+                value_truth = QueryCondition.column_truth(values)
+                pending = pending & (value_truth if isinstance(node.op, ast.And) else ~value_truth)
+            return result, errors
+        if isinstance(node, ast.Compare):
+            left, errors = self.evaluate_node_columns(node.left, columns)
+            result = True
+            for comparison_operator, comparator in zip(node.ops, node.comparators):
+                right, right_errors = self.evaluate_node_columns(comparator, columns)
+                errors = errors | result & right_errors
+                result = result & QueryCondition.COLUMN_OPERATORS[type(comparison_operator)](left, right)
+                left = right
+            return result, errors
+        if isinstance(node, ast.BinOp):
+            left, left_errors = self.evaluate_node_columns(node.left, columns)
+            right, right_errors = self.evaluate_node_columns(node.right, columns)
+            left = QueryCondition.column_number(left)
+            right = QueryCondition.column_number(right)
+            errors = left_errors | right_errors
+            if isinstance(node.op, QueryCondition.DIVISION_OPERATORS):
+                errors = errors | (right == 0)
+            return QueryCondition.COLUMN_OPERATORS[type(node.op)](left, right), errors
+        # unary operators
+        values, errors = self.evaluate_node_columns(node.operand, columns)
+        if isinstance(node.op, ast.Not):
+            return ~QueryCondition.column_truth(values), errors
+        return QueryCondition.COLUMN_OPERATORS[type(node.op)](QueryCondition.column_number(values)), errors
+
+    def evaluate_columns(self, frame_table, sample: bool = False) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Vectorized version of evaluate, over all the frames of a frame table; returns three boolean masks: the
+        frames in which the condition is correct, the ones in which it is incomplete and the ones with an error.
+        If sample is set, the clauses' results are counted, as the vectorized sample (see sample_clauses).
+        """
+        frame_count = len(frame_table)
+        columns = {}
+        valid_columns = {}
+        for operand, operand_path in zip(self.operands, self.operand_paths):
+            identifier = QueryCondition.operand_identifier(operand)
+            columns[identifier], valid_columns[identifier] = frame_table.operand_column(operand_path)
+
+        if self.spatial_operands:
+            positions = SpatialPositions.from_frame_table(frame_table)
+            for spatial_operand in self.spatial_operands:
+                columns[spatial_operand.identifier], valid_columns[spatial_operand.identifier] = \
+                    spatial_operand.evaluate_columns(positions)
+
+        # the frames decided by a clause (and whether they are correct / broken), and the ones with unknown clauses
+        decided = np.zeros(frame_count, dtype=bool)
+        correct = np.zeros(frame_count, dtype=bool)
+        errors = np.zeros(frame_count, dtype=bool)
+        unknown = np.zeros(frame_count, dtype=bool)
+        with np.errstate(all="ignore"):
+            for aggregate in self.aggregates:
+                columns[aggregate.identifier], valid_columns[aggregate.identifier] = \
+                    aggregate.evaluate_columns(self, columns, valid_columns, frame_table.time)
+
+            # the clauses in their written order, which gives the same results as any planned order
+            for clause in self.clauses:
+                values, clause_errors = self.evaluate_node_columns(clause.expression, columns)
+                clause_unknown = np.zeros(frame_count, dtype=bool)
+                for identifier in clause.argument_identifiers:
+                    if identifier in valid_columns:
+                        clause_unknown |= ~valid_columns[identifier]
+                known = ~clause_unknown
+                clause_errors = np.broadcast_to(clause_errors, (frame_count,)) & known
+                truth = np.broadcast_to(QueryCondition.column_truth(values), (frame_count,))
+                passed = truth & known & ~clause_errors
+                if sample:
+                    clause.set_frame_results(passed, known & ~truth & ~clause_errors, clause_unknown, clause_errors)
+
+                pending = ~decided
+                unknown |= pending & clause_unknown
+                errors |= pending & clause_errors
+                decisive = pending & known & ~clause_errors & (truth == self.is_disjunction)
+                if self.is_disjunction:
+                    correct |= decisive
+                decided |= decisive | pending & clause_errors
+
+        if sample:
+            self.sampled_frames = frame_count
+        incomplete = ~decided & unknown
+        if not self.is_disjunction:
+            correct = ~decided & ~unknown
+        return correct, incomplete, errors
+
+
+class ConditionClause:
+    """
+    A top-level clause of a condition, compiled on its own. Its key is its normalized source, so identical
+    clauses of different queries have the same key.
+
+    The clause also keeps the statistics used to plan the order of the clauses (see QueryCondition.plan_clauses):
+    the number of times it was true, false, unknown or broken in the sampled messages and in the vectorized sample
+    (kept apart, as they are samples of different sizes), and the time its sampled evaluations took. The timing
+    is shared by the identical clauses of the queries evaluated together (see QueryManager), as only the first of
+    them evaluates the clause for a message.
+    """
+
+    # the estimated cost of a spatial operand, relative to the other nodes of a clause (it is computed from the
+    # positions of all the players, see SpatialOperand)
+    SPATIAL_OPERAND_COST = 20
+    # the smallest rate at which a clause is considered to decide a result, so a clause which never does so is
+    # still ranked by its cost
+    MIN_DECISIVE_RATE = 0.001
+
+    def __init__(self, expression: ast.expr, identifiers: dict, spatial_operands: dict):
+        self.expression = expression
+        self.key = ast.unparse(expression)
+        # the clause as written in the condition (with the operands instead of their identifiers, and the static
+        # operands instead of their values)
+        source_expression = StaticOperandNames().visit(copy.deepcopy(expression))
+        self.source = re.sub(r"\b\w+\b", lambda match: identifiers.get(match.group(0), match.group(0)),
+                             ast.unparse(source_expression))
+
+        # the operands (and aggregates) used by the clause, in the order in which they appear
+        argument_identifiers = []
+        for node in ast.walk(expression):
+            if isinstance(node, ast.Name) and node.id not in argument_identifiers:
+                argument_identifiers.append(node.id)
+        self.argument_identifiers = argument_identifiers
+        self.operands = [identifiers[identifier] for identifier in argument_identifiers]
+        self.function = QueryCondition.compile_function(expression, argument_identifiers)
+
+        # a clause with a division may fail (a division by 0), the others can't
+        self.may_fail = any(isinstance(node, ast.BinOp) and isinstance(node.op, QueryCondition.DIVISION_OPERATORS)
+                            for node in ast.walk(expression))
+        self.estimated_cost = sum(1 for _ in ast.walk(expression)) + ConditionClause.SPATIAL_OPERAND_COST * \
+            sum(1 for operand in self.operands if operand in spatial_operands)
+
+        # clause result (True, False, QueryCondition.INCOMPLETE or QueryCondition.ERROR) -> count, in the sampled
+        # messages and in the vectorized sample
+        self.message_results = {True: 0, False: 0, QueryCondition.INCOMPLETE: 0, QueryCondition.ERROR: 0}
+        self.frame_results = dict.fromkeys(self.message_results, 0)
+        self.timing = ClauseTiming()
+
+    def evaluate(self, operand_values: dict):
+        """
+        Returns the clause's truth value for the given operand values, QueryCondition.INCOMPLETE if one of them
+        is missing, or QueryCondition.ERROR.
+        """
+        arguments = [operand_values[operand] for operand in self.operands]
+        if None in arguments:
+            return QueryCondition.INCOMPLETE
+        try:
+            return bool(self.function(*arguments))
+        except QueryCondition.EVALUATION_ERRORS:
+            return QueryCondition.ERROR
+
+    def set_frame_results(self, passed: np.ndarray, failed: np.ndarray, unknown: np.ndarray, errors: np.ndarray):
+        # the statistics of the vectorized sample (see QueryCondition.evaluate_columns), as masks of the frames
+        for clause_result, mask in ((True, passed), (False, failed), (QueryCondition.INCOMPLETE, unknown),
+                                    (QueryCondition.ERROR, errors)):
+            self.frame_results[clause_result] = int(np.count_nonzero(mask))
+
+    def rank(self, is_disjunction: bool, use_frame_results: bool, use_timings: bool) -> float:
+        """
+        Returns the clause's expected cost for deciding the condition's result: its cost (measured, or estimated)
+        divided by the rate at which it decides the result (a clause which is false for a conjunction, or true
+        for a disjunction). The clauses with the lowest ranks are evaluated first.
+        """
+        cost = self.timing.total_ns / self.timing.count if use_timings else self.estimated_cost
+        results = self.frame_results if use_frame_results else self.message_results
+        known_count = results[True] + results[False]
+        pass_rate = results[True] / known_count if known_count else 0.5
+        decisive_rate = pass_rate if is_disjunction else 1 - pass_rate
+        return cost / max(decisive_rate, ConditionClause.MIN_DECISIVE_RATE)
+
+
+class ClauseTiming:
+    """
+    The number of timed evaluations of a clause, and their total time in nanoseconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+
+    def add(self, duration_ns: int):
+        self.count += 1
+        self.total_ns += duration_ns
+
+
+class StaticOperandNames(ast.NodeTransformer):
+    """
+    Puts back the identifiers of the static operands (e.g. midfield.x) in place of their values, to show a clause
+    as it was written (see QueryCondition.validate_name, which marks the values with their identifiers).
+    """
+
+    def visit_Constant(self, node: ast.Constant) -> ast.expr:
+        identifier = getattr(node, "static_identifier", None)
+        if identifier is None:
+            return node
+        return ast.copy_location(ast.Name(identifier, ast.Load()), node)
+
+
+class MessageOperands(dict):
+    """
+    The values of the operands for a message, by operand (or spatial operand) key, which are only resolved from
+    the message the first time they are looked up: the operands of the clauses which are not evaluated (because
+    an earlier clause decided the result) are never read. The values of the aggregates must be set beforehand.
+    """
+
+    __slots__ = ("message", "operand_paths", "spatial_operands", "positions")
+
+    def __init__(self, message: dict, operand_paths: dict, spatial_operands: dict):
+        self.message = message
+        self.operand_paths = operand_paths
+        self.spatial_operands = spatial_operands
+        # the positions arrays of the spatial operands, built once per message if any of them is needed
+        self.positions = None
+
+    def __missing__(self, operand: str):
+        operand_path = self.operand_paths.get(operand, None)
+        if operand_path is not None:
+            # same as QueryCondition.resolve_operand, inlined as it runs for every operand of every message
+            value = self.message
+            for key in operand_path:
+                value = value.get(key, None)
+                if value is None:
+                    break
+        else:
+            if self.positions is None:
+                self.positions = SpatialPositions.from_message(self.message)
+            value = self.spatial_operands[operand].evaluate_message(self.positions)
+        self[operand] = value
+        return value
+
+
+class AggregateWindow:
+    """
+    An aggregate function (AVG / MIN / MAX / SUM / COUNT) of an expression, over the last x SECONDS / ENTRIES.
+
+    Every message for which the expression can be evaluated adds an entry to the window, and the entries which
+    fall out of the time window are evicted, so every message costs O(1) amortized, no matter how big the window:
+        - sums and averages use a running (cumulative) sum, the window sum being the difference between the
+          cumulative sums after its last entry and before its first one;
+        - minimums and maximums use monotonic deques, whose first value is the window's minimum / maximum;
+        - COUNT counts the entries in which the expression is true.
+    The value of an empty window is None (so the condition is incomplete), except for COUNT, which is 0.
+    """
+
+    FUNCTION_AVG = "avg"
+    FUNCTION_MIN = "min"
+    FUNCTION_MAX = "max"
+    FUNCTION_SUM = "sum"
+    FUNCTION_COUNT = "count"
+    FUNCTIONS = (FUNCTION_AVG, FUNCTION_MIN, FUNCTION_MAX, FUNCTION_SUM, FUNCTION_COUNT)
+
+    WINDOW_SECONDS = "seconds"
+    WINDOW_ENTRIES = "entries"
+
+    def __init__(self, function: str, expression: ast.expr, window_value: float, window_type: str,
+                 identifiers: dict):
+        self.function = function
+        self.expression = expression
+        self.window_value = window_value
+        self.window_type = window_type
+
+        # identical aggregates (even from different conditions) have the same key and identifier
+        self.key = function + "(" + ast.unparse(expression) + ", " + str(window_value) + " " + window_type + ")"
+        self.identifier = "aggregate_" + hashlib.sha1(self.key.encode()).hexdigest()[:16]
+
+        argument_identifiers = []
+        for node in ast.walk(expression):
+            if isinstance(node, ast.Name) and node.id not in argument_identifiers:
+                argument_identifiers.append(node.id)
+        self.argument_identifiers = argument_identifiers
+        self.operands = [identifiers[identifier] for identifier in argument_identifiers]
+        self.expression_function = QueryCondition.compile_function(expression, argument_identifiers)
+
+        # the entries in the window, as (entry number, time, value, cumulative sum before the entry)
+        self.entries = deque()
+        # (entry number, value) of the candidates for the window minimum / maximum
+        self.minimums = deque()
+        self.maximums = deque()
+        self.entry_count = 0
+        self.cumulative_sum = 0.0
+
+    def get_state(self) -> tuple:
+        return tuple(self.entries), tuple(self.minimums), tuple(self.maximums), self.entry_count, self.cumulative_sum
+
+    def set_state(self, state: tuple):
+        entries, minimums, maximums, self.entry_count, self.cumulative_sum = state
+        self.entries = deque(entries)
+        self.minimums = deque(minimums)
+        self.maximums = deque(maximums)
+
+    def add_entry(self, message_time: float, value: float):
+        self.entries.append((self.entry_count, message_time, value, self.cumulative_sum))
+        self.cumulative_sum += value
+        while self.minimums and self.minimums[-1][1] >= value:
+            self.minimums.pop()
+        self.minimums.append((self.entry_count, value))
+        while self.maximums and self.maximums[-1][1] <= value:
+            self.maximums.pop()
+        self.maximums.append((self.entry_count, value))
+        self.entry_count += 1
+
+    def evict_entries(self, message_time: float):
+        if self.window_type == AggregateWindow.WINDOW_ENTRIES:
+            while len(self.entries) > self.window_value:
+                self.entries.popleft()
+        else:
+            while self.entries and message_time - self.entries[0][1] > self.window_value:
+                self.entries.popleft()
+
+        first_entry_number = self.entries[0][0] if self.entries else self.entry_count
+        while self.minimums and self.minimums[0][0] < first_entry_number:
+            self.minimums.popleft()
+        while self.maximums and self.maximums[0][0] < first_entry_number:
+            self.maximums.popleft()
+
+    def value(self):
+        if not self.entries:
+            return 0.0 if self.function == AggregateWindow.FUNCTION_COUNT else None
+        if self.function == AggregateWindow.FUNCTION_MIN:
+            return self.minimums[0][1]
+        if self.function == AggregateWindow.FUNCTION_MAX:
+            return self.maximums[0][1]
+        window_sum = self.cumulative_sum - self.entries[0][3]
+        if self.function == AggregateWindow.FUNCTION_AVG:
+            return window_sum / len(self.entries)
+        return window_sum
+
+    def add_message(self, operand_values: dict, message_time: float):
+        """
+        Adds the expression's value for a message to the window (unless it can't be evaluated), evicts the
+        entries which fall out of the window and returns the aggregate's value.
+        """
+        arguments = [operand_values[operand] for operand in self.operands]
+        if None not in arguments:
+            try:
+                value = self.expression_function(*arguments)
+                if self.function == AggregateWindow.FUNCTION_COUNT:
+                    value = bool(value)
+                self.add_entry(message_time, float(value))
+            except QueryCondition.EVALUATION_ERRORS:
+                pass
+        self.evict_entries(message_time)
+        return self.value()
+
+    @staticmethod
+    def range_reduce(values: np.ndarray, starts: np.ndarray, ends: np.ndarray, reduce_function) -> np.ndarray:
+        """
+        Reduces (with np.minimum or np.maximum) every non-empty range [start, end) of the values, using a sparse
+        table: level k holds the reductions of all the ranges of length 2^k, and every range is covered by two
+        (overlapping) ranges of the same level.
+        """
+        levels = [values]
+        while 2 ** len(levels) <= len(values):
+            half = 2 ** (len(levels) - 1)
+            levels.append(reduce_function(levels[-1][:-half], levels[-1][half:]))
+
+        result = np.zeros(len(starts))
+        range_levels = np.floor(np.log2(np.maximum(ends - starts, 1))).astype(np.int64)
+        for level in np.unique(range_levels):
+            in_level = range_levels == level
+            level_values = levels[level]
+            result[in_level] = reduce_function(level_values[starts[in_level]],
+                                               level_values[ends[in_level] - 2 ** level])
+        return result
+
+    def evaluate_columns(self, condition: QueryCondition, columns: dict, valid_columns: dict,
+                         times: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Vectorized version of add_message, over all the frames at once; returns the aggregate's values and a mask
+        of the frames in which the aggregate has a value.
+        """
+        frame_count = len(times)
+        values, errors = condition.evaluate_node_columns(self.expression, columns)
+        added = np.ones(frame_count, dtype=bool)
+        for identifier in self.argument_identifiers:
+            added &= valid_columns[identifier]
+        added &= ~np.broadcast_to(errors, (frame_count,))
+
+        values = np.broadcast_to(values, (frame_count,))
+        if self.function == AggregateWindow.FUNCTION_COUNT:
+            values = QueryCondition.column_truth(values)
+        entry_values = QueryCondition.column_number(values[added]).astype(np.float64)
+        entry_times = times[added]
+
+        # every frame's window is the range of entries [window_starts, window_ends)
+        window_ends = np.cumsum(added)
+        if len(entry_values) == 0:
+            window_starts = window_ends
+        elif self.window_type == AggregateWindow.WINDOW_ENTRIES:
+            window_starts = np.maximum(window_ends - int(np.floor(max(self.window_value, 0))), 0)
+        else:
+            window_starts = np.minimum(np.searchsorted(entry_times, times - self.window_value, side="left"),
+                                       window_ends)
+            # make sure the window starts follow the exact comparison used by evict_entries
+            while True:
+                move_back = (window_starts > 0) & \
+                    (times - entry_times[np.maximum(window_starts - 1, 0)] <= self.window_value)
+                move_forward = (window_starts < window_ends) & \
+                    (times - entry_times[np.minimum(window_starts, len(entry_times) - 1)] > self.window_value)
+                if not move_back.any() and not move_forward.any():
+                    break
+                window_starts = window_starts - move_back + move_forward
+
+        window_sizes = window_ends - window_starts
+        non_empty = window_sizes > 0
+        aggregate_values = np.zeros(frame_count)
+        if self.function in (AggregateWindow.FUNCTION_MIN, AggregateWindow.FUNCTION_MAX):
+            reduce_function = np.minimum if self.function == AggregateWindow.FUNCTION_MIN else np.maximum
+            if non_empty.any():
+                aggregate_values[non_empty] = AggregateWindow.range_reduce(entry_values, window_starts[non_empty],
+                                                                           window_ends[non_empty], reduce_function)
+        else:
+            # the same cumulative sums as add_entry, so the results are identical
+            cumulative_sums = np.concatenate(([0.0], np.cumsum(entry_values)))
+            window_sums = cumulative_sums[window_ends] - cumulative_sums[window_starts]
+            if self.function == AggregateWindow.FUNCTION_AVG:
+                aggregate_values[non_empty] = window_sums[non_empty] / window_sizes[non_empty]
+            else:
+                aggregate_values = window_sums
+
+        if self.function == AggregateWindow.FUNCTION_COUNT:
+            return aggregate_values, np.ones(frame_count, dtype=bool)
+        return aggregate_values, non_empty
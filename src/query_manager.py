@@ -1,19 +1,91 @@
+from time import perf_counter_ns
+
+from src import constants
 from src.query import Query
-from tkinter import INSERT, END
+from src.query_condition import MessageOperands
+from src.query_profiler import QueryProfiler
+from src.query_sink import QuerySink
 
 
 class QueryManager:
-    def __init__(self, main_frame):
-        self.main_frame = main_frame
+    """
+    Evaluates all the registered queries for every message, as a single plan: every operand used by any of the
+    queries is read from the message at most once (and only if a clause needs it), and every distinct clause (see
+    QueryCondition) is evaluated at most once per message, no matter how many queries share it. Each query then
+    only updates its own evaluation state from the shared results.
+
+    The aggregate windows (see AggregateWindow) and the spatial operands (see SpatialOperand) are shared the same
+    way: identical aggregates of different queries use a single window, which is updated once per message, and
+    identical spatial operands are computed once per message (from positions arrays built once per message). The
+    players' information, if given, is bound to the queries' spatial operands. Identical clauses of different
+    queries share their timing (see ConditionClause), so every query plans its clauses from measured costs.
+
+    The printed results are passed to a QuerySink (e.g. the UI, a file or a list).
+
+    If a QueryProfiler is given, every query's evaluation is timed and counted; note that a clause shared by
+    multiple queries is only timed for the first query which evaluates it.
+    """
+
+    def __init__(self, query_sink: QuerySink, profiler: QueryProfiler = None, player_info: list = None):
+        self.query_sink = query_sink
+        self.profiler = profiler
+        self.player_info = player_info
         self.queries = []
 
+        # operand -> path in the message, for all the operands used by the registered queries
+        self.operand_paths = {}
+
+        # aggregate key -> window, and spatial operand key -> spatial operand, for all the registered queries
+        self.aggregate_windows = {}
+        self.spatial_operands = {}
+        # clause key -> timing of the clause's sampled evaluations, for all the registered queries
+        self.clause_timings = {}
+
     def add_query(self, query: Query):
         self.queries.append(query)
+        if self.profiler is not None:
+            query.stats = self.profiler.register_query(query)
+        condition = query.compiled_condition
+        for operand, operand_path in zip(condition.operands, condition.operand_paths):
+            self.operand_paths[operand] = operand_path
+        condition.aggregates = [self.aggregate_windows.setdefault(aggregate.key, aggregate)
+                                for aggregate in condition.aggregates]
+        for clause in condition.clauses:
+            clause.timing = self.clause_timings.setdefault(clause.key, clause.timing)
+        if self.player_info is not None:
+            condition.bind_players(self.player_info)
+        for spatial_operand in condition.spatial_operands:
+            self.spatial_operands.setdefault(spatial_operand.key, spatial_operand)
+
+    def get_state(self) -> list:
+        """
+        Returns a snapshot of all the queries' evaluation state (e.g. to be restored when seeking in a replay).
+        """
+        return [query.get_state() for query in self.queries]
+
+    def set_state(self, state: list):
+        for query, query_state in zip(self.queries, state):
+            query.set_state(query_state)
+
+    def add_message(self, message: dict, emit_results: bool = True):
+        """
+        Evaluates all the queries for the given message; the results are passed to the sink only if emit_results
+        is set (otherwise only the queries' state is updated, e.g. while fast-forwarding).
+        """
+        # the operands are only read from the message when a clause (or an aggregate) needs them
+        operand_values = MessageOperands(message, self.operand_paths, self.spatial_operands)
+        message_time = message[constants.FRAME_TIME]
+        for aggregate_key, aggregate in self.aggregate_windows.items():
+            operand_values[aggregate_key] = aggregate.add_message(operand_values, message_time)
 
-    def add_message(self, message: dict):
+        # clause key -> result, shared by all the queries for this message
+        clause_results = {}
         for query in self.queries:
-            result = query.add_message(message)
-            if result is not None:
-                self.main_frame.query_output.config(state="normal")
-                self.main_frame.query_output.insert(INSERT, result + "\n")
-                self.main_frame.query_output.config(state="disabled")
+            start_time = perf_counter_ns() if query.stats is not None else 0
+            condition_result = query.compiled_condition.evaluate_operands(operand_values, clause_results)
+            result = query.apply_condition_result(condition_result, message_time)
+            if query.stats is not None:
+                query.stats.add_evaluation(perf_counter_ns() - start_time, condition_result,
+                                           result is not None and condition_result == Query.CONDITION_CORRECT)
+            if result is not None and emit_results:
+                self.query_sink.add_result(message_time, result)
@@ -0,0 +1,171 @@
+import json
+from bisect import bisect_right
+
+from src.query_condition import QueryCondition
+
+
+class TimingHistogram:
+    """
+    Counts timings (in nanoseconds) in logarithmic buckets, along with their total and maximum; recording a timing
+    is a binary search over the bucket bounds, so it is cheap enough to be done for every query and frame.
+    """
+
+    # the upper bounds of the buckets, in microseconds (the last bucket holds everything above the last bound)
+    BUCKET_BOUNDS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+    BUCKET_BOUNDS_NS = tuple(bound * 1000 for bound in BUCKET_BOUNDS_US)
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.bucket_counts = [0] * (len(TimingHistogram.BUCKET_BOUNDS_NS) + 1)
+
+    def add(self, duration_ns: int):
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.bucket_counts[bisect_right(TimingHistogram.BUCKET_BOUNDS_NS, duration_ns)] += 1
+
+    def mean_us(self) -> float:
+        return self.total_ns / self.count / 1000 if self.count else 0
+
+    def to_dict(self) -> dict:
+        bucket_labels = ["<" + str(bound) + "us" for bound in TimingHistogram.BUCKET_BOUNDS_US]
+        bucket_labels.append(">=" + str(TimingHistogram.BUCKET_BOUNDS_US[-1]) + "us")
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.mean_us(),
+            "max_us": self.max_ns / 1000,
+            "histogram": dict(zip(bucket_labels, self.bucket_counts)),
+        }
+
+
+class QueryStats:
+    """
+    The profiling statistics of a single query: its evaluation time histogram and the results of its condition,
+    along with the plan of the condition's clauses (see QueryCondition.explain), if it has more than one.
+    """
+
+    def __init__(self, name: str, condition: QueryCondition = None):
+        self.name = name
+        self.condition = condition
+        self.evaluation_times = TimingHistogram()
+        self.condition_results = {
+            QueryCondition.CORRECT: 0,
+            QueryCondition.INCORRECT: 0,
+            QueryCondition.INCOMPLETE: 0,
+            QueryCondition.ERROR: 0,
+        }
+        # the number of times the query printed its message
+        self.hits = 0
+
+    def add_evaluation(self, duration_ns: int, condition_result: str, printed: bool):
+        self.evaluation_times.add(duration_ns)
+        self.condition_results[condition_result] += 1
+        if printed:
+            self.hits += 1
+
+    def add_timeline(self, query_timeline, cached: bool):
+        """
+        Adds the statistics of a query evaluated over the whole replay at once (see QueryTimeline): its evaluation
+        time is recorded as a single sample (0 if the timeline was cached).
+        """
+        self.evaluation_times.add(0 if cached else query_timeline.evaluation_ns)
+        for condition_result, count in query_timeline.condition_results.items():
+            self.condition_results[condition_result] += count
+        self.hits += len(query_timeline.printed_frames)
+
+    def explain(self) -> str:
+        if self.condition is None or len(self.condition.clauses) < 2:
+            return None
+        return self.condition.explain()
+
+    def to_dict(self) -> dict:
+        return {
+            "query": self.name,
+            "hits": self.hits,
+            "condition_results": dict(self.condition_results),
+            "evaluation_time": self.evaluation_times.to_dict(),
+            "clause_plan": self.explain(),
+        }
+
+
+class QueryProfiler:
+    """
+    Collects the profiling statistics of a replay run: the statistics of every query (see QueryStats), the time
+    spent per frame in every stage of the playback (reading the frame from the frame table, evaluating the
+    queries and drawing) and the playback lag (how far behind the replay clock the drawn frames are).
+
+    The statistics can be shown as text (e.g. in the UI) or dumped as json.
+    """
+
+    STAGE_EXTRACTION = "extraction"
+    STAGE_EVALUATION = "evaluation"
+    STAGE_RENDERING = "rendering"
+    STAGES = (STAGE_EXTRACTION, STAGE_EVALUATION, STAGE_RENDERING)
+
+    def __init__(self):
+        self.query_stats = []
+        self.stage_times = {stage: TimingHistogram() for stage in QueryProfiler.STAGES}
+        self.lag_count = 0
+        self.total_lag = 0
+        self.max_lag = 0
+        self.last_lag = 0
+
+    def register_query(self, query) -> QueryStats:
+        query_stats = QueryStats("#" + str(len(self.query_stats) + 1) + " " + query.print_string,
+                                 query.compiled_condition)
+        self.query_stats.append(query_stats)
+        return query_stats
+
+    def add_stage_time(self, stage: str, duration_ns: int):
+        self.stage_times[stage].add(duration_ns)
+
+    def add_lag(self, lag: float):
+        self.lag_count += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_lag = lag
+
+    def to_dict(self) -> dict:
+        return {
+            "queries": [query_stats.to_dict() for query_stats in self.query_stats],
+            "frame_stages": {stage: stage_times.to_dict() for stage, stage_times in self.stage_times.items()},
+            "playback_lag": {
+                "samples": self.lag_count,
+                "mean_ms": self.total_lag / self.lag_count * 1000 if self.lag_count else 0,
+                "max_ms": self.max_lag * 1000,
+                "last_ms": self.last_lag * 1000,
+            },
+        }
+
+    def dump(self, file_name: str):
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format_summary(self) -> str:
+        """
+        Returns the statistics as text, with the slowest queries first.
+        """
+        lines = ["PLAYBACK LAG: last " + str(round(self.last_lag * 1000, 1)) + " ms, max "
+                 + str(round(self.max_lag * 1000, 1)) + " ms", "", "PER FRAME (mean / max):"]
+        for stage, stage_times in self.stage_times.items():
+            lines.append("  " + stage + ": " + str(round(stage_times.mean_us(), 1)) + " us / "
+                         + str(round(stage_times.max_ns / 1000, 1)) + " us")
+
+        lines.append("")
+        lines.append("QUERIES (by total time):")
+        for query_stats in sorted(self.query_stats, key=lambda stats: stats.evaluation_times.total_ns, reverse=True):
+            evaluation_times = query_stats.evaluation_times
+            lines.append(query_stats.name)
+            lines.append("  total " + str(round(evaluation_times.total_ns / 1e6, 1)) + " ms, mean "
+                         + str(round(evaluation_times.mean_us(), 1)) + " us, max "
+                         + str(round(evaluation_times.max_ns / 1000, 1)) + " us")
+            lines.append("  hits " + str(query_stats.hits) + ", " + ", ".join(
+                result.lower() + " " + str(count) for result, count in query_stats.condition_results.items()))
+            clause_plan = query_stats.explain()
+            if clause_plan is not None:
+                lines.extend("  " + line for line in clause_plan.split("\n"))
+        return "\n".join(lines)
@@ -0,0 +1,127 @@
+import json
+import queue
+import sys
+from abc import ABC, abstractmethod
+from tkinter import END
+
+import src.constants as constants
+
+
+class QuerySink(ABC):
+    """
+    Receives the results printed by the queries (see QueryManager), along with the time of the message which
+    triggered them.
+    """
+
+    @abstractmethod
+    def add_result(self, message_time: float, result: str):
+        pass
+
+    def clear(self):
+        """
+        Forgets the results received so far (e.g. when the replay is restarted); does nothing by default.
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class ListQuerySink(QuerySink):
+    """
+    Keeps the results in memory, as a list of (time, result) tuples.
+    """
+
+    def __init__(self):
+        self.results = []
+
+    def add_result(self, message_time: float, result: str):
+        self.results.append((message_time, result))
+
+    def clear(self):
+        self.results = []
+
+
+class StdoutQuerySink(QuerySink):
+    def __init__(self, output=None):
+        self.output = output if output is not None else sys.stdout
+
+    def add_result(self, message_time: float, result: str):
+        self.output.write(str(message_time) + "\t" + result + "\n")
+
+    def close(self):
+        self.output.flush()
+
+
+class JsonLinesQuerySink(QuerySink):
+    """
+    Writes every result as a json object on its own line: {"time": ..., "message": ...}.
+    """
+
+    def __init__(self, file_name: str):
+        self.output_file = open(file_name, "w")
+
+    def add_result(self, message_time: float, result: str):
+        self.output_file.write(json.dumps({constants.FRAME_TIME: message_time, "message": result}) + "\n")
+
+    def close(self):
+        self.output_file.close()
+
+
+class TkQuerySink(QuerySink):
+    """
+    Shows the results in a Tk text widget. Tk is not thread-safe, so the results (which can come from any thread)
+    are only put in a queue; the queue is emptied periodically from the Tk main loop (through 'after'), and all
+    the results received since the last flush are inserted in the widget with a single update.
+    """
+
+    FLUSH_INTERVAL_MS = 50
+
+    # queued instead of a result when the widget should be cleared
+    CLEAR = object()
+
+    def __init__(self, text_widget):
+        self.text_widget = text_widget
+        self.results = queue.Queue()
+        self.flush_job = None
+
+    def start(self):
+        """
+        Starts flushing the results periodically; it must be called from the Tk main loop thread.
+        """
+        self.flush()
+
+    def add_result(self, message_time: float, result: str):
+        self.results.put(result)
+
+    def clear(self):
+        self.results.put(TkQuerySink.CLEAR)
+
+    def flush(self):
+        pending_text = []
+        clear_widget = False
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result is TkQuerySink.CLEAR:
+                clear_widget = True
+                pending_text = []
+            else:
+                pending_text.append(result + "\n")
+
+        if clear_widget or pending_text:
+            self.text_widget.config(state="normal")
+            if clear_widget:
+                self.text_widget.delete("1.0", END)
+            self.text_widget.insert(END, "".join(pending_text))
+            self.text_widget.see(END)
+            self.text_widget.config(state="disabled")
+
+        self.flush_job = self.text_widget.after(TkQuerySink.FLUSH_INTERVAL_MS, self.flush)
+
+    def close(self):
+        if self.flush_job is not None:
+            self.text_widget.after_cancel(self.flush_job)
+            self.flush_job = None
@@ -0,0 +1,166 @@
+import ast
+import bisect
+from collections import OrderedDict
+from threading import Event, Thread
+from time import perf_counter_ns
+
+import numpy as np
+
+import src.constants as constants
+from src.frame_table import FrameTable
+from src.offline_query_engine import evaluate_query_frames, merge_query_frames
+from src.query import Query
+from src.query_condition import QueryCondition
+from src.query_profiler import QueryProfiler
+
+
+class QueryTimeline:
+    """
+    The events printed by a single query over a whole replay (the indices of the frames at which it prints its
+    message, and of the frames at which its condition cannot be evaluated), computed at once by the offline query
+    engine, along with the number of frames of every condition result and the time the evaluation took.
+    """
+
+    def __init__(self, printed_frames: np.ndarray, error_frames: np.ndarray, condition_results: dict,
+                 evaluation_ns: int):
+        self.printed_frames = printed_frames
+        self.error_frames = error_frames
+        self.condition_results = condition_results
+        self.evaluation_ns = evaluation_ns
+
+    @classmethod
+    def evaluate(cls, query: Query, frame_table: FrameTable):
+        start_time = perf_counter_ns()
+        correct, incomplete, errors = query.compiled_condition.evaluate_columns(frame_table)
+        printed_frames, error_frames = evaluate_query_frames(query, frame_table, (correct, incomplete, errors))
+
+        error_count = int(np.count_nonzero(errors))
+        incomplete_count = int(np.count_nonzero(incomplete & ~errors))
+        correct_count = int(np.count_nonzero(correct & ~incomplete & ~errors))
+        condition_results = {
+            QueryCondition.CORRECT: correct_count,
+            QueryCondition.INCORRECT: len(frame_table) - correct_count - incomplete_count - error_count,
+            QueryCondition.INCOMPLETE: incomplete_count,
+            QueryCondition.ERROR: error_count,
+        }
+        return cls(printed_frames, error_frames, condition_results, perf_counter_ns() - start_time)
+
+
+class EventTimeline:
+    """
+    The events printed by a set of queries over a whole replay, merged in the order they are printed while the
+    replay is played (see offline_query_engine.merge_query_frames), so the replay can be played (and seeked) without
+    evaluating the queries: the events of a frame are simply looked up when the frame is played.
+    """
+
+    def __init__(self, query_timelines: list, queries: list):
+        self.frame_indices, self.messages = merge_query_frames(
+            [(query_timeline.printed_frames, query_timeline.error_frames, query.print_string)
+             for query_timeline, query in zip(query_timelines, queries)])
+        self.frame_indices = self.frame_indices.tolist()
+
+    def first_event_at(self, frame_index: int) -> int:
+        """
+        Returns the index of the first event printed at or after the given frame.
+        """
+        return bisect.bisect_left(self.frame_indices, frame_index)
+
+    def __len__(self):
+        return len(self.frame_indices)
+
+
+class QueryTimelineCache:
+    """
+    Memoizes the timelines of the queries (see QueryTimeline) by replay and by normalized query: after the queries
+    are edited, only the new or changed ones are evaluated again, and the timelines of the others are reused.
+
+    A query is normalized as its parsed form (the condition's expression, the time window, the message and the
+    delay), so changes in its spacing or in the keywords' case don't make it a new query. The least recently used
+    timelines are evicted when the cache holds more than max_size timelines.
+    """
+
+    def __init__(self, max_size: int = constants.QUERY_TIMELINE_CACHE_SIZE):
+        self.max_size = max_size
+        # (replay id, normalized query) -> timeline, from the least to the most recently used
+        self.timelines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_query(query: Query) -> str:
+        return "\n".join((ast.unparse(query.compiled_condition.expression),
+                          str(query.time_window_value) + " " + query.time_window_type,
+                          query.print_string, str(query.delay)))
+
+    def get_timeline(self, replay_id: str, query: Query, frame_table: FrameTable) -> (QueryTimeline, bool):
+        """
+        Returns the query's timeline over the replay, and whether it was cached; nothing is cached without a
+        replay id.
+        """
+        if replay_id is None:
+            self.misses += 1
+            return QueryTimeline.evaluate(query, frame_table), False
+
+        key = (replay_id, QueryTimelineCache.normalize_query(query))
+        query_timeline = self.timelines.get(key, None)
+        if query_timeline is not None:
+            self.hits += 1
+            self.timelines.move_to_end(key)
+            return query_timeline, True
+
+        self.misses += 1
+        query_timeline = QueryTimeline.evaluate(query, frame_table)
+        self.timelines[key] = query_timeline
+        while len(self.timelines) > self.max_size:
+            self.timelines.popitem(last=False)
+        return query_timeline, False
+
+    def build_event_timeline(self, replay_id: str, queries: list, frame_table: FrameTable, player_info: list = None,
+                             profiler: QueryProfiler = None) -> EventTimeline:
+        """
+        Returns the merged timeline of the queries over the replay, evaluating only the queries which are not
+        cached yet. The replay id must identify the replay's frames (e.g. the hash of the replay file); if it is
+        None, the timelines are neither taken from the cache nor stored in it. If a profiler is given, every query's
+        statistics are filled in from its timeline.
+        """
+        query_timelines = []
+        for query in queries:
+            if player_info is not None:
+                query.compiled_condition.bind_players(player_info)
+            query_timeline, cached = self.get_timeline(replay_id, query, frame_table)
+            query_timelines.append(query_timeline)
+            if profiler is not None:
+                profiler.register_query(query).add_timeline(query_timeline, cached)
+        return EventTimeline(query_timelines, queries)
+
+
+class EventTimelineBuilder:
+    """
+    Builds the event timeline of a set of queries (see QueryTimelineCache.build_event_timeline) in a background
+    thread, so the UI stays responsive while the queries are evaluated over the whole replay; the UI polls
+    is_complete, and then reads the event timeline, or the exception raised while building it.
+    """
+
+    def __init__(self, query_timeline_cache: QueryTimelineCache, replay_id: str, queries: list,
+                 frame_table: FrameTable, player_info: list = None, profiler: QueryProfiler = None):
+        self.event_timeline = None
+        self.error = None
+        self.done = Event()
+        self.thread = Thread(target=self.build, daemon=True,
+                             args=(query_timeline_cache, replay_id, queries, frame_table, player_info, profiler))
+
+    def start(self):
+        self.thread.start()
+
+    def build(self, query_timeline_cache: QueryTimelineCache, replay_id: str, queries: list,
+              frame_table: FrameTable, player_info: list, profiler: QueryProfiler):
+        try:
+            self.event_timeline = query_timeline_cache.build_event_timeline(replay_id, queries, frame_table,
+                                                                            player_info, profiler)
+        except Exception as exception:
+            self.error = exception
+        finally:
+            self.done.set()
+
+    def is_complete(self) -> bool:
+        return self.done.is_set()
@@ -0,0 +1,133 @@
+"""
+Converts json replays to compressed frame archives (see frame_archive), which hold only the extracted frames and
+game events, at a fraction of the json's size; the archives can be used anywhere a replay file is expected (the
+UI, the batch analysis, the corpus index). An archive's block index can also be printed, along with the frames of
+a time range.
+
+Usage examples:
+    python -m src.replay_archiver convert "replaysJson/*.json" --output-dir replaysArchive --workers 8
+    python -m src.replay_archiver info replaysArchive/replay.rla --start 60 --end 65
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.frame_archive import FrameArchive, write_archive
+from src.replay_files import find_replay_files, report_progress
+
+
+def archive_file_name(replay_file: str, output_directory: str = None) -> str:
+    """
+    Returns the archive's file name: the replay's file name with the archive extension, in the output directory
+    (the replay's directory if None).
+    """
+    if output_directory is None:
+        output_directory = os.path.dirname(replay_file)
+    return os.path.join(output_directory,
+                        os.path.splitext(os.path.basename(replay_file))[0] + constants.ARCHIVE_EXTENSION)
+
+
+def convert_replay(replay_file: str, archive_file: str) -> (int, int):
+    """
+    Extracts a json replay and writes it as a frame archive; returns the sizes of the replay and of the archive,
+    in bytes.
+    """
+    player_info, frame_table = replay_parser.read_replay(replay_file)
+    write_archive(archive_file, player_info, frame_table)
+    return os.path.getsize(replay_file), os.path.getsize(archive_file)
+
+
+def convert_replays(replay_files: list, output_directory: str = None, workers: int = None,
+                    show_progress: bool = True) -> (int, int, int):
+    """
+    Converts the replays on a pool of worker processes; returns the number of failed replays, and the total sizes
+    of the converted replays and of their archives.
+    """
+    failed_replays = 0
+    total_replay_size = 0
+    total_archive_size = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_replay, replay_file, archive_file_name(replay_file, output_directory)):
+                   replay_file for replay_file in replay_files}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            replay_file = futures[future]
+            try:
+                replay_size, archive_size = future.result()
+                total_replay_size += replay_size
+                total_archive_size += archive_size
+                status = str(replay_size) + " -> " + str(archive_size) + " bytes"
+            except Exception as exception:
+                failed_replays += 1
+                status = "failed: " + repr(exception)
+            if show_progress:
+                report_progress(done_count, len(replay_files), replay_file, status)
+    return failed_replays, total_replay_size, total_archive_size
+
+
+def print_archive_info(archive_file: str, start_time: float = None, end_time: float = None):
+    """
+    Prints the archive's players and block index, and the frames between the given times (if any is given), as
+    json lines.
+    """
+    frame_archive = FrameArchive(archive_file)
+    print(str(len(frame_archive)) + " frames, " + str(frame_archive.player_count) + " players, "
+          + str(len(frame_archive.events)) + " events, " + str(frame_archive.block_count) + " blocks")
+    for player in frame_archive.player_info:
+        print("  " + player[constants.STORED_PLAYER_NAME] + " (" + player[constants.STORED_PLAYER_TEAM] + ")")
+    for block in frame_archive.block_index:
+        print("  block: frames " + str(block["first_frame"]) + "+" + str(block["frame_count"]) + ", "
+              + str(block["start_time"]) + "s - " + str(block["end_time"]) + "s, " + str(block["size"]) + " bytes")
+    if start_time is not None or end_time is not None:
+        for frame in frame_archive.iterate_frames(start_time, end_time):
+            print(json.dumps(frame))
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Convert json replays to compressed frame archives.")
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert json replays to frame archives")
+    convert_parser.add_argument("replays", nargs="+",
+                                help="replay files or glob patterns (e.g. 'replaysJson/*.json')")
+    convert_parser.add_argument("-o", "--output-dir", default=None,
+                                help="directory of the archives (default: next to the replays)")
+    convert_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                                help="number of worker processes (default: the number of CPUs)")
+    convert_parser.add_argument("-q", "--quiet", action="store_true", help="don't report the progress")
+
+    info_parser = subparsers.add_parser("info", help="print an archive's block index, and the frames of a range")
+    info_parser.add_argument("archive", help="the frame archive")
+    info_parser.add_argument("--start", type=float, default=None, help="print the frames from this time (seconds)")
+    info_parser.add_argument("--end", type=float, default=None, help="print the frames up to this time (seconds)")
+    arguments = argument_parser.parse_args(arguments)
+
+    if arguments.command == "info":
+        try:
+            print_archive_info(arguments.archive, arguments.start, arguments.end)
+        except (OSError, ValueError) as exception:
+            print(str(exception), file=sys.stderr)
+            return 2
+        return 0
+
+    replay_files = find_replay_files(arguments.replays)
+    if not replay_files:
+        print("No replay files found.", file=sys.stderr)
+        return 2
+    if arguments.output_dir is not None:
+        os.makedirs(arguments.output_dir, exist_ok=True)
+    failed_replays, total_replay_size, total_archive_size = convert_replays(
+        replay_files, arguments.output_dir, arguments.workers, not arguments.quiet)
+    if not arguments.quiet:
+        ratio = total_replay_size / total_archive_size if total_archive_size else 0
+        print("Converted " + str(len(replay_files) - failed_replays) + " replays, " + str(failed_replays)
+              + " failed; " + str(total_replay_size) + " -> " + str(total_archive_size) + " bytes ("
+              + str(round(ratio, 1)) + "x smaller).", file=sys.stderr)
+    return 1 if failed_replays else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
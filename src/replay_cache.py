@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import src.constants as constants
+from src.event_table import EventTable
+from src.frame_table import FrameTable
+
+
+class ReplayCache:
+    """
+    A persistent cache of extracted replays, so a replay is only parsed and extracted the first time it is loaded.
+
+    Every cached replay is a directory named after the hash of the replay file's content and the cache format
+    version; it holds the frame table's columns as .npy files (which are memory mapped when loaded), the game
+    events detected in the replay (also as .npy files) and the players' information as json. The directories'
+    modification times are updated on every hit, and the least recently used replays are evicted when the cache
+    grows over its maximum size.
+    """
+
+    PLAYER_INFO_FILE_NAME = "player_info.json"
+    HASH_READ_SIZE = 1 << 20
+
+    def __init__(self, cache_directory: str = constants.REPLAY_CACHE_DIRECTORY,
+                 max_size: int = constants.REPLAY_CACHE_MAX_SIZE):
+        self.cache_directory = cache_directory
+        self.max_size = max_size
+
+    @staticmethod
+    def replay_hash(file_name: str) -> str:
+        replay_hash = hashlib.sha256()
+        with open(file_name, "rb") as f:
+            for chunk in iter(lambda: f.read(ReplayCache.HASH_READ_SIZE), b""):
+                replay_hash.update(chunk)
+        return replay_hash.hexdigest()
+
+    def entry_directory(self, replay_hash: str) -> str:
+        return os.path.join(self.cache_directory,
+                            replay_hash + "-v" + str(constants.REPLAY_CACHE_FORMAT_VERSION))
+
+    def load(self, replay_hash: str):
+        """
+        Returns the cached players' information and frame table of a replay, or None if it is not cached.
+        """
+        entry_directory = self.entry_directory(replay_hash)
+        try:
+            with open(os.path.join(entry_directory, ReplayCache.PLAYER_INFO_FILE_NAME), "r") as f:
+                player_info = json.load(f)
+            frame_table = FrameTable.load(entry_directory)
+            frame_table.events = EventTable.load(entry_directory)
+        except (OSError, ValueError):
+            return None
+
+        # mark the replay as recently used
+        os.utime(entry_directory)
+        return player_info, frame_table
+
+    def store(self, replay_hash: str, player_info: list, frame_table: FrameTable):
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        # write the replay in a temporary directory first, so a half written replay is never loaded
+        temporary_directory = tempfile.mkdtemp(dir=self.cache_directory, prefix=".")
+        try:
+            with open(os.path.join(temporary_directory, ReplayCache.PLAYER_INFO_FILE_NAME), "w") as f:
+                json.dump(player_info, f)
+            frame_table.save(temporary_directory)
+            if frame_table.events is not None:
+                frame_table.events.save(temporary_directory)
+            os.replace(temporary_directory, self.entry_directory(replay_hash))
+        except OSError:
+            # another process may have cached the same replay in the meantime
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.evict()
+
+    @staticmethod
+    def directory_size(directory: str) -> int:
+        size = 0
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                size += entry.stat().st_size
+        return size
+
+    def evict(self):
+        """
+        Removes the least recently used replays, until the cache fits in its maximum size.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_directory):
+            if entry.is_dir() and not entry.name.startswith("."):
+                try:
+                    entries.append((entry.stat().st_mtime, ReplayCache.directory_size(entry.path), entry.path))
+                except OSError:
+                    continue
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
@@ -0,0 +1,27 @@
+import glob
+import os
+import sys
+import time
+
+
+def find_replay_files(patterns: list) -> list:
+    """
+    Returns the sorted paths of the files matching any of the given paths or glob patterns (e.g.
+    'replaysJson/**/*.json'), without duplicates.
+    """
+    replay_files = set()
+    for pattern in patterns:
+        replay_files.update(glob.glob(pattern, recursive=True))
+    return sorted(replay_file for replay_file in replay_files if os.path.isfile(replay_file))
+
+
+def report_progress(done_count: int, total_count: int, replay_file: str, status: str, start_time: float = None):
+    """
+    Reports the progress of a command line tool going through replay files on the standard error: the number of
+    replays done so far, the replay just done and its status, and the time elapsed since start_time (a
+    time.perf_counter value), if given.
+    """
+    progress = "[" + str(done_count) + "/" + str(total_count) + "] " + replay_file + " - " + status
+    if start_time is not None:
+        progress += " (" + str(round(time.perf_counter() - start_time, 1)) + "s)"
+    print(progress, file=sys.stderr)
@@ -0,0 +1,167 @@
+"""
+Position heatmaps: occupancy grids of the ball, of every player and of both teams over a whole replay, at several
+resolutions (see HEATMAP_CELL_SIZES in constants), built with one 2D histogram per grid over the frame table's
+columns. The grids are shown as an overlay of the field in the UI (see replay_renderer.HeatmapOverlay), and can be
+exported as a .npz file (one array per grid, named entity@cell_size, e.g. ball@256 or player.3@128).
+
+Usage examples:
+    python -m src.replay_heatmaps replaysJson/example.json --output heatmaps.npz
+    python -m src.replay_heatmaps replaysArchive/replay.rla --output heatmaps.npz --cell-size 128
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.frame_archive import is_archive_file
+from src.frame_table import FrameTable
+from src.replay_cache import ReplayCache
+from src.spatial import TEAM_BLUE, TEAM_ORANGE
+
+BALL = "ball"
+
+
+def valid_positions(x: np.ndarray, y: np.ndarray, valid: np.ndarray, weights: np.ndarray) -> tuple:
+    # the positions past the field's bounds (inside the goals) are counted in the border cells
+    return (np.clip(x[valid], constants.MIN_X, constants.MAX_X), np.clip(y[valid], constants.MIN_Y, constants.MAX_Y),
+            weights[valid])
+
+
+class ReplayHeatmaps:
+    """
+    The occupancy grids of a replay: for every cell size and every entity (ball, player.N, orange and blue), the
+    time (in seconds) the entity spent in every cell of the field. Every position is weighted by the duration of
+    its frame (the time until the next frame), so the grids don't depend on the replay's frame rate.
+
+    The grids are in the frames' coordinates: grid[i, j] is the cell between the i-th and (i + 1)-th x edges and
+    the j-th and (j + 1)-th y edges (see cell_edges).
+    """
+
+    def __init__(self, grids: dict):
+        # (cell size, entity) -> grid
+        self.grids = grids
+
+    @staticmethod
+    def cell_edges(cell_size: int) -> (np.ndarray, np.ndarray):
+        x_cells = -(-constants.LENGTH_X // cell_size)
+        y_cells = -(-constants.LENGTH_Y // cell_size)
+        return (np.linspace(constants.MIN_X, constants.MAX_X, x_cells + 1),
+                np.linspace(constants.MIN_Y, constants.MAX_Y, y_cells + 1))
+
+    @staticmethod
+    def entities(player_info: list) -> list:
+        return [BALL, TEAM_ORANGE, TEAM_BLUE] + ["player." + str(player_index + 1)
+                                                  for player_index in range(len(player_info))]
+
+    @staticmethod
+    def grid_key(cell_size: int, entity: str) -> str:
+        return entity + "@" + str(cell_size)
+
+    @classmethod
+    def from_frame_table(cls, frame_table: FrameTable, player_info: list,
+                         cell_sizes: tuple = constants.HEATMAP_CELL_SIZES):
+        times = frame_table.time
+        durations = np.diff(times, append=times[-1:])
+        player_durations = np.broadcast_to(durations[:, np.newaxis], frame_table.player_x.shape)
+        orange_players = np.array([player[constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1
+                                   for player in player_info], dtype=bool)
+
+        # entity -> (x, y, weights) of its known positions
+        positions = {BALL: valid_positions(frame_table.ball_x, frame_table.ball_y, frame_table.ball_valid, durations)}
+        for team, team_players in ((TEAM_ORANGE, orange_players), (TEAM_BLUE, ~orange_players)):
+            positions[team] = valid_positions(frame_table.player_x[:, team_players],
+                                              frame_table.player_y[:, team_players],
+                                              frame_table.player_valid[:, team_players],
+                                              player_durations[:, team_players])
+        for player_index in range(len(player_info)):
+            positions["player." + str(player_index + 1)] = valid_positions(
+                frame_table.player_x[:, player_index], frame_table.player_y[:, player_index],
+                frame_table.player_valid[:, player_index], durations)
+
+        grids = {}
+        for cell_size in cell_sizes:
+            bins = ReplayHeatmaps.cell_edges(cell_size)
+            for entity, (x, y, weights) in positions.items():
+                grids[(cell_size, entity)] = np.histogram2d(x, y, bins=bins, weights=weights)[0]
+        return cls(grids)
+
+    def grid(self, cell_size: int, entity: str) -> np.ndarray:
+        return self.grids[(cell_size, entity)]
+
+    def save(self, file_name: str):
+        # written in a temporary file first, so a half written file is never loaded
+        temporary_file_name = file_name + ".tmp"
+        with open(temporary_file_name, "wb") as f:
+            np.savez(f, **{ReplayHeatmaps.grid_key(cell_size, entity): grid
+                           for (cell_size, entity), grid in self.grids.items()})
+        os.replace(temporary_file_name, file_name)
+
+    @classmethod
+    def load(cls, file_name: str, player_info: list, cell_sizes: tuple = constants.HEATMAP_CELL_SIZES):
+        """
+        Loads the grids saved in a file; raises a KeyError if any grid is missing (e.g. if the file was saved with
+        other cell sizes).
+        """
+        with np.load(file_name) as grids_file:
+            return cls({(cell_size, entity): grids_file[ReplayHeatmaps.grid_key(cell_size, entity)]
+                        for cell_size in cell_sizes for entity in ReplayHeatmaps.entities(player_info)})
+
+
+def load_heatmaps(frame_table: FrameTable, player_info: list, replay_cache: ReplayCache = None,
+                  replay_hash: str = None) -> ReplayHeatmaps:
+    """
+    Returns the heatmaps of a whole replay. If the replay is in the replay cache, the heatmaps are kept in its
+    entry: they are only computed the first time, and loaded afterwards.
+    """
+    heatmaps_file = None
+    if replay_cache is not None and replay_hash is not None:
+        heatmaps_file = os.path.join(replay_cache.entry_directory(replay_hash), constants.HEATMAP_FILE_NAME)
+        try:
+            return ReplayHeatmaps.load(heatmaps_file, player_info)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    heatmaps = ReplayHeatmaps.from_frame_table(frame_table, player_info)
+    # the entry may not exist (e.g. if the replay couldn't be stored, or was evicted)
+    if heatmaps_file is not None and os.path.isdir(os.path.dirname(heatmaps_file)):
+        try:
+            heatmaps.save(heatmaps_file)
+        except OSError:
+            pass
+    return heatmaps
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Export the position heatmaps of a replay.")
+    argument_parser.add_argument("replay", help="the replay file (json or frame archive)")
+    argument_parser.add_argument("-o", "--output", required=True, help="the .npz file the grids are written to")
+    argument_parser.add_argument("-s", "--cell-size", type=int, action="append", default=None,
+                                 help="the size of the cells in game units, can be repeated (default: "
+                                      + ", ".join(str(cell_size) for cell_size in constants.HEATMAP_CELL_SIZES) + ")")
+    argument_parser.add_argument("-c", "--cache-dir", default=None,
+                                 help="directory in which the extracted replays are cached (default: no cache)")
+    arguments = argument_parser.parse_args(arguments)
+
+    replay_cache = ReplayCache(arguments.cache_dir) if arguments.cache_dir is not None else None
+    try:
+        player_info, frame_table = replay_parser.load_replay(arguments.replay, replay_cache)
+    except (OSError, ValueError) as exception:
+        print(str(exception), file=sys.stderr)
+        return 2
+    if arguments.cell_size is None:
+        # frame archives are never cached
+        replay_hash = None
+        if replay_cache is not None and not is_archive_file(arguments.replay):
+            replay_hash = ReplayCache.replay_hash(arguments.replay)
+        heatmaps = load_heatmaps(frame_table, player_info, replay_cache, replay_hash)
+    else:
+        heatmaps = ReplayHeatmaps.from_frame_table(frame_table, player_info, tuple(arguments.cell_size))
+    heatmaps.save(arguments.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+from itertools import chain, count
+from threading import Event, Thread
+
+import src.replay_parser as replay_parser
+from src.event_table import EventDetector
+from src.frame_archive import is_archive_file, load_archive
+from src.frame_table import FrameTable
+from src.replay_cache import ReplayCache
+
+
+class ReplayLoader:
+    """
+    Loads a replay progressively, so the UI can come up (and the replay can start playing) before the whole
+    replay is extracted: start() only reads the first frame (for the players' information and the initial
+    positions), and the remaining frames are extracted by a background thread, which appends them to the frame
+    table as they are read. The frame table only grows, so the playback can read the frames extracted so far
+    at any time (see ReplayPlayer, which waits when it catches up with the extraction).
+
+    If the replay is already in the replay cache, or if it is a frame archive (see frame_archive), it is loaded at
+    once.
+
+    Every loader has a load id, which is never reused in the session, so the frames it loads can be told apart
+    from the frames of any other load even without the replay's hash (e.g. by the QueryTimelineCache).
+    """
+
+    load_ids = count(1)
+
+    def __init__(self, file_name: str, replay_cache: ReplayCache = None):
+        self.file_name = file_name
+        self.replay_cache = replay_cache
+        self.load_id = next(ReplayLoader.load_ids)
+        self.replay_hash = None
+        self.player_info = None
+        self.extracted_frames = None
+
+        # the exception raised while extracting the frames in the background, if any
+        self.error = None
+        self.done = Event()
+        self.thread = None
+
+    def start(self) -> (list, FrameTable):
+        """
+        Returns the players' information and the frame table, which only holds the first frame until the
+        background extraction catches up.
+        """
+        if is_archive_file(self.file_name):
+            self.player_info, self.extracted_frames = load_archive(self.file_name)
+            self.done.set()
+            return self.player_info, self.extracted_frames
+
+        if self.replay_cache is not None:
+            self.replay_hash = ReplayCache.replay_hash(self.file_name)
+            cached_replay = self.replay_cache.load(self.replay_hash)
+            if cached_replay is not None:
+                self.player_info, self.extracted_frames = cached_replay
+                self.done.set()
+                return cached_replay
+
+        replay_frames = replay_parser.read_replay_frames(self.file_name)
+        first_frame = next(replay_frames)
+        self.player_info = replay_parser.extract_player_info(first_frame)
+        # the events are detected along with the frames, so they also grow while the frames are extracted
+        event_detector = EventDetector(self.player_info)
+        extracted_frames = replay_parser.iterate_extracted_frames(chain([first_frame], replay_frames),
+                                                                  self.player_info, event_detector=event_detector)
+        self.extracted_frames = FrameTable(len(self.player_info))
+        self.extracted_frames.events = event_detector.events
+        self.extracted_frames.append_frame(next(extracted_frames))
+
+        self.thread = Thread(target=self.extract_remaining_frames, args=(extracted_frames,), daemon=True)
+        self.thread.start()
+        return self.player_info, self.extracted_frames
+
+    def extract_remaining_frames(self, extracted_frames):
+        try:
+            for extracted_frame in extracted_frames:
+                self.extracted_frames.append_frame(extracted_frame)
+            if self.replay_cache is not None:
+                self.replay_cache.store(self.replay_hash, self.player_info, self.extracted_frames)
+        except Exception as exception:
+            self.error = exception
+        finally:
+            self.done.set()
+
+    def is_complete(self) -> bool:
+        return self.done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
@@ -1,73 +1,215 @@
 import json
-from time import sleep
+import sys
+from itertools import chain
 from tkinter import messagebox, END
 
 import src.constants as constants
+from src.event_table import EventDetector
+from src.frame_archive import is_archive_file, load_archive
+from src.frame_table import FrameTable
 from src.query import Query
 from src.query_manager import QueryManager
 from src.query_parse_exception import QueryParseException
+from src.query_profiler import QueryProfiler
+from src.query_sink import ListQuerySink
+from src.query_timeline import EventTimeline, EventTimelineBuilder
+from src.replay_cache import ReplayCache
+from src.replay_player import ReplayPlayer
 
 
-def extract_frames(replay_json: dict, player_info: list) -> list:
+class ActorRoleIndex:
+    """
+    Maps the actor ids found in the replay to the role they have in the extracted frames: the ball, one of
+    the players (by player number, as a string), or ignored (None).
+
+    The index is updated incrementally: an actor id gets a new role when an actor is spawned with it (its
+    update contains the class name) and loses it when the actor is destroyed, so the actor ids being
+    reassigned after a goal is scored are handled, and every actor update is resolved with a single lookup.
+    """
+
+    # role of the cars that were spawned before their player replication info reference was known
+    CAR_WITHOUT_PLAYER = "CarWithoutPlayer"
+
+    def __init__(self, player_info: list):
+        # player replication info actor id -> player number
+        self.player_numbers = {}
+        for player_index, player in enumerate(player_info):
+            self.player_numbers[player[constants.STORED_PLAYER_ID]] = str(player_index + 1)
+
+        # actor id -> role, and role -> actor id (only for the ball and the players)
+        self.actor_roles = {}
+        self.role_actors = {}
+
+    def assign_role(self, actor_id, role):
+        # an actor id spawned again with another role (e.g. the old ball's id given to a car) loses its old role
+        previous_role = self.actor_roles.get(actor_id, None)
+        if previous_role is not None and previous_role != role and \
+                self.role_actors.get(previous_role, None) == actor_id:
+            del self.role_actors[previous_role]
+        # a role belongs to a single actor at a time (e.g. a new ball replaces the old one after a goal)
+        if role is not None and role != ActorRoleIndex.CAR_WITHOUT_PLAYER:
+            previous_actor_id = self.role_actors.get(role, None)
+            if previous_actor_id is not None and previous_actor_id != actor_id:
+                self.actor_roles.pop(previous_actor_id, None)
+            self.role_actors[role] = actor_id
+        self.actor_roles[actor_id] = role
+        return role
+
+    def car_role(self, actor_update: dict):
+        player_info_reference = actor_update.get(constants.PLAYER_INFO_REFERENCE, None)
+        if player_info_reference is None:
+            return ActorRoleIndex.CAR_WITHOUT_PLAYER
+        return self.player_numbers.get(player_info_reference[constants.ACTOR_ID], None)
+
+    def spawn(self, actor_id, actor_update: dict):
+        class_name = actor_update[constants.CLASS_NAME]
+        if class_name == constants.BALL_CLASS_NAME:
+            return self.assign_role(actor_id, constants.FRAME_BALL)
+        if class_name == constants.PLAYER_CAR_CLASS_NAME:
+            return self.assign_role(actor_id, self.car_role(actor_update))
+        return self.assign_role(actor_id, None)
+
+    def destroy(self, actor_id):
+        """
+        Forgets the role of a destroyed actor, and returns it.
+        """
+        role = self.actor_roles.pop(actor_id, None)
+        if role is not None and self.role_actors.get(role, None) == actor_id:
+            del self.role_actors[role]
+        return role
+
+    def role_of(self, actor_update: dict):
+        """
+        Returns the role of the actor that sent the given update, updating the index if the actor was just spawned.
+        """
+        actor_id = actor_update.get(constants.ID, -1)
+        if constants.CLASS_NAME in actor_update:
+            return self.spawn(actor_id, actor_update)
+        role = self.actor_roles.get(actor_id, None)
+        if role == ActorRoleIndex.CAR_WITHOUT_PLAYER:
+            role = self.car_role(actor_update)
+            if role != ActorRoleIndex.CAR_WITHOUT_PLAYER:
+                self.assign_role(actor_id, role)
+        return role
+
+
+def extract_frames(replay_frames, player_info: list, carry_forward: bool = True,
+                   event_detector: EventDetector = None) -> list:
     """
     Searches for all the positions the actors have ever been in during the game, and returns the
     relevant information in multiple frames.
+    The replay frames can be given either as the whole replay json or as an iterable of frames (e.g. the
+    generator returned by read_replay_frames), in which case they are consumed one at a time.
     The structure of a frame:
     {
         time: frame time offset,
         ball: {
             x: ball position on x axis,
-            y: ball position on y axis
+            y: ball position on y axis,
+            age: seconds since the ball position was last updated
+        },
+        player: {
+            "1": {
+                x: player 1 position on x axis,
+                y: player 1 position on y axis,
+                age: seconds since player 1's position was last updated
+            },
+            ...
         }
     }
 
-    Note: The ids cannot be precomputed as they change when a goal is scored.
+    The replay only contains an actor's position in the frames in which it changed, so by default the last
+    known position of every actor is carried forward into the next frames (with its age growing), and every
+    frame contains all the actors seen so far. With carry_forward=False, a frame only contains the positions
+    updated in it (with an age of 0).
+
+    If an event detector is given, it is fed every extracted frame (and the spawns of the ball), so the game
+    events are detected in the same pass.
+
+    Note: The ids cannot be precomputed as they change when a goal is scored; they are tracked by an
+    ActorRoleIndex instead.
     """
-    extracted_frames = []
-    id_ball = -1
-    id_players = []
-    for _ in player_info:
-        id_players.append(-1)
-    for frame in replay_json[constants.FRAMES]:
+    return list(iterate_extracted_frames(replay_frames, player_info, carry_forward, event_detector))
+
+
+def iterate_extracted_frames(replay_frames, player_info: list, carry_forward: bool = True,
+                             event_detector: EventDetector = None):
+    """
+    Generator version of extract_frames; it yields every extracted frame as soon as its replay frame is read.
+    """
+    if isinstance(replay_frames, dict):
+        replay_frames = replay_frames[constants.FRAMES]
+    frame_extractor = FrameExtractor(player_info, carry_forward, event_detector)
+    for frame in replay_frames:
+        yield frame_extractor.extract_frame(frame)
+
+
+class FrameExtractor:
+    """
+    The state of the frame extraction (the actors' roles and their last known positions), so the replay frames
+    can be extracted one at a time, as they arrive (e.g. from a live stream, see live_ingestion), with the same
+    results as extract_frames.
+    """
+
+    def __init__(self, player_info: list, carry_forward: bool = True, event_detector: EventDetector = None):
+        self.carry_forward = carry_forward
+        self.event_detector = event_detector
+        self.actor_role_index = ActorRoleIndex(player_info)
+
+        # role -> (last known position, time of its update)
+        self.last_positions = {}
+        # role -> last known height (it is only used to detect the events, it isn't part of the frames)
+        self.last_heights = {}
+
+    def extract_frame(self, frame: dict) -> dict:
         # add the frame time and an empty dictionary for the players
         extracted_frame = {
             constants.FRAME_TIME: frame[constants.TIME],
             constants.FRAME_PLAYER: {},
         }
 
+        # forget the actors destroyed in the current frame, so their ids can be reused; the ball is destroyed when
+        # a goal is scored
+        for actor_id in frame.get(constants.DELETED_ACTOR_IDS, ()):
+            role = self.actor_role_index.destroy(actor_id)
+            if role == constants.FRAME_BALL and self.event_detector is not None:
+                self.event_detector.ball_destroyed(frame[constants.TIME])
+
         # go through all the actors in the current frame
         for actor_update in frame[constants.ACTOR_UPDATES]:
-            # parse the ball position, if the current actor is the ball
-            if id_ball != -1 and int(actor_update.get(constants.ID, -1) == id_ball) or \
-                    actor_update.get(constants.CLASS_NAME, "") == constants.BALL_CLASS_NAME:
-                id_ball = actor_update.get(constants.ID, -1)
-                ball_position = actor_update[constants.ACTOR_STATE][constants.POSITION]
-                extracted_frame[constants.FRAME_BALL] = {
-                    constants.FRAME_X: ball_position[constants.AXIS_X],
-                    constants.FRAME_Y: ball_position[constants.AXIS_Y],
-                }
-
-            # parse the player position, if the current actor is a car
-            player_index = 1
-            for id_player in id_players:
-                if id_player != -1 and int(actor_update.get(constants.ID, -1) == id_player) \
-                        or actor_update.get(constants.CLASS_NAME, "") == constants.PLAYER_CAR_CLASS_NAME \
-                        and player_info[player_index - 1][constants.STORED_PLAYER_ID] \
-                        == actor_update[constants.PLAYER_INFO_REFERENCE][constants.ACTOR_ID]:
-                    id_players[player_index - 1] = actor_update.get(constants.ID, -1)
-                    if actor_update.get(constants.ACTOR_STATE, None) is not None:
-                        player_position = actor_update[constants.ACTOR_STATE][constants.POSITION]
-                        extracted_frame[constants.FRAME_PLAYER][str(player_index)] = {
-                            constants.FRAME_X: player_position[constants.AXIS_X],
-                            constants.FRAME_Y: player_position[constants.AXIS_Y],
-                        }
-                player_index += 1
-
-        # append the extracted frame
-        extracted_frames.append(extracted_frame)
-
-    # return all the parsed frames
-    return extracted_frames
+            role = self.actor_role_index.role_of(actor_update)
+            if role is None or role == ActorRoleIndex.CAR_WITHOUT_PLAYER:
+                continue
+            # a new ball is spawned for every kickoff
+            if role == constants.FRAME_BALL and self.event_detector is not None and \
+                    constants.CLASS_NAME in actor_update:
+                self.event_detector.ball_spawned(frame[constants.TIME])
+
+            # skip the updates which do not contain the actor position
+            actor_state = actor_update.get(constants.ACTOR_STATE, None)
+            if actor_state is None:
+                continue
+            position = {
+                constants.FRAME_X: actor_state[constants.POSITION][constants.AXIS_X],
+                constants.FRAME_Y: actor_state[constants.POSITION][constants.AXIS_Y],
+            }
+            self.last_positions[role] = (position, frame[constants.TIME])
+            self.last_heights[role] = actor_state[constants.POSITION].get(constants.AXIS_Z, 0)
+
+        # store the position of the ball and the players (only the updated ones, unless carrying forward)
+        for role, (position, update_time) in self.last_positions.items():
+            position = dict(position)
+            position[constants.FRAME_AGE] = frame[constants.TIME] - update_time
+            if role == constants.FRAME_BALL:
+                extracted_frame[constants.FRAME_BALL] = position
+            else:
+                extracted_frame[constants.FRAME_PLAYER][role] = position
+        if self.event_detector is not None:
+            self.event_detector.add_frame(extracted_frame, self.last_heights)
+        if not self.carry_forward:
+            self.last_positions.clear()
+            self.last_heights.clear()
+        return extracted_frame
 
 
 def extract_player_info(first_frame: dict) -> list:
@@ -105,17 +247,30 @@ def extract_player_info(first_frame: dict) -> list:
 
 def find_min_and_max_of_field(extracted_frames) -> (dict, dict):
     """
-    Finds the minimum and maximum positions of the ball, on all the three axis, given the extracted frames.
+    Finds the minimum and maximum positions of the ball, on both axis, given the extracted frames (a frame table,
+    or frames in the dict format of extract_frames); the axis are the frames' ones. The frames without a known
+    ball position are ignored, and if there is none, the minimum is inf and the maximum -inf.
     """
+    if isinstance(extracted_frames, FrameTable):
+        ball_x = extracted_frames.ball_x[extracted_frames.ball_valid]
+        ball_y = extracted_frames.ball_y[extracted_frames.ball_valid]
+        if len(ball_x) == 0:
+            return ({constants.FRAME_X: float('inf'), constants.FRAME_Y: float('inf')},
+                    {constants.FRAME_X: float('-inf'), constants.FRAME_Y: float('-inf')})
+        return ({constants.FRAME_X: float(ball_x.min()), constants.FRAME_Y: float(ball_y.min())},
+                {constants.FRAME_X: float(ball_x.max()), constants.FRAME_Y: float(ball_y.max())})
+
     min_position = {constants.FRAME_X: float('inf'), constants.FRAME_Y: float('inf')}
     max_position = {constants.FRAME_X: float('-inf'), constants.FRAME_Y: float('-inf')}
-
     for frame in extracted_frames:
+        ball_position = frame.get(constants.FRAME_BALL, None)
+        if ball_position is None:
+            continue
         for axis in [constants.FRAME_X, constants.FRAME_Y]:
-            if int(frame[constants.FRAME_BALL][axis]) < min_position[axis]:
-                min_position[axis] = frame[constants.FRAME_BALL][axis]
-            if int(frame[constants.POSITION][axis]) > max_position[axis]:
-                max_position[axis] = frame[constants.FRAME_BALL][axis]
+            if ball_position[axis] < min_position[axis]:
+                min_position[axis] = ball_position[axis]
+            if ball_position[axis] > max_position[axis]:
+                max_position[axis] = ball_position[axis]
 
     return min_position, max_position
 
@@ -141,6 +296,144 @@ def read_replay_to_json(file_name: str) -> json:
     return replay_json
 
 
+class _ReplayStreamReader:
+    """
+    Reads a replay json file in chunks, decoding only one value at a time, so that the frames can be
+    read one by one without ever holding the whole replay (as a string or as a dict) in memory.
+    """
+
+    def __init__(self, replay_file):
+        self.replay_file = replay_file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.end_of_file = False
+
+    def read_more(self, read_size: int = constants.REPLAY_READ_CHUNK_SIZE) -> bool:
+        if self.end_of_file:
+            return False
+        chunk = self.replay_file.read(read_size)
+        if not chunk:
+            self.end_of_file = True
+            return False
+        # drop everything that was already decoded, to keep the buffer small
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek_char(self) -> str:
+        """
+        Skips any whitespace and returns the next character, without consuming it.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more():
+                raise ValueError("Unexpected end of the replay file.")
+
+    def expect_char(self, expected_chars: str) -> str:
+        char = self.peek_char()
+        if char not in expected_chars:
+            raise ValueError("Expected one of '" + expected_chars + "' in the replay file, found '" + char + "'.")
+        self.position += 1
+        return char
+
+    def read_value(self):
+        """
+        Decodes the next json value; if the buffer ends before the value does, more of the file is read
+        (doubling the read size every time, so that big values don't get decoded over and over again).
+        """
+        self.peek_char()
+        read_size = constants.REPLAY_READ_CHUNK_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a value ending right at the end of the buffer might be truncated (e.g. a number)
+                if end < len(self.buffer) or self.end_of_file:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.end_of_file:
+                    raise
+            self.read_more(read_size)
+            read_size *= 2
+
+    def iterate_array(self):
+        self.expect_char("[")
+        if self.peek_char() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.expect_char(",]") == "]":
+                return
+
+    def iterate_frames(self):
+        """
+        Walks the keys of the top-level replay object, skipping their values, until the 'Frames' array
+        is found; the frames are then yielded one by one.
+        """
+        self.expect_char("{")
+        if self.peek_char() == "}":
+            return
+        while True:
+            key = self.read_value()
+            self.expect_char(":")
+            if key == constants.FRAMES:
+                yield from self.iterate_array()
+                return
+            self.read_value()
+            if self.expect_char(",}") == "}":
+                return
+
+
+def read_replay_frames(file_name: str):
+    """
+    Given a file name as a string, it reads the replay in json format and yields its frames one at a time,
+    without parsing the whole replay at once.
+    """
+    with open(file_name, "r") as f:
+        yield from _ReplayStreamReader(f).iterate_frames()
+
+
+def read_replay(file_name: str) -> (list, FrameTable):
+    """
+    Given a file name as a string, it streams the replay frames from the file and returns the players'
+    information (extracted from the first frame) and the extracted frames, stored in a frame table along with
+    the game events detected in them.
+    """
+    replay_frames = read_replay_frames(file_name)
+    first_frame = next(replay_frames)
+    player_info = extract_player_info(first_frame)
+    event_detector = EventDetector(player_info)
+    extracted_frames = FrameTable.from_frames(iterate_extracted_frames(chain([first_frame], replay_frames),
+                                                                       player_info, event_detector=event_detector),
+                                              len(player_info))
+    extracted_frames.events = event_detector.events
+    return player_info, extracted_frames
+
+
+def load_replay(file_name: str, replay_cache: ReplayCache = None) -> (list, FrameTable):
+    """
+    Same as read_replay, but the extracted replay is taken from the given cache if the file was already
+    extracted once, and stored in the cache otherwise. Frame archives (see frame_archive) are decoded instead,
+    without the cache.
+    """
+    if is_archive_file(file_name):
+        return load_archive(file_name)
+    if replay_cache is None:
+        return read_replay(file_name)
+    replay_hash = ReplayCache.replay_hash(file_name)
+    cached_replay = replay_cache.load(replay_hash)
+    if cached_replay is not None:
+        return cached_replay
+    player_info, extracted_frames = read_replay(file_name)
+    replay_cache.store(replay_hash, player_info, extracted_frames)
+    return player_info, extracted_frames
+
+
 def position_to_screen_coord(position: dict) -> dict:
     return {
         constants.FRAME_X: (position[constants.FRAME_X] - constants.MIN_X) * constants.SCALE + constants.OFFSET_X,
@@ -148,7 +441,48 @@ def position_to_screen_coord(position: dict) -> dict:
     }
 
 
-def replay_extracted_frames(extracted_frames, main_frame):
+def finish_replay(extracted_frames: FrameTable, main_frame, profiler: QueryProfiler):
+    """
+    Called when a replay finishes: the queries' profiling statistics are dumped, and the UI is reset.
+    """
+    if constants.QUERY_PROFILE_FILE is not None:
+        try:
+            profiler.dump(constants.QUERY_PROFILE_FILE)
+        except OSError as exception:
+            print("Could not write the query profile to " + constants.QUERY_PROFILE_FILE + ": " + str(exception),
+                  file=sys.stderr)
+    reset_replay(extracted_frames, main_frame)
+
+
+def reset_replay(extracted_frames: FrameTable, main_frame):
+    """
+    Brings the UI back to its initial state, after a replay finishes (or cannot be started).
+    """
+    # enable the start button and the query input as the replay finishes
+    main_frame.start_button.config(state="normal")
+    main_frame.query_input.config(state="normal")
+
+    # move the ball and the players back to the first frame's position
+    main_frame.draw_frame(extracted_frames.ball_position(0), extracted_frames.player_positions(0))
+
+    # reset the timer to 00:00
+    main_frame.set_time(0)
+
+    # clear the query output
+    main_frame.query_sink.clear()
+
+
+def replay_extracted_frames(extracted_frames: FrameTable, main_frame):
+    """
+    Parses the queries from the UI and starts playing the replay on the Tk main loop; the UI is reset when the
+    replay finishes, or if it cannot be started. The replay player is kept in main_frame.replay_player once it
+    starts.
+
+    Once the whole replay is extracted, the queries' events are taken from their timelines over the replay (see
+    QueryTimelineCache), so only the queries which were added or changed since the last run are evaluated; they
+    are evaluated in a background thread (see EventTimelineBuilder), and the replay starts once they are. While
+    the replay is still being extracted, the queries are evaluated as the frames are played.
+    """
     # query index, we store it here so we have it for reference in the parsing error popup
     query_index = 1
     try:
@@ -156,53 +490,86 @@ def replay_extracted_frames(extracted_frames, main_frame):
         main_frame.start_button.config(state="disabled")
         main_frame.query_input.config(state="disabled")
 
-        # create our user queries by parsing the text area content, and create a query manager as well
+        # create our user queries by parsing the text area content
         user_queries = []
         user_queries_text = main_frame.query_input.get("1.0", END).strip()
-        for user_query_text in user_queries_text.split("\n\n"):
+        user_query_texts = user_queries_text.split("\n\n")
+        for user_query_text in user_query_texts:
             user_queries.append(Query(user_query_text))
             query_index += 1
-        query_manager = QueryManager(main_frame)
-        for query in user_queries:
-            query_manager.add_query(query)
-
-        # go through every frame of the objects
-        for frame_index in range(0, len(extracted_frames) - 1):
-            # move the ball on the screen
-            if constants.FRAME_BALL in extracted_frames[frame_index]:
-                main_frame.move_ball(position_to_screen_coord(extracted_frames[frame_index][constants.FRAME_BALL]))
-
-            # move the players on the screen
-            main_frame.move_players(extracted_frames[frame_index][constants.FRAME_PLAYER])
-
-            # parse the current message
-            query_manager.add_message(extracted_frames[frame_index])
-
-            # wait between frames, for the difference of time between them
-            sleep(extracted_frames[frame_index + 1][constants.FRAME_TIME]
-                  - extracted_frames[frame_index][constants.FRAME_TIME])
-
-            # update the timer as well to reflect the time passed since the game started
-            main_frame.set_time(extracted_frames[frame_index + 1][constants.FRAME_TIME])
     except QueryParseException as exception:
         # if a query could not be parsed, display it as a popup message with the error itself
         messagebox.showwarning("Input query #" + str(query_index) + " format error", str(exception))
-    finally:
-        # regardless of the queries being parsed or not, enable the start button and the query input as
-        # the replay finishes
-        main_frame.start_button.config(state="normal")
-        main_frame.query_input.config(state="normal")
+        reset_replay(extracted_frames, main_frame)
+        return
 
-        # move the ball back to the center of the screen (first frame's position)
-        main_frame.move_ball(position_to_screen_coord(extracted_frames[0][constants.FRAME_BALL]))
-
-        # move the players back to the first frame's position
-        main_frame.move_players(extracted_frames[0][constants.FRAME_PLAYER])
+    try:
+        # the queries are profiled in every run (see QueryProfiler), and the statistics are shown by the UI
+        profiler = QueryProfiler()
+        replay_loader = main_frame.replay_loader
+        if replay_loader is None or replay_loader.is_complete():
+            # the replay hash identifies the replay's frames; without it (no replay cache, or a frame archive), the
+            # load id identifies them in this session, and without a loader, the timelines aren't cached
+            replay_id = None
+            if replay_loader is not None:
+                replay_id = replay_loader.replay_hash if replay_loader.replay_hash is not None \
+                    else "load." + str(replay_loader.load_id)
+            event_timeline_builder = EventTimelineBuilder(main_frame.query_timeline_cache, replay_id, user_queries,
+                                                          extracted_frames, main_frame.player_info, profiler)
+            event_timeline_builder.start()
+            start_with_event_timeline(event_timeline_builder, extracted_frames, main_frame, profiler)
+        else:
+            query_manager = QueryManager(main_frame.query_sink, profiler, main_frame.player_info)
+            for query in user_queries:
+                query_manager.add_query(query)
+                # the clauses are ordered from the frames extracted so far, before the first frame is played
+                query.compiled_condition.sample_clauses(extracted_frames.snapshot())
+            # the seeking checkpoints are built ahead of the playback, on another copy of the queries (see
+            # ReplayPlayer)
+            checkpoint_query_manager = QueryManager(ListQuerySink(), player_info=main_frame.player_info)
+            for user_query_text in user_query_texts:
+                checkpoint_query_manager.add_query(Query(user_query_text))
+            start_replay_player(extracted_frames, main_frame, profiler, query_manager=query_manager,
+                                checkpoint_query_manager=checkpoint_query_manager)
+    except Exception:
+        reset_replay(extracted_frames, main_frame)
+        raise
+
+
+def start_with_event_timeline(event_timeline_builder: EventTimelineBuilder, extracted_frames: FrameTable, main_frame,
+                              profiler: QueryProfiler):
+    """
+    Starts playing the replay once the queries' event timeline is built, checking on it from the Tk main loop
+    every QUERY_TIMELINE_POLL_INTERVAL_MS; the UI is reset if the queries could not be evaluated.
+    """
+    if not event_timeline_builder.is_complete():
+        main_frame.after(constants.QUERY_TIMELINE_POLL_INTERVAL_MS,
+                         lambda: start_with_event_timeline(event_timeline_builder, extracted_frames, main_frame,
+                                                           profiler))
+        return
+    if event_timeline_builder.error is not None:
+        messagebox.showerror("Query evaluation error",
+                             "The queries could not be evaluated: " + str(event_timeline_builder.error))
+        reset_replay(extracted_frames, main_frame)
+        return
+    try:
+        start_replay_player(extracted_frames, main_frame, profiler,
+                            event_timeline=event_timeline_builder.event_timeline)
+    except Exception:
+        reset_replay(extracted_frames, main_frame)
+        raise
 
-        # reset the timer to 00:00
-        main_frame.set_time(0)
 
-        # clear the query output
-        main_frame.query_output.config(state="normal")
-        main_frame.query_output.delete('1.0', END)
-        main_frame.query_output.config(state="disabled")
+def start_replay_player(extracted_frames: FrameTable, main_frame, profiler: QueryProfiler,
+                        query_manager: QueryManager = None, event_timeline: EventTimeline = None,
+                        checkpoint_query_manager: QueryManager = None):
+    """
+    Plays every frame of the replay, with either the query manager or the event timeline, then resets the UI.
+    """
+    main_frame.profiler = profiler
+    main_frame.replay_player = ReplayPlayer(main_frame, extracted_frames, query_manager,
+                                            on_finish=lambda: finish_replay(extracted_frames, main_frame, profiler),
+                                            speed=main_frame.playback_speed, profiler=profiler,
+                                            replay_loader=main_frame.replay_loader, event_timeline=event_timeline,
+                                            checkpoint_query_manager=checkpoint_query_manager)
+    main_frame.replay_player.start()
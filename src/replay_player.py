@@ -0,0 +1,309 @@
+from bisect import bisect_right
+from threading import Event, Thread
+from time import monotonic, perf_counter_ns
+
+import src.constants as constants
+from src.frame_table import FrameTable
+from src.query_manager import QueryManager
+from src.query_profiler import QueryProfiler
+from src.query_timeline import EventTimeline
+
+
+class QueryCheckpoints:
+    """
+    Checkpoints of the queries' state, taken every few seconds of replay by a background thread which evaluates
+    the frames ahead of the playback, on its own copy of the queries (a second query manager with the same
+    queries, whose results are never printed). The checkpoints follow the extraction of the frames, if the replay
+    is still being extracted (see ReplayLoader).
+
+    The checkpoints are only appended, by the thread: a checkpoint's state is appended before its frame index, so
+    the frame indices can be searched at any time without a lock, and a seek never waits for the thread (it uses
+    the checkpoints built so far).
+
+    The checkpoints cost a second evaluation of the queries: every frame is evaluated once by the thread, ahead of
+    the playback, and once more when it is played. The thread holds the GIL while it evaluates a frame, so until it
+    has gone through the whole replay (which takes as long as evaluating the whole replay at once), the playback
+    gets less CPU time and may fall behind (frames are then skipped on screen, see ReplayPlayer).
+    """
+
+    # how long the thread waits for more frames when it catches up with the extraction, in seconds
+    LOADING_WAIT = 0.05
+
+    def __init__(self, extracted_frames: FrameTable, query_manager: QueryManager, interval: float,
+                 replay_loader=None):
+        self.extracted_frames = extracted_frames
+        self.query_manager = query_manager
+        self.interval = interval
+        self.replay_loader = replay_loader
+
+        # the queries' state before evaluating the frame at the given index, sorted by the frame index
+        self.frame_indices = []
+        self.states = []
+        self.stopped = Event()
+        self.thread = Thread(target=self.build, daemon=True)
+
+    def start(self):
+        # the first checkpoint (before any frame) is taken right away, so there is always one to seek back to
+        self.states.append(self.query_manager.get_state())
+        self.frame_indices.append(0)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def build(self):
+        frame_index = 0
+        next_checkpoint_time = self.extracted_frames.frame_time(0) + self.interval
+        while not self.stopped.is_set():
+            # checked before the frame count, so no frame appended in the meantime can be missed
+            loading = self.replay_loader is not None and not self.replay_loader.is_complete()
+            if frame_index == len(self.extracted_frames):
+                if not loading:
+                    break
+                self.stopped.wait(QueryCheckpoints.LOADING_WAIT)
+                continue
+
+            frame_time = self.extracted_frames.frame_time(frame_index)
+            if frame_time >= next_checkpoint_time:
+                self.states.append(self.query_manager.get_state())
+                self.frame_indices.append(frame_index)
+                next_checkpoint_time = frame_time + self.interval
+            self.query_manager.add_message(self.extracted_frames.frame(frame_index), emit_results=False)
+            frame_index += 1
+
+    def checkpoint_before(self, frame_index: int) -> (int, list):
+        """
+        Returns the last checkpoint (frame index, state) built so far at or before the given frame index.
+        """
+        checkpoint_index = bisect_right(self.frame_indices, frame_index) - 1
+        return self.frame_indices[checkpoint_index], self.states[checkpoint_index]
+
+
+class ReplayPlayer:
+    """
+    Plays the extracted frames of a replay on the Tk main loop, scheduling itself with 'after'.
+
+    The playback follows a monotonic clock instead of sleeping between frames, so it doesn't drift: on every tick,
+    all the frames whose time has come are passed to the query manager (the queries must see every frame), but
+    only the most recent positions are drawn, so frames are skipped on screen when the playback falls behind.
+
+    The playback speed can be changed, and the player can seek to any time of the replay. Seeking uses the frame
+    times index (see FrameTable.index_at_time) and checkpoints of the queries' state, taken every few seconds of
+    replay ahead of the playback (see QueryCheckpoints, which evaluates the frames on a second query manager): the
+    nearest checkpoint before the target (or the current position, if it's nearer) is restored, and only the
+    frames between it and the target are evaluated again, without printing their results. A seek never blocks
+    the main loop: if the checkpoints haven't reached the target yet, the frames are evaluated over the next ticks
+    (for at most a tick interval each, jumping to any newer checkpoint built meanwhile), and the playback resumes
+    once the target is reached.
+
+    The frames can still be extracted while the replay is played (see ReplayLoader): if the playback catches up
+    with the extraction, the replay clock is held at the last extracted frame until more frames are available.
+
+    If a QueryProfiler is given, the time spent reading, evaluating and drawing the frames is recorded, as well as
+    the playback lag (how far the last drawn frame is behind the replay clock) on every tick.
+
+    If the queries' events over the whole replay are already known (see query_timeline.EventTimeline), the player
+    is given the event timeline instead of a query manager: the events of every frame are printed as it is played,
+    without evaluating the queries, and seeking only needs a binary search in the timeline.
+    """
+
+    TICK_INTERVAL_MS = 15
+    CHECKPOINT_INTERVAL = 5
+    MIN_SPEED = 0.25
+    MAX_SPEED = 16
+
+    def __init__(self, main_frame, extracted_frames: FrameTable, query_manager: QueryManager, on_finish=None,
+                 speed: float = 1, profiler: QueryProfiler = None, replay_loader=None,
+                 event_timeline: EventTimeline = None, checkpoint_query_manager: QueryManager = None):
+        self.main_frame = main_frame
+        self.extracted_frames = extracted_frames
+        self.query_manager = query_manager
+        self.on_finish = on_finish
+        self.speed = speed
+        self.profiler = profiler
+        self.replay_loader = replay_loader
+        self.event_timeline = event_timeline
+
+        # the index of the next frame to be evaluated, and of the next event of the event timeline to be printed
+        self.frame_index = 0
+        self.event_index = 0
+        self.start_clock = 0
+        self.start_replay_time = 0
+        self.tick_job = None
+        self.running = False
+        # the index of the frame a seek in progress has to evaluate up to (None if there is no seek in progress)
+        self.seek_frame_index = None
+
+        # the checkpoints of the queries' state, built from the checkpoint query manager (which must hold the same
+        # queries as the query manager) while the replay is played
+        self.checkpoints = None
+        if query_manager is not None:
+            if checkpoint_query_manager is None:
+                raise ValueError("A checkpoint query manager is needed to seek while evaluating the queries.")
+            self.checkpoints = QueryCheckpoints(extracted_frames, checkpoint_query_manager,
+                                                ReplayPlayer.CHECKPOINT_INTERVAL, replay_loader)
+
+    def start(self):
+        self.frame_index = 0
+        self.event_index = 0
+        self.seek_frame_index = None
+        self.running = True
+        if self.checkpoints is not None:
+            self.checkpoints.start()
+        self.rebase_clock(self.extracted_frames.frame_time(0))
+        self.tick()
+
+    def rebase_clock(self, replay_time: float):
+        self.start_clock = monotonic()
+        self.start_replay_time = replay_time
+
+    def replay_time(self) -> float:
+        return self.start_replay_time + (monotonic() - self.start_clock) * self.speed
+
+    def set_speed(self, speed: float):
+        # continue from the current replay time, at the new speed
+        replay_time = self.replay_time()
+        self.speed = min(max(speed, ReplayPlayer.MIN_SPEED), ReplayPlayer.MAX_SPEED)
+        self.rebase_clock(replay_time)
+
+    def evaluate_frame(self, emit_results: bool = True) -> dict:
+        """
+        Evaluates the queries for the next frame, and returns it.
+        """
+        if self.event_timeline is not None:
+            return self.play_timeline_frame(emit_results)
+        if self.profiler is None:
+            frame = self.extracted_frames.frame(self.frame_index)
+            self.query_manager.add_message(frame, emit_results)
+        else:
+            start_time = perf_counter_ns()
+            frame = self.extracted_frames.frame(self.frame_index)
+            extracted_time = perf_counter_ns()
+            self.query_manager.add_message(frame, emit_results)
+            self.profiler.add_stage_time(QueryProfiler.STAGE_EXTRACTION, extracted_time - start_time)
+            self.profiler.add_stage_time(QueryProfiler.STAGE_EVALUATION, perf_counter_ns() - extracted_time)
+        self.frame_index += 1
+        return frame
+
+    def play_timeline_frame(self, emit_results: bool = True) -> dict:
+        """
+        Prints the events of the next frame from the event timeline, and returns the frame.
+        """
+        start_time = perf_counter_ns()
+        frame = self.extracted_frames.frame(self.frame_index)
+        if self.profiler is not None:
+            self.profiler.add_stage_time(QueryProfiler.STAGE_EXTRACTION, perf_counter_ns() - start_time)
+
+        event_frame_indices = self.event_timeline.frame_indices
+        while self.event_index < len(event_frame_indices) and \
+                event_frame_indices[self.event_index] == self.frame_index:
+            if emit_results:
+                self.main_frame.query_sink.add_result(frame[constants.FRAME_TIME],
+                                                      self.event_timeline.messages[self.event_index])
+            self.event_index += 1
+        self.frame_index += 1
+        return frame
+
+    def process_due_frames(self, replay_time: float):
+        """
+        Evaluates the queries for all the frames up to the given replay time, and draws the latest known positions.
+        """
+        ball_position = None
+        player_positions = {}
+        last_frame_index = self.frame_index
+        while self.frame_index < len(self.extracted_frames) and \
+                self.extracted_frames.frame_time(self.frame_index) <= replay_time:
+            frame = self.evaluate_frame()
+            ball_position = frame.get(constants.FRAME_BALL, ball_position)
+            player_positions.update(frame[constants.FRAME_PLAYER])
+
+        if self.frame_index > last_frame_index:
+            start_time = perf_counter_ns()
+            self.main_frame.draw_frame(ball_position, player_positions)
+            self.main_frame.set_time(self.extracted_frames.frame_time(self.frame_index - 1))
+            if self.profiler is not None:
+                self.profiler.add_stage_time(QueryProfiler.STAGE_RENDERING, perf_counter_ns() - start_time)
+
+        if self.profiler is not None and self.frame_index > 0:
+            self.profiler.add_lag(max(self.replay_time() - self.extracted_frames.frame_time(self.frame_index - 1), 0))
+
+    def seek(self, replay_time: float):
+        """
+        Jumps to the given replay time: once the seek is done, all the frames up to that time have been evaluated.
+        The target is drawn right away, but the frames may be evaluated over the next ticks (see continue_seek).
+        """
+        target_frame_index = max(self.extracted_frames.index_at_time(replay_time), 0) + 1
+        last_frame_index = target_frame_index - 1
+        self.main_frame.draw_frame(self.extracted_frames.ball_position(last_frame_index),
+                                   self.extracted_frames.player_positions(last_frame_index))
+        self.main_frame.set_time(self.extracted_frames.frame_time(last_frame_index))
+
+        if self.event_timeline is not None:
+            # the events are known, so the frames up to the target are simply skipped
+            self.frame_index = target_frame_index
+            self.event_index = self.event_timeline.first_event_at(target_frame_index)
+            self.rebase_clock(self.extracted_frames.frame_time(last_frame_index))
+            return
+
+        # a seek backwards can't start from the current position
+        if self.frame_index > target_frame_index:
+            self.frame_index, checkpoint_state = self.checkpoints.checkpoint_before(target_frame_index)
+            self.query_manager.set_state(checkpoint_state)
+        self.seek_frame_index = target_frame_index
+        self.continue_seek()
+
+    def continue_seek(self):
+        """
+        Evaluates the frames of the seek in progress, without printing their results, for at most a tick interval;
+        the nearest checkpoint before the target is restored first, if it's ahead of the current position.
+        """
+        checkpoint_frame_index, checkpoint_state = self.checkpoints.checkpoint_before(self.seek_frame_index)
+        if checkpoint_frame_index > self.frame_index:
+            self.frame_index = checkpoint_frame_index
+            self.query_manager.set_state(checkpoint_state)
+
+        deadline = monotonic() + ReplayPlayer.TICK_INTERVAL_MS / 1000
+        while self.frame_index < self.seek_frame_index and monotonic() < deadline:
+            self.evaluate_frame(emit_results=False)
+
+        if self.frame_index == self.seek_frame_index:
+            self.seek_frame_index = None
+            self.rebase_clock(self.extracted_frames.frame_time(self.frame_index - 1))
+
+    def is_loading(self) -> bool:
+        return self.replay_loader is not None and not self.replay_loader.is_complete()
+
+    def tick(self):
+        self.tick_job = None
+        if self.seek_frame_index is not None:
+            # the playback waits for the seek to be done
+            self.continue_seek()
+            self.tick_job = self.main_frame.after(ReplayPlayer.TICK_INTERVAL_MS, self.tick)
+            return
+        # checked before the frame count, so no frame appended in the meantime can be missed
+        loading = self.is_loading()
+        self.process_due_frames(self.replay_time())
+
+        if self.frame_index == len(self.extracted_frames):
+            if not loading:
+                self.stop()
+                return
+            # the playback caught up with the extraction: hold the clock until more frames are extracted
+            self.rebase_clock(self.extracted_frames.frame_time(self.frame_index - 1))
+            self.tick_job = self.main_frame.after(ReplayPlayer.TICK_INTERVAL_MS, self.tick)
+            return
+
+        # wake up for the next frame, but not later than a tick, so the clock is sampled regularly
+        next_frame_delay = (self.extracted_frames.frame_time(self.frame_index) - self.replay_time()) / self.speed
+        delay_ms = int(min(max(next_frame_delay * 1000, 1), ReplayPlayer.TICK_INTERVAL_MS))
+        self.tick_job = self.main_frame.after(delay_ms, self.tick)
+
+    def stop(self):
+        if self.tick_job is not None:
+            self.main_frame.after_cancel(self.tick_job)
+            self.tick_job = None
+        if self.checkpoints is not None:
+            self.checkpoints.stop()
+        self.running = False
+        if self.on_finish is not None:
+            self.on_finish()
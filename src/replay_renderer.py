@@ -0,0 +1,130 @@
+import numpy as np
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.replay_heatmaps import ReplayHeatmaps
+
+
+class ReplayRenderer:
+    """
+    Draws the ball and the players on the canvas, in retained mode: the canvas items are created the first time
+    an object is drawn, and only moved (with canvas.coords) afterwards, instead of being recreated every frame.
+    """
+
+    BALL_RADIUS = 8
+    PLAYER_HALF_SIZE = 16
+
+    def __init__(self, canvas, player_info: list):
+        self.canvas = canvas
+        self.player_info = player_info
+        self.ball_object = None
+        self.player_objects = []
+        self.player_text_objects = []
+        for _ in player_info:
+            self.player_objects.append(None)
+            self.player_text_objects.append(None)
+
+    def move_ball(self, new_position: dict):
+        # the ball position is given in screen coordinates (see replay_parser.position_to_screen_coord)
+        # note: the frames' coordinates are reversed, so the screen x is the position's y and vice versa
+        ball_box = (new_position[constants.FRAME_Y] - ReplayRenderer.BALL_RADIUS,
+                    new_position[constants.FRAME_X] - ReplayRenderer.BALL_RADIUS,
+                    new_position[constants.FRAME_Y] + ReplayRenderer.BALL_RADIUS,
+                    new_position[constants.FRAME_X] + ReplayRenderer.BALL_RADIUS)
+        if self.ball_object is None:
+            self.ball_object = self.canvas.create_oval(*ball_box, outline='red', fill='darkGreen')
+        else:
+            self.canvas.coords(self.ball_object, *ball_box)
+
+    def player_fill(self, player_index: int) -> str:
+        if self.player_info[player_index][constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1:
+            return "orange"
+        return "blue"
+
+    def move_player(self, player_index: int, new_position: dict):
+        player_box = (new_position[constants.FRAME_Y] - ReplayRenderer.PLAYER_HALF_SIZE,
+                      new_position[constants.FRAME_X] - ReplayRenderer.PLAYER_HALF_SIZE,
+                      new_position[constants.FRAME_Y] + ReplayRenderer.PLAYER_HALF_SIZE,
+                      new_position[constants.FRAME_X] + ReplayRenderer.PLAYER_HALF_SIZE)
+        text_position = (new_position[constants.FRAME_Y], new_position[constants.FRAME_X])
+        if self.player_objects[player_index] is None:
+            # draw the player rectangle, and the player text over the rectangle
+            self.player_objects[player_index] = self.canvas.create_rectangle(*player_box, outline='red',
+                                                                             fill=self.player_fill(player_index))
+            self.player_text_objects[player_index] = self.canvas.create_text(*text_position,
+                                                                             font=("Helvetica", 28),
+                                                                             text=str(player_index + 1),
+                                                                             fill="white")
+        else:
+            self.canvas.coords(self.player_objects[player_index], *player_box)
+            self.canvas.coords(self.player_text_objects[player_index], *text_position)
+
+    def move_players(self, player_positions: dict):
+        """
+        Moves the players found in the given positions ({player number (string): {x, y}}, in game units).
+        """
+        for player_index in range(0, len(self.player_objects)):
+            # move to the next player if this player is not found in this frame
+            player_position = player_positions.get(str(player_index + 1), None)
+            if player_position is None:
+                continue
+            self.move_player(player_index, replay_parser.position_to_screen_coord(player_position))
+
+
+class HeatmapOverlay:
+    """
+    Draws the heatmaps of a replay (see ReplayHeatmaps) under the field's lines, the ball and the players, one at
+    a time. The cells of a heatmap are only created the first time it is shown; afterwards they are hidden and
+    shown again (by their tag) instead of being recreated, so switching between the heatmaps is instant.
+    """
+
+    def __init__(self, canvas, heatmaps: ReplayHeatmaps):
+        self.canvas = canvas
+        self.heatmaps = heatmaps
+        self.drawn_tags = set()
+        self.shown_tag = None
+
+    @staticmethod
+    def cell_colors(grid: np.ndarray) -> np.ndarray:
+        """
+        Returns the cells' colors, from white (little time spent in the cell) to yellow and red (the most time):
+        their red is always full, so only their green and blue are returned, as 0xggbb.
+        """
+        # the square root spreads the colors, as most of the time is spent in a few cells
+        intensity = np.sqrt(grid / grid.max()) if grid.max() > 0 else grid
+        green = np.round(255 * np.clip(2 - 2 * intensity, 0, 1)).astype(int)
+        blue = np.round(255 * np.clip(1 - 2 * intensity, 0, 1)).astype(int)
+        return green * 256 + blue
+
+    def draw(self, cell_size: int, entity: str, tag: str):
+        grid = self.heatmaps.grid(cell_size, entity)
+        x_edges, y_edges = ReplayHeatmaps.cell_edges(cell_size)
+        screen_edges = replay_parser.position_to_screen_coord({constants.FRAME_X: x_edges, constants.FRAME_Y: y_edges})
+        screen_x_edges = screen_edges[constants.FRAME_X]
+        screen_y_edges = screen_edges[constants.FRAME_Y]
+        cell_colors = HeatmapOverlay.cell_colors(grid)
+        # note: the frames' coordinates are reversed, so the screen x is the position's y and vice versa
+        for x_index, y_index in zip(*np.nonzero(grid)):
+            self.canvas.create_rectangle(screen_y_edges[y_index], screen_x_edges[x_index],
+                                         screen_y_edges[y_index + 1], screen_x_edges[x_index + 1],
+                                         fill="#ff" + format(cell_colors[x_index, y_index], "04x"), outline="",
+                                         tags=tag)
+        self.canvas.tag_lower(tag)
+
+    def show(self, cell_size: int = None, entity: str = None):
+        """
+        Shows the heatmap of an entity (ball, player.N, orange or blue) at a cell size, in place of the heatmap
+        shown so far; the overlay is hidden if the entity is None.
+        """
+        if self.shown_tag is not None:
+            self.canvas.itemconfigure(self.shown_tag, state="hidden")
+            self.shown_tag = None
+        if entity is None:
+            return
+        tag = "heatmap:" + ReplayHeatmaps.grid_key(cell_size, entity)
+        if tag in self.drawn_tags:
+            self.canvas.itemconfigure(tag, state="normal")
+        else:
+            self.draw(cell_size, entity, tag)
+            self.drawn_tags.add(tag)
+        self.shown_tag = tag
@@ -0,0 +1,100 @@
+"""
+Streams a replay file as newline-delimited json (one replay frame per line), which is the input of the live
+ingestion (see live_ingestion), to a TCP socket, a Unix socket or the standard output; it is meant for testing the
+live ingestion locally with existing replays.
+
+The frames are sent at the replay's own pace by default (see --speed), and the sending waits whenever the receiver
+falls behind, so the frames are never buffered in memory.
+
+Usage examples:
+    python -m src.replay_streamer replay.json --tcp 127.0.0.1:9000
+    python -m src.replay_streamer replay.json --speed 0 | python -m src.live_ingestion queries.txt --stdin
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.live_ingestion import parse_address
+
+
+class StdoutStreamWriter:
+    """
+    Writes to the standard output with the same interface as the asyncio stream writers.
+    """
+
+    def write(self, data: bytes):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+async def stream_replay(file_name: str, writer, speed: float = 1.0) -> int:
+    """
+    Sends the frames of the replay to the writer, the time between two frames being the time between them in the
+    replay divided by the speed (0 to send them as fast as the receiver reads them); returns the number of frames
+    sent.
+    """
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    first_frame_time = None
+    frame_count = 0
+    for frame in replay_parser.read_replay_frames(file_name):
+        if speed > 0:
+            if first_frame_time is None:
+                first_frame_time = frame[constants.TIME]
+            delay = start_time + (frame[constants.TIME] - first_frame_time) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        writer.write((json.dumps(frame) + "\n").encode())
+        await writer.drain()
+        frame_count += 1
+    writer.close()
+    await writer.wait_closed()
+    return frame_count
+
+
+async def open_writer(arguments):
+    if arguments.tcp is not None:
+        _, writer = await asyncio.open_connection(*parse_address(arguments.tcp))
+    elif arguments.unix is not None:
+        _, writer = await asyncio.open_unix_connection(arguments.unix)
+    else:
+        writer = StdoutStreamWriter()
+    return writer
+
+
+async def run_streamer(arguments) -> int:
+    return await stream_replay(arguments.replay_file, await open_writer(arguments), arguments.speed)
+
+
+def main(arguments=None) -> int:
+    argument_parser = argparse.ArgumentParser(description="Stream a json replay as newline-delimited json frames.")
+    argument_parser.add_argument("replay_file", help="the json replay to stream")
+    destination = argument_parser.add_mutually_exclusive_group()
+    destination.add_argument("--tcp", metavar="HOST:PORT", help="send the frames to this TCP address")
+    destination.add_argument("--unix", metavar="PATH", help="send the frames to this Unix socket")
+    argument_parser.add_argument("-s", "--speed", type=float, default=1.0,
+                                 help="playback speed (default: 1, real time; 0 to send the frames at once)")
+    arguments = argument_parser.parse_args(arguments)
+
+    try:
+        frame_count = asyncio.run(run_streamer(arguments))
+    except (BrokenPipeError, ConnectionError) as exception:
+        print("Streaming stopped: " + repr(exception), file=sys.stderr)
+        return 1
+    print("Streamed " + str(frame_count) + " frames.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import hashlib
+import re
+
+import numpy as np
+
+import src.constants as constants
+from src.query_parse_exception import QueryParseException
+
+# the number of players the query conditions can refer to (player.1 to player.6)
+MAX_PLAYERS = 6
+
+TEAM_ORANGE = "orange"
+TEAM_BLUE = "blue"
+TEAM_ANY = "any"
+
+# the field length, along the conditions' x axis (the frames' y axis, see QueryCondition.PARSED_OPERAND_VALUES)
+FIELD_MIN_X = constants.MIN_Y
+FIELD_MAX_X = constants.MAX_Y
+FIELD_THIRD_LENGTH = constants.LENGTH_Y / 3
+
+# zone -> the [lower, upper) bounds of its x, in the conditions' coordinates; the orange goal is at the negative x
+# note: the outer zones are open-ended, as the ball and the cars can go past the field's bounds (into the goals)
+ZONES = {
+    "orange_third": (-np.inf, FIELD_MIN_X + FIELD_THIRD_LENGTH),
+    "middle_third": (FIELD_MIN_X + FIELD_THIRD_LENGTH, FIELD_MAX_X - FIELD_THIRD_LENGTH),
+    "blue_third": (FIELD_MAX_X - FIELD_THIRD_LENGTH, np.inf),
+    "orange_half": (-np.inf, 0),
+    "blue_half": (0, np.inf),
+}
+
+# zones relative to a player's team -> (the zone for an orange player, the zone for a blue player)
+TEAM_ZONES = {
+    "defensive_third": ("orange_third", "blue_third"),
+    "offensive_third": ("blue_third", "orange_third"),
+    "defensive_half": ("orange_half", "blue_half"),
+    "offensive_half": ("blue_half", "orange_half"),
+}
+
+ENTITY_PATTERN = re.compile(r"^(?:ball|player\.[1-" + str(MAX_PLAYERS) + r"]|" + TEAM_ORANGE + "|" + TEAM_BLUE + ")$")
+
+
+class SpatialPositions:
+    """
+    The positions of the ball and of all the players, as arrays with one row per frame (the player arrays have
+    one column per player), in the coordinates used by the query conditions: x along the length of the field and
+    y along its width. The same arrays are built for a single message or for a whole frame table, so the spatial
+    operands are computed the same way (with array math, for all the players at once) in both cases.
+    """
+
+    def __init__(self, ball_x, ball_y, ball_valid, player_x, player_y, player_valid):
+        self.ball_x = ball_x
+        self.ball_y = ball_y
+        self.ball_valid = ball_valid
+        self.player_x = player_x
+        self.player_y = player_y
+        self.player_valid = player_valid
+
+    @classmethod
+    def from_frame_table(cls, frame_table):
+        frame_count = len(frame_table)
+        player_count = min(frame_table.player_count, MAX_PLAYERS)
+        player_x = np.zeros((frame_count, MAX_PLAYERS))
+        player_y = np.zeros((frame_count, MAX_PLAYERS))
+        player_valid = np.zeros((frame_count, MAX_PLAYERS), dtype=bool)
+        # note: the frames' coordinates are reversed
+        player_x[:, :player_count] = frame_table.player_y[:, :player_count]
+        player_y[:, :player_count] = frame_table.player_x[:, :player_count]
+        player_valid[:, :player_count] = frame_table.player_valid[:, :player_count]
+        return cls(frame_table.ball_y, frame_table.ball_x, frame_table.ball_valid, player_x, player_y, player_valid)
+
+    @classmethod
+    def from_message(cls, message: dict):
+        ball_position = message.get(constants.FRAME_BALL, None)
+        ball_x = np.zeros(1)
+        ball_y = np.zeros(1)
+        ball_valid = np.zeros(1, dtype=bool)
+        if ball_position is not None:
+            ball_x[0] = ball_position[constants.FRAME_Y]
+            ball_y[0] = ball_position[constants.FRAME_X]
+            ball_valid[0] = True
+
+        player_x = np.zeros((1, MAX_PLAYERS))
+        player_y = np.zeros((1, MAX_PLAYERS))
+        player_valid = np.zeros((1, MAX_PLAYERS), dtype=bool)
+        for player_key, player_position in message[constants.FRAME_PLAYER].items():
+            column = int(player_key) - 1
+            if column < MAX_PLAYERS:
+                player_x[0, column] = player_position[constants.FRAME_Y]
+                player_y[0, column] = player_position[constants.FRAME_X]
+                player_valid[0, column] = True
+        return cls(ball_x, ball_y, ball_valid, player_x, player_y, player_valid)
+
+
+class SpatialOperand:
+    """
+    An operand computed from the positions of several actors, written as a function in the conditions:
+        - dist(a, b): the distance between two entities (ball, player.N, or a team's centroid: orange / blue);
+        - in_zone(entity, zone): whether the entity is in a zone of the field (see ZONES), or, for the players,
+          in a zone relative to their team (see TEAM_ZONES);
+        - closest_to_ball(team): the number of the team's player closest to the ball (team: orange, blue or any);
+        - closest_dist_to_ball(team): the distance between the ball and the team's player closest to it;
+        - centroid_x(team), centroid_y(team): the average position of the team's players.
+
+    The teams are only known once the players' information is bound (see bind_players); until then, the operands
+    which depend on the teams have no value, so the conditions using them are incomplete.
+    """
+
+    FUNCTION_ARGUMENT_COUNTS = {
+        "dist": 2,
+        "in_zone": 2,
+        "closest_to_ball": 1,
+        "closest_dist_to_ball": 1,
+        "centroid_x": 1,
+        "centroid_y": 1,
+    }
+
+    # a spatial function call, whose arguments (entity, zone and team names) are turned into strings before the
+    # condition is parsed, as 'player.1' is not a valid Python expression
+    CALL_PATTERN = re.compile(r"\b(" + "|".join(FUNCTION_ARGUMENT_COUNTS) + r")\s*\(([^()]*)\)")
+
+    def __init__(self, function: str, arguments: list):
+        argument_count = SpatialOperand.FUNCTION_ARGUMENT_COUNTS[function]
+        if len(arguments) != argument_count:
+            raise QueryParseException("'" + function + "' takes " + str(argument_count) + " argument(s).")
+        if function == "dist":
+            for argument in arguments:
+                SpatialOperand.validate_entity(argument)
+        elif function == "in_zone":
+            SpatialOperand.validate_entity(arguments[0])
+            if arguments[1] not in ZONES and arguments[1] not in TEAM_ZONES:
+                raise QueryParseException("Unknown zone '" + arguments[1] + "'.")
+            if arguments[1] in TEAM_ZONES and arguments[0] == "ball":
+                raise QueryParseException("The zone '" + arguments[1] + "' can't be used for the ball.")
+        elif arguments[0] not in (TEAM_ORANGE, TEAM_BLUE, TEAM_ANY) or \
+                arguments[0] == TEAM_ANY and function.startswith("centroid"):
+            raise QueryParseException("Unknown team '" + arguments[0] + "' for '" + function + "'.")
+
+        self.function = function
+        self.arguments = arguments
+        self.key = function + "(" + ", ".join(arguments) + ")"
+        self.identifier = "spatial_" + hashlib.sha1(self.key.encode()).hexdigest()[:16]
+
+        # the team of every player column, once the players' information is bound
+        self.player_teams = None
+
+    @staticmethod
+    def validate_entity(entity: str):
+        if ENTITY_PATTERN.match(entity) is None:
+            raise QueryParseException("Unknown entity '" + entity + "' (use ball, player.N, orange or blue).")
+
+    @staticmethod
+    def quote_arguments(match) -> str:
+        arguments = [argument.strip() for argument in match.group(2).split(",")]
+        return match.group(1) + "(" + ", ".join("\"" + argument + "\"" for argument in arguments) + ")"
+
+    def bind_players(self, player_info: list):
+        self.player_teams = []
+        for player_index in range(MAX_PLAYERS):
+            if player_index >= len(player_info):
+                self.player_teams.append(None)
+            elif player_info[player_index][constants.STORED_PLAYER_TEAM] == constants.STORED_PLAYER_TEAM_1:
+                self.player_teams.append(TEAM_ORANGE)
+            else:
+                self.player_teams.append(TEAM_BLUE)
+
+    def team_mask(self, team: str):
+        """
+        Returns a mask of the team's player columns, or None if the teams are not known.
+        """
+        if team == TEAM_ANY:
+            return np.ones(MAX_PLAYERS, dtype=bool)
+        if self.player_teams is None:
+            return None
+        return np.array([player_team == team for player_team in self.player_teams])
+
+    def entity_position(self, entity: str, positions: SpatialPositions) -> tuple:
+        """
+        Returns the x, y and valid columns of an entity (a team's entity being its centroid).
+        """
+        if entity == "ball":
+            return positions.ball_x, positions.ball_y, positions.ball_valid
+        if entity.startswith("player."):
+            column = int(entity[len("player."):]) - 1
+            return positions.player_x[:, column], positions.player_y[:, column], positions.player_valid[:, column]
+
+        frame_count = len(positions.ball_x)
+        team_mask = self.team_mask(entity)
+        if team_mask is None:
+            return np.zeros(frame_count), np.zeros(frame_count), np.zeros(frame_count, dtype=bool)
+        players = positions.player_valid & team_mask
+        player_counts = players.sum(axis=1)
+        divisors = np.maximum(player_counts, 1)
+        return (np.where(players, positions.player_x, 0).sum(axis=1) / divisors,
+                np.where(players, positions.player_y, 0).sum(axis=1) / divisors,
+                player_counts > 0)
+
+    def entity_team(self, entity: str):
+        if entity in (TEAM_ORANGE, TEAM_BLUE):
+            return entity
+        if entity.startswith("player.") and self.player_teams is not None:
+            return self.player_teams[int(entity[len("player."):]) - 1]
+        return None
+
+    def evaluate_columns(self, positions: SpatialPositions) -> (np.ndarray, np.ndarray):
+        """
+        Computes the operand for all the frames of the positions at once; returns its values and a mask of the
+        frames in which it has a value.
+        """
+        frame_count = len(positions.ball_x)
+        if self.function == "dist":
+            first_x, first_y, first_valid = self.entity_position(self.arguments[0], positions)
+            second_x, second_y, second_valid = self.entity_position(self.arguments[1], positions)
+            return np.hypot(first_x - second_x, first_y - second_y), first_valid & second_valid
+
+        if self.function == "in_zone":
+            entity_x, _, entity_valid = self.entity_position(self.arguments[0], positions)
+            zone = self.arguments[1]
+            if zone in TEAM_ZONES:
+                entity_team = self.entity_team(self.arguments[0])
+                if entity_team is None:
+                    return np.zeros(frame_count, dtype=bool), np.zeros(frame_count, dtype=bool)
+                zone = TEAM_ZONES[zone][0 if entity_team == TEAM_ORANGE else 1]
+            lower_bound, upper_bound = ZONES[zone]
+            return (entity_x >= lower_bound) & (entity_x < upper_bound), entity_valid
+
+        if self.function in ("centroid_x", "centroid_y"):
+            centroid_x, centroid_y, centroid_valid = self.entity_position(self.arguments[0], positions)
+            return (centroid_x if self.function == "centroid_x" else centroid_y), centroid_valid
+
+        # closest_to_ball / closest_dist_to_ball
+        team_mask = self.team_mask(self.arguments[0])
+        if team_mask is None:
+            return np.zeros(frame_count), np.zeros(frame_count, dtype=bool)
+        distances = np.hypot(positions.player_x - positions.ball_x[:, np.newaxis],
+                             positions.player_y - positions.ball_y[:, np.newaxis])
+        distances = np.where(positions.player_valid & team_mask, distances, np.inf)
+        closest_columns = np.argmin(distances, axis=1)
+        closest_distances = distances[np.arange(frame_count), closest_columns]
+        valid = positions.ball_valid & np.isfinite(closest_distances)
+        if self.function == "closest_to_ball":
+            return (closest_columns + 1).astype(np.float64), valid
+        return np.where(valid, closest_distances, 0), valid
+
+    def evaluate_message(self, positions: SpatialPositions):
+        """
+        Computes the operand for a single message's positions; returns its value, or None if it has none.
+        """
+        values, valid = self.evaluate_columns(positions)
+        if not valid[0]:
+            return None
+        return values[0].item()
@@ -0,0 +1,15 @@
+import pytest
+
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import write_replay
+
+
+@pytest.fixture(scope="session")
+def generated_replay(tmp_path_factory) -> (list, object):
+    """
+    The players' information and the frame table (with its events) of a generated minute of a 3v3 game with 3
+    goals, read like a replay file.
+    """
+    replay_file = str(tmp_path_factory.mktemp("replays") / "generated.json")
+    write_replay(replay_file, seconds=60, player_count=6, goal_count=3)
+    return replay_parser.read_replay(replay_file)
@@ -0,0 +1,140 @@
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import FIRST_PLAYER_INFO_ACTOR_ID, first_frame_updates, generate_replay, \
+    position_update
+
+
+def extract_frames_without_index(replay_json: dict, player_info: list) -> list:
+    """
+    The frame extraction as it was before the actor ids were tracked by an ActorRoleIndex: every actor update is
+    compared with the ball's id and with the id of every player, which are taken from the spawning updates.
+    """
+    id_ball = -1
+    id_players = [-1 for _ in player_info]
+    extracted_frames = []
+    for frame in replay_json[constants.FRAMES]:
+        extracted_frame = {
+            constants.FRAME_TIME: frame[constants.TIME],
+            constants.FRAME_PLAYER: {},
+        }
+        for actor_update in frame[constants.ACTOR_UPDATES]:
+            if id_ball != -1 and actor_update.get(constants.ID, -1) == id_ball or \
+                    actor_update.get(constants.CLASS_NAME, "") == constants.BALL_CLASS_NAME:
+                id_ball = actor_update.get(constants.ID, -1)
+                ball_position = actor_update[constants.ACTOR_STATE][constants.POSITION]
+                extracted_frame[constants.FRAME_BALL] = {
+                    constants.FRAME_X: ball_position[constants.AXIS_X],
+                    constants.FRAME_Y: ball_position[constants.AXIS_Y],
+                }
+
+            for player_index, id_player in enumerate(id_players):
+                if id_player != -1 and actor_update.get(constants.ID, -1) == id_player \
+                        or actor_update.get(constants.CLASS_NAME, "") == constants.PLAYER_CAR_CLASS_NAME \
+                        and player_info[player_index][constants.STORED_PLAYER_ID] \
+                        == actor_update[constants.PLAYER_INFO_REFERENCE][constants.ACTOR_ID]:
+                    id_players[player_index] = actor_update.get(constants.ID, -1)
+                    if actor_update.get(constants.ACTOR_STATE, None) is not None:
+                        player_position = actor_update[constants.ACTOR_STATE][constants.POSITION]
+                        extracted_frame[constants.FRAME_PLAYER][str(player_index + 1)] = {
+                            constants.FRAME_X: player_position[constants.AXIS_X],
+                            constants.FRAME_Y: player_position[constants.AXIS_Y],
+                        }
+        extracted_frames.append(extracted_frame)
+    return extracted_frames
+
+
+def without_ages(extracted_frames: list) -> list:
+    """
+    Removes the positions' ages (which didn't exist before the index) from the extracted frames, checking that
+    they are all 0, as no position is carried forward.
+    """
+    for extracted_frame in extracted_frames:
+        positions = list(extracted_frame[constants.FRAME_PLAYER].values())
+        if constants.FRAME_BALL in extracted_frame:
+            positions.append(extracted_frame[constants.FRAME_BALL])
+        for position in positions:
+            assert position.pop(constants.FRAME_AGE) == 0
+    return extracted_frames
+
+
+def test_extraction_matches_the_extraction_without_index():
+    # the goal resets destroy the ball and the cars, and spawn them again with new actor ids
+    replay_json = generate_replay(seconds=60, player_count=6, goal_count=3)
+    player_info = replay_parser.extract_player_info(replay_json[constants.FRAMES][0])
+
+    extracted_frames = replay_parser.extract_frames(replay_json, player_info, carry_forward=False)
+
+    assert len(extracted_frames) == len(replay_json[constants.FRAMES])
+    assert without_ages(extracted_frames) == extract_frames_without_index(replay_json, player_info)
+
+
+def spawn_update(actor_id: int, class_name: str, x: float, y: float, player_info_actor_id: int = None) -> dict:
+    actor_update = position_update(actor_id, x, y)
+    actor_update[constants.CLASS_NAME] = class_name
+    if player_info_actor_id is not None:
+        actor_update[constants.PLAYER_INFO_REFERENCE] = {constants.ACTOR_ID: player_info_actor_id}
+    return actor_update
+
+
+def replay_frame(frame_time: float, actor_updates: list, deleted_actor_ids: list = ()) -> dict:
+    return {
+        constants.TIME: frame_time,
+        constants.DELETED_ACTOR_IDS: list(deleted_actor_ids),
+        constants.ACTOR_UPDATES: actor_updates,
+    }
+
+
+def first_replay_frame() -> dict:
+    # the ball on id 5, and the cars of players 1 and 2 on ids 6 and 7
+    return replay_frame(0, first_frame_updates(2) + [
+        spawn_update(5, constants.BALL_CLASS_NAME, 0, 0),
+        spawn_update(6, constants.PLAYER_CAR_CLASS_NAME, -1000, 0, FIRST_PLAYER_INFO_ACTOR_ID),
+        spawn_update(7, constants.PLAYER_CAR_CLASS_NAME, 1000, 0, FIRST_PLAYER_INFO_ACTOR_ID + 1),
+    ])
+
+
+def positions(extracted_frame: dict) -> dict:
+    # role -> (x, y)
+    frame_positions = {role: (position[constants.FRAME_X], position[constants.FRAME_Y])
+                       for role, position in extracted_frame[constants.FRAME_PLAYER].items()}
+    if constants.FRAME_BALL in extracted_frame:
+        ball_position = extracted_frame[constants.FRAME_BALL]
+        frame_positions[constants.FRAME_BALL] = (ball_position[constants.FRAME_X], ball_position[constants.FRAME_Y])
+    return frame_positions
+
+
+def test_destroyed_ids_spawned_again_as_other_actors():
+    # after the goal reset, the old ball's id is player 2's car, and player 2's old id is the ball
+    replay_frames = [
+        first_replay_frame(),
+        replay_frame(1, [position_update(5, 100, 200), position_update(6, -900, 0)]),
+        replay_frame(2, [spawn_update(7, constants.BALL_CLASS_NAME, 0, 0),
+                         spawn_update(8, constants.PLAYER_CAR_CLASS_NAME, -2000, 0, FIRST_PLAYER_INFO_ACTOR_ID),
+                         spawn_update(5, constants.PLAYER_CAR_CLASS_NAME, 2000, 0, FIRST_PLAYER_INFO_ACTOR_ID + 1)],
+                     [5, 6, 7]),
+        replay_frame(3, [position_update(5, 2100, 0), position_update(7, 50, 50), position_update(8, -2100, 0)]),
+    ]
+    player_info = replay_parser.extract_player_info(replay_frames[0])
+
+    extracted_frames = replay_parser.extract_frames(replay_frames, player_info, carry_forward=False)
+
+    assert [positions(extracted_frame) for extracted_frame in extracted_frames[1:]] == [
+        {constants.FRAME_BALL: (100, 200), "1": (-900, 0)},
+        {constants.FRAME_BALL: (0, 0), "1": (-2000, 0), "2": (2000, 0)},
+        {constants.FRAME_BALL: (50, 50), "1": (-2100, 0), "2": (2100, 0)},
+    ]
+
+
+def test_id_spawned_again_without_being_destroyed():
+    # the ball's id is given to player 1's car before the new ball is spawned on another id
+    replay_frames = [
+        first_replay_frame(),
+        replay_frame(1, [spawn_update(5, constants.PLAYER_CAR_CLASS_NAME, -2000, 0, FIRST_PLAYER_INFO_ACTOR_ID)]),
+        replay_frame(2, [spawn_update(9, constants.BALL_CLASS_NAME, 0, 0)]),
+        replay_frame(3, [position_update(5, -2100, 0), position_update(9, 50, 50)]),
+    ]
+    player_info = replay_parser.extract_player_info(replay_frames[0])
+
+    extracted_frames = replay_parser.extract_frames(replay_frames, player_info, carry_forward=False)
+
+    assert positions(extracted_frames[-1]) == {constants.FRAME_BALL: (50, 50), "1": (-2100, 0)}
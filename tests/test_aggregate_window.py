@@ -0,0 +1,98 @@
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import generate_replay
+from src.frame_table import FrameTable
+from src.query_condition import AggregateWindow, QueryCondition
+
+AGGREGATES = [
+    "avg(ball.x, 2 seconds)",
+    "sum(player.1.y - ball.y, 0.5 seconds)",
+    "min(player.2.x, 1 seconds)",
+    "max(ball.y + player.3.y, 3 seconds)",
+    "count(ball.x > 0, 1.5 seconds)",
+    "avg(player.4.x, 1 entries)",
+    "min(ball.x * 2, 30 entries)",
+    "max(player.1.x, 7 entries)",
+    "sum(player.2.y, 45 entries)",
+    "count(player.3.x < ball.x, 10 entries)",
+    # windows which are empty whenever the frame doesn't update the player
+    "avg(player.3.x, 0 seconds)",
+    "count(player.4.y > 0, 0.01 seconds)",
+]
+
+
+def brute_force_values(aggregate: AggregateWindow, extracted_frames: list) -> list:
+    """
+    The aggregate's value for every frame, computed from scratch over all the entries in the frame's window.
+    """
+    entries = []
+    values = []
+    for extracted_frame in extracted_frames:
+        message_time = extracted_frame[constants.FRAME_TIME]
+        arguments = [QueryCondition.resolve_operand(extracted_frame, QueryCondition.PARSED_OPERAND_VALUES[operand])
+                     for operand in aggregate.operands]
+        if None not in arguments:
+            entries.append((message_time, float(aggregate.expression_function(*arguments))))
+
+        if aggregate.window_type == AggregateWindow.WINDOW_ENTRIES:
+            window = [value for _, value in entries[max(len(entries) - int(aggregate.window_value), 0):]]
+        else:
+            window = [value for entry_time, value in entries if message_time - entry_time <= aggregate.window_value]
+
+        if aggregate.function == AggregateWindow.FUNCTION_COUNT:
+            values.append(float(sum(value != 0 for value in window)))
+        elif not window:
+            values.append(None)
+        elif aggregate.function == AggregateWindow.FUNCTION_AVG:
+            values.append(sum(window) / len(window))
+        elif aggregate.function == AggregateWindow.FUNCTION_SUM:
+            values.append(sum(window))
+        else:
+            values.append(min(window) if aggregate.function == AggregateWindow.FUNCTION_MIN else max(window))
+    return values
+
+
+def generated_frames() -> list:
+    # without carrying the positions forward, so the players are often missing from the windows' entries
+    replay_json = generate_replay(seconds=30, player_count=4, goal_count=2)
+    player_info = replay_parser.extract_player_info(replay_json[constants.FRAMES][0])
+    return replay_parser.extract_frames(replay_json, player_info, carry_forward=False)
+
+
+@pytest.mark.parametrize("aggregate_text", AGGREGATES)
+def test_window_matches_the_brute_force(aggregate_text):
+    extracted_frames = generated_frames()
+    aggregate = QueryCondition(aggregate_text + " > 0").aggregates[0]
+
+    values = []
+    for extracted_frame in extracted_frames:
+        operand_values = {operand: QueryCondition.resolve_operand(extracted_frame,
+                                                                  QueryCondition.PARSED_OPERAND_VALUES[operand])
+                          for operand in aggregate.operands}
+        values.append(aggregate.add_message(operand_values, extracted_frame[constants.FRAME_TIME]))
+
+    expected_values = brute_force_values(aggregate, extracted_frames)
+    assert [value is None for value in values] == [value is None for value in expected_values]
+    assert [value for value in values if value is not None] == \
+        pytest.approx([value for value in expected_values if value is not None])
+
+
+@pytest.mark.parametrize("aggregate_text", AGGREGATES)
+def test_vectorized_window_matches_the_brute_force(aggregate_text):
+    extracted_frames = generated_frames()
+    frame_table = FrameTable.from_frames(extracted_frames, 4)
+    condition = QueryCondition(aggregate_text + " > 0")
+    aggregate = condition.aggregates[0]
+    columns = {}
+    valid_columns = {}
+    for operand, operand_path in zip(condition.operands, condition.operand_paths):
+        identifier = QueryCondition.operand_identifier(operand)
+        columns[identifier], valid_columns[identifier] = frame_table.operand_column(operand_path)
+
+    values, valid = aggregate.evaluate_columns(condition, columns, valid_columns, frame_table.time)
+
+    expected_values = brute_force_values(aggregate, extracted_frames)
+    assert list(valid) == [value is not None for value in expected_values]
+    assert list(values[valid]) == pytest.approx([value for value in expected_values if value is not None])
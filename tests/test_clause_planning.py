@@ -0,0 +1,128 @@
+import itertools
+
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import generate_replay
+from src.frame_table import FrameTable
+from src.query_condition import QueryCondition
+
+CONDITIONS = [
+    "ball.x > 0 and player.1.x > -2000 and player.2.y < 1000",
+    "ball.x > 100000 or player.3.x < ball.x or not player.4.y > 0",
+    "max(ball.x, 2 seconds) > 1000 and dist(player.1, ball) < 3000 and player.2.x > midfield.x",
+]
+
+
+def generated_frames() -> (list, list):
+    # without carrying the positions forward, so the clauses are often unknown
+    replay_json = generate_replay(seconds=20, player_count=4, goal_count=1)
+    player_info = replay_parser.extract_player_info(replay_json[constants.FRAMES][0])
+    return player_info, replay_parser.extract_frames(replay_json, player_info, carry_forward=False)
+
+
+def message(ball_x: float = None, player_1_x: float = None) -> dict:
+    # the frames' coordinates are reversed: the conditions' x is the frames' y
+    extracted_frame = {constants.FRAME_TIME: 0.0, constants.FRAME_PLAYER: {}}
+    if ball_x is not None:
+        extracted_frame[constants.FRAME_BALL] = {constants.FRAME_X: 0.0, constants.FRAME_Y: ball_x,
+                                                 constants.FRAME_AGE: 0.0}
+    if player_1_x is not None:
+        extracted_frame[constants.FRAME_PLAYER]["1"] = {constants.FRAME_X: 0.0, constants.FRAME_Y: player_1_x,
+                                                        constants.FRAME_AGE: 0.0}
+    return extracted_frame
+
+
+def evaluate_in_order(condition: str, player_info: list, extracted_frames: list, clause_order: list = None) -> list:
+    """
+    Evaluates the condition for every frame, with the clauses in the given order (by their written position) and
+    without sampling them, or as planned if no order is given.
+    """
+    query_condition = QueryCondition(condition)
+    query_condition.bind_players(player_info)
+    if clause_order is not None:
+        query_condition.clause_order = [query_condition.clauses[position] for position in clause_order]
+        query_condition.sampled_messages = constants.CLAUSE_SAMPLE_MESSAGES
+    return [query_condition.evaluate(extracted_frame) for extracted_frame in extracted_frames]
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_clause_order_does_not_change_the_results(condition):
+    player_info, extracted_frames = generated_frames()
+    written_order_results = evaluate_in_order(condition, player_info, extracted_frames, [0, 1, 2])
+
+    assert set(written_order_results) == {QueryCondition.CORRECT, QueryCondition.INCORRECT,
+                                          QueryCondition.INCOMPLETE}
+    for clause_order in itertools.permutations(range(3)):
+        assert evaluate_in_order(condition, player_info, extracted_frames, list(clause_order)) == \
+            written_order_results
+    # sampled and planned on the first messages
+    assert evaluate_in_order(condition, player_info, extracted_frames) == written_order_results
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_planned_clauses_match_the_vectorized_evaluation(condition):
+    player_info, extracted_frames = generated_frames()
+    frame_table = FrameTable.from_frames(extracted_frames, len(player_info))
+    query_condition = QueryCondition(condition)
+    query_condition.bind_players(player_info)
+
+    query_condition.sample_clauses(frame_table)
+    results = [query_condition.evaluate(extracted_frame) for extracted_frame in extracted_frames]
+
+    vectorized_condition = QueryCondition(condition)
+    vectorized_condition.bind_players(player_info)
+    correct, incomplete, errors = vectorized_condition.evaluate_columns(frame_table)
+    assert results == [QueryCondition.ERROR if error else QueryCondition.INCOMPLETE if unknown
+                       else QueryCondition.CORRECT if passed else QueryCondition.INCORRECT
+                       for passed, unknown, error in zip(correct, incomplete, errors)]
+
+
+def test_the_most_decisive_clause_is_evaluated_first():
+    player_info, extracted_frames = generated_frames()
+    query_condition = QueryCondition("ball.x > -100000 and player.1.x > -100000 and ball.y > 100000")
+
+    query_condition.sample_clauses(FrameTable.from_frames(extracted_frames, len(player_info)))
+
+    # the last clause is never true, so it decides the conjunction in every frame in which the ball is known
+    assert query_condition.clause_order[0] is query_condition.clauses[2]
+    assert sorted(map(id, query_condition.clause_order)) == sorted(map(id, query_condition.clauses))
+
+
+def test_clauses_which_may_fail_keep_their_place():
+    player_info, extracted_frames = generated_frames()
+    query_condition = QueryCondition("ball.x > -100000 and 1 / (ball.y - ball.y) > 0 and player.1.x > 100000 "
+                                     "and ball.y > 100000")
+
+    query_condition.sample_clauses(FrameTable.from_frames(extracted_frames, len(player_info)))
+
+    # the never true clauses are only reordered after the division, so the division still fails first
+    assert query_condition.clause_order[:2] == query_condition.clauses[:2]
+    results = [query_condition.evaluate(extracted_frame) for extracted_frame in extracted_frames]
+    assert all(result == QueryCondition.ERROR for result, extracted_frame in zip(results, extracted_frames)
+               if constants.FRAME_BALL in extracted_frame)
+    assert results == evaluate_in_order(query_condition.condition, player_info, extracted_frames, [0, 1, 2, 3])
+
+
+@pytest.mark.parametrize("condition, extracted_frame, expected_result", [
+    # a known clause which decides the result wins over an unknown clause, in any order
+    ("ball.x > 0 and player.1.x > 0", message(ball_x=-100), QueryCondition.INCORRECT),
+    ("player.1.x > 0 and ball.x > 0", message(ball_x=-100), QueryCondition.INCORRECT),
+    ("ball.x > 0 or player.1.x > 0", message(ball_x=100), QueryCondition.CORRECT),
+    ("player.1.x > 0 or ball.x > 0", message(ball_x=100), QueryCondition.CORRECT),
+    # otherwise, the unknown clause makes the result incomplete
+    ("ball.x > 0 and player.1.x > 0", message(ball_x=100), QueryCondition.INCOMPLETE),
+    ("player.1.x > 0 or ball.x > 0", message(ball_x=-100), QueryCondition.INCOMPLETE),
+    ("ball.x > 0 and player.1.x > 0", message(), QueryCondition.INCOMPLETE),
+    ("ball.x > 0 and player.1.x > 0", message(ball_x=100, player_1_x=100), QueryCondition.CORRECT),
+])
+def test_incomplete_clauses_and_deciding_clauses(condition, extracted_frame, expected_result):
+    player_info = replay_parser.extract_player_info({constants.ACTOR_UPDATES: []})
+    frame_table = FrameTable.from_frames([extracted_frame], 1)
+
+    for clause_order in ([0, 1], [1, 0]):
+        assert evaluate_in_order(condition, player_info, [extracted_frame], clause_order) == [expected_result]
+    correct, incomplete, errors = QueryCondition(condition).evaluate_columns(frame_table)
+    assert (bool(correct[0]), bool(incomplete[0]), bool(errors[0])) == \
+        (expected_result == QueryCondition.CORRECT, expected_result == QueryCondition.INCOMPLETE, False)
@@ -0,0 +1,77 @@
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import first_frame_updates, position_update
+from src.event_table import EventDetector, EventTable
+
+BALL_ACTOR_ID = 100
+CAR_ACTOR_IDS = (101, 102)
+NEXT_BALL_ACTOR_ID = 103
+
+
+def spawn_update(actor_update: dict, class_name: str) -> dict:
+    actor_update[constants.CLASS_NAME] = class_name
+    return actor_update
+
+
+def frame(frame_time: float, actor_updates: list, deleted_actor_ids: list = ()) -> dict:
+    return {
+        constants.TIME: frame_time,
+        constants.DELETED_ACTOR_IDS: list(deleted_actor_ids),
+        constants.ACTOR_UPDATES: actor_updates,
+    }
+
+
+def goal_replay(ball_ys: list) -> list:
+    """
+    A replay in which the ball moves along the given y (at x = 0), far from the cars, and is then destroyed by the
+    goal reset and spawned again for the next kickoff.
+    """
+    first_updates = first_frame_updates(2) + [spawn_update(position_update(BALL_ACTOR_ID, 0, 0),
+                                                           constants.BALL_CLASS_NAME)]
+    for player_index, car_actor_id in enumerate(CAR_ACTOR_IDS):
+        car_update = spawn_update(position_update(car_actor_id, -2000 + player_index * 4000, 0),
+                                  constants.PLAYER_CAR_CLASS_NAME)
+        car_update[constants.PLAYER_INFO_REFERENCE] = {constants.ACTOR_ID: 20 + player_index}
+        first_updates.append(car_update)
+
+    replay_frames = [frame(0, first_updates)]
+    for ball_y in ball_ys:
+        replay_frames.append(frame(len(replay_frames) * 0.1, [position_update(BALL_ACTOR_ID, 0, ball_y)]))
+    replay_frames.append(frame(len(replay_frames) * 0.1,
+                               [spawn_update(position_update(NEXT_BALL_ACTOR_ID, 0, 0), constants.BALL_CLASS_NAME)],
+                               [BALL_ACTOR_ID]))
+    return replay_frames
+
+
+def detect_events(replay_frames: list) -> EventTable:
+    player_info = replay_parser.extract_player_info(replay_frames[0])
+    event_detector = EventDetector(player_info)
+    replay_parser.extract_frames(replay_frames, player_info, event_detector=event_detector)
+    return event_detector.events
+
+
+def goals(events: EventTable) -> list:
+    return [(event_time, team) for event_time, event_type, team in zip(events.times, events.types, events.teams)
+            if event_type == EventTable.GOAL]
+
+
+def test_goal_in_the_real_positions_range():
+    # the real replays stop updating the ball before it is past the line (their maximum y is 5212.18)
+    replay_frames = goal_replay([3000, 5000, 5200, 5212])
+
+    events = detect_events(replay_frames)
+
+    assert goals(events) == [(replay_frames[-1][constants.TIME], EventTable.TEAM_ORANGE)]
+    assert events.types.count(EventTable.KICKOFF) == 2
+
+
+def test_goal_in_the_orange_goal():
+    events = detect_events(goal_replay([-3000, -5000, -5213.3]))
+
+    assert [team for _, team in goals(events)] == [EventTable.TEAM_BLUE]
+
+
+def test_ball_destroyed_away_from_the_goals():
+    events = detect_events(goal_replay([1000, 2000]))
+
+    assert goals(events) == []
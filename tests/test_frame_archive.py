@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from src.frame_archive import FrameArchive, load_archive, write_archive
+from src.frame_table import FrameTable
+
+BLOCK_FRAMES = 256
+TIME_TOLERANCE = 0.5 / constants.ARCHIVE_TIME_SCALE
+POSITION_TOLERANCE = 0.5 / constants.ARCHIVE_POSITION_SCALE
+
+
+def assert_same_frames(frame_table, expected_table):
+    assert len(frame_table) == len(expected_table)
+    assert np.abs(frame_table.time - expected_table.time).max(initial=0) <= TIME_TOLERANCE
+    assert np.array_equal(frame_table.ball_valid, expected_table.ball_valid)
+    assert np.array_equal(frame_table.player_valid, expected_table.player_valid)
+
+    ball_valid = expected_table.ball_valid
+    player_valid = expected_table.player_valid
+    for column, expected_column, valid in ((frame_table.ball_x, expected_table.ball_x, ball_valid),
+                                           (frame_table.ball_y, expected_table.ball_y, ball_valid),
+                                           (frame_table.player_x, expected_table.player_x, player_valid),
+                                           (frame_table.player_y, expected_table.player_y, player_valid)):
+        assert np.abs(column[valid] - expected_column[valid]).max(initial=0) <= POSITION_TOLERANCE
+    # the ages are the differences of two quantized times
+    for age, expected_age, valid in ((frame_table.ball_age, expected_table.ball_age, ball_valid),
+                                     (frame_table.player_age, expected_table.player_age, player_valid)):
+        assert np.abs(age[valid] - expected_age[valid]).max(initial=0) <= 2 * TIME_TOLERANCE
+
+
+@pytest.fixture
+def archive_file(generated_replay, tmp_path) -> str:
+    player_info, frame_table = generated_replay
+    archive_file = str(tmp_path / ("generated" + constants.ARCHIVE_EXTENSION))
+    write_archive(archive_file, player_info, frame_table, block_frames=BLOCK_FRAMES)
+    return archive_file
+
+
+def test_round_trip(generated_replay, archive_file):
+    player_info, frame_table = generated_replay
+
+    archived_player_info, archived_table = load_archive(archive_file)
+
+    assert archived_player_info == player_info
+    assert FrameArchive(archive_file).block_count == (len(frame_table) + BLOCK_FRAMES - 1) // BLOCK_FRAMES
+    assert_same_frames(archived_table, frame_table)
+
+    events = frame_table.events
+    archived_events = archived_table.events
+    assert len(events.times) > 0
+    assert archived_events.times == pytest.approx(events.times, abs=TIME_TOLERANCE)
+    assert (archived_events.types, archived_events.players, archived_events.teams) == \
+        (events.types, events.players, events.teams)
+
+
+def test_archives_are_loaded_like_replays(generated_replay, archive_file):
+    player_info, frame_table = generated_replay
+
+    archived_player_info, archived_table = replay_parser.load_replay(archive_file)
+
+    assert archived_player_info == player_info
+    assert_same_frames(archived_table, frame_table)
+
+
+@pytest.mark.parametrize("start_time, end_time", [(10, 20), (None, 5), (55, None), (8.5, 8.5), (30.01, 30.02),
+                                                  (100, 200)])
+def test_time_range_reads_only_the_frames_in_the_range(generated_replay, archive_file, start_time, end_time):
+    _, frame_table = generated_replay
+    frame_archive = FrameArchive(archive_file)
+    decoded_times = np.round(frame_table.time * constants.ARCHIVE_TIME_SCALE) / constants.ARCHIVE_TIME_SCALE
+    in_range = np.ones(len(frame_table), dtype=bool)
+    if start_time is not None:
+        in_range &= decoded_times >= start_time
+    if end_time is not None:
+        in_range &= decoded_times <= end_time
+
+    range_table = frame_archive.read_frame_table(start_time, end_time)
+
+    assert_same_frames(range_table, FrameTable.from_columns({column_name: getattr(frame_table, column_name)[in_range]
+                                                             for column_name in FrameTable.COLUMNS}))
+    # only the blocks whose time span overlaps the range are decoded
+    block_starts = decoded_times[::BLOCK_FRAMES]
+    block_ends = decoded_times[BLOCK_FRAMES - 1::BLOCK_FRAMES].tolist() + [decoded_times[-1]]
+    overlapping_blocks = {block for block, (block_start, block_end) in enumerate(zip(block_starts, block_ends))
+                          if (start_time is None or block_end >= start_time)
+                          and (end_time is None or block_start <= end_time)}
+    assert set(frame_archive.find_blocks(start_time, end_time)) == overlapping_blocks
+    assert set(np.flatnonzero(in_range) // BLOCK_FRAMES) <= overlapping_blocks
+
+
+def test_iterated_frames_match_the_frame_table(archive_file):
+    frame_archive = FrameArchive(archive_file)
+    frame_table = frame_archive.read_frame_table()
+
+    assert list(frame_archive.iterate_frames(20, 25)) == \
+        [frame_table.frame(index) for index in range(len(frame_table)) if 20 <= frame_table.time[index] <= 25]
+
+
+def test_other_files_are_rejected(tmp_path):
+    not_an_archive = tmp_path / ("replay" + constants.ARCHIVE_EXTENSION)
+    not_an_archive.write_bytes(b"{\"Frames\": []}" * 10)
+
+    with pytest.raises(ValueError):
+        FrameArchive(str(not_an_archive))
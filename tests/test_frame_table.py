@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import FIRST_PLAYER_INFO_ACTOR_ID, first_frame_updates, generate_replay, \
+    position_update
+from src.frame_table import FrameTable
+
+BALL_ACTOR_ID = 5
+CAR_ACTOR_IDS = (6, 7)
+
+
+def spawn_update(actor_id: int, class_name: str, x: float, y: float, player_info_actor_id: int = None) -> dict:
+    actor_update = position_update(actor_id, x, y)
+    actor_update[constants.CLASS_NAME] = class_name
+    if player_info_actor_id is not None:
+        actor_update[constants.PLAYER_INFO_REFERENCE] = {constants.ACTOR_ID: player_info_actor_id}
+    return actor_update
+
+
+def replay_frame(frame_time: float, actor_updates: list) -> dict:
+    return {
+        constants.TIME: frame_time,
+        constants.DELETED_ACTOR_IDS: [],
+        constants.ACTOR_UPDATES: actor_updates,
+    }
+
+
+def sparse_replay() -> list:
+    # the ball moves along x until it stops updating for 2 seconds; player 2's car only spawns at 1 second
+    return [
+        replay_frame(0, first_frame_updates(2) + [
+            spawn_update(BALL_ACTOR_ID, constants.BALL_CLASS_NAME, 0, 0),
+            spawn_update(CAR_ACTOR_IDS[0], constants.PLAYER_CAR_CLASS_NAME, -1000, 0, FIRST_PLAYER_INFO_ACTOR_ID),
+        ]),
+        replay_frame(0.5, [position_update(BALL_ACTOR_ID, 100, 50)]),
+        replay_frame(1, [position_update(BALL_ACTOR_ID, 200, 100),
+                         spawn_update(CAR_ACTOR_IDS[1], constants.PLAYER_CAR_CLASS_NAME, 1000, 0,
+                                      FIRST_PLAYER_INFO_ACTOR_ID + 1)]),
+        replay_frame(2, [position_update(CAR_ACTOR_IDS[0], -900, 0)]),
+        replay_frame(3, [position_update(BALL_ACTOR_ID, 500, 100)]),
+    ]
+
+
+def extract(replay_frames: list, carry_forward: bool = True) -> list:
+    player_info = replay_parser.extract_player_info(replay_frames[0])
+    return replay_parser.extract_frames(replay_frames, player_info, carry_forward=carry_forward)
+
+
+def positions(extracted_frame: dict) -> dict:
+    # role -> (x, y, age)
+    frame_positions = {role: (position[constants.FRAME_X], position[constants.FRAME_Y], position[constants.FRAME_AGE])
+                       for role, position in extracted_frame[constants.FRAME_PLAYER].items()}
+    if constants.FRAME_BALL in extracted_frame:
+        ball_position = extracted_frame[constants.FRAME_BALL]
+        frame_positions[constants.FRAME_BALL] = (ball_position[constants.FRAME_X], ball_position[constants.FRAME_Y],
+                                                 ball_position[constants.FRAME_AGE])
+    return frame_positions
+
+
+def test_positions_are_carried_forward_with_their_age():
+    extracted_frames = extract(sparse_replay())
+
+    assert [positions(extracted_frame) for extracted_frame in extracted_frames] == [
+        {constants.FRAME_BALL: (0, 0, 0), "1": (-1000, 0, 0)},
+        {constants.FRAME_BALL: (100, 50, 0), "1": (-1000, 0, 0.5)},
+        {constants.FRAME_BALL: (200, 100, 0), "1": (-1000, 0, 1), "2": (1000, 0, 0)},
+        {constants.FRAME_BALL: (200, 100, 1), "1": (-900, 0, 0), "2": (1000, 0, 1)},
+        {constants.FRAME_BALL: (500, 100, 0), "1": (-900, 0, 1), "2": (1000, 0, 2)},
+    ]
+
+
+def test_positions_are_not_carried_forward():
+    extracted_frames = extract(sparse_replay(), carry_forward=False)
+
+    assert [positions(extracted_frame) for extracted_frame in extracted_frames] == [
+        {constants.FRAME_BALL: (0, 0, 0), "1": (-1000, 0, 0)},
+        {constants.FRAME_BALL: (100, 50, 0)},
+        {constants.FRAME_BALL: (200, 100, 0), "2": (1000, 0, 0)},
+        {"1": (-900, 0, 0)},
+        {constants.FRAME_BALL: (500, 100, 0)},
+    ]
+
+
+def test_carried_forward_positions_are_the_last_updates():
+    replay_json = generate_replay(seconds=30, player_count=6, goal_count=2)
+    updated_frames = extract(replay_json[constants.FRAMES], carry_forward=False)
+    extracted_frames = extract(replay_json[constants.FRAMES])
+
+    last_updates = {}
+    for updated_frame, extracted_frame in zip(updated_frames, extracted_frames):
+        frame_time = extracted_frame[constants.FRAME_TIME]
+        for role, (x, y, _) in positions(updated_frame).items():
+            last_updates[role] = (x, y, frame_time)
+        assert positions(extracted_frame) == pytest.approx(
+            {role: (x, y, frame_time - update_time) for role, (x, y, update_time) in last_updates.items()})
+
+
+def test_resample_interpolates_between_updates():
+    frame_table = FrameTable.from_frames(extract(sparse_replay()), 2)
+
+    resampled_table = frame_table.resample(4)
+
+    assert list(resampled_table.time) == pytest.approx(np.arange(13) / 4)
+    # the ball is interpolated up to 1 second, then held during the 2 seconds without updates
+    assert list(resampled_table.ball_x) == pytest.approx([0, 50, 100, 150, 200, 200, 200, 200, 200, 200, 200, 200,
+                                                          500])
+    assert list(resampled_table.ball_y) == pytest.approx([0, 25, 50, 75, 100, 100, 100, 100, 100, 100, 100, 100,
+                                                          100])
+    assert list(resampled_table.ball_age) == pytest.approx([0, 0.25, 0, 0.25, 0, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75,
+                                                            0])
+    assert resampled_table.ball_valid.all()
+
+
+def test_resample_keeps_unknown_players_invalid():
+    frame_table = FrameTable.from_frames(extract(sparse_replay()), 2)
+
+    resampled_table = frame_table.resample(4)
+
+    # player 2 only spawns at 1 second, and holds its only position afterwards
+    assert list(resampled_table.player_valid[:, 1]) == [False] * 4 + [True] * 9
+    assert list(resampled_table.player_x[4:, 1]) == [1000] * 9
+    # player 1's updates at 0 and 2 seconds are too far apart to be interpolated, so the first one is held
+    assert list(resampled_table.player_x[:, 0]) == [-1000] * 8 + [-900] * 5
+    assert resampled_table.player_valid[:, 0].all()
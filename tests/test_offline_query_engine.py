@@ -0,0 +1,74 @@
+import pytest
+
+from src.offline_query_engine import evaluate_queries
+from src.query import Query
+from src.query_manager import QueryManager
+from src.query_sink import ListQuerySink
+
+QUERIES = [
+    'IF ball.x < midfield.x\nFOR LAST 2 SECONDS\nTHEN PRINT("Orange team defending")\nEVERY 1 SECONDS',
+    'IF player.3.x > midfield.x and player.5.x > midfield.x and player.6.x > midfield.x\n'
+    'FOR LAST 1 SECONDS\nTHEN PRINT("Offensive")\nEVERY 0.5 SECONDS',
+    'IF ball.y > 1000 or player.1.y < -2000\nFOR LAST 10 ENTRIES\nTHEN PRINT("Wide")\nEVERY 0.5 SECONDS',
+    'IF 100 / (ball.x - ball.x) > 1\nFOR LAST 1 ENTRIES\nTHEN PRINT("Broken")\nEVERY 0.5 SECONDS',
+    'IF (player.2.x + player.4.x) / 2 > ball.x - 500 and not ball.y > 3000\n'
+    'FOR LAST 0.5 SECONDS\nTHEN PRINT("Mixed")\nEVERY 0 SECONDS',
+    'IF ball.x > 0 and 1 / (ball.y // 1000) > 0.3 or not player.1.x < player.2.x < 1000\n'
+    'FOR LAST 0 SECONDS\nTHEN PRINT("Chained")\nEVERY 0.1 SECONDS',
+    'IF true and (player.4.x > 0) - (ball.y > 0) == 0\nFOR LAST 0.5 SECONDS\nTHEN PRINT("Booleans")\nEVERY 2 SECONDS',
+    'IF avg(ball.x, 2 seconds) > 1000\nFOR LAST 1 SECONDS\nTHEN PRINT("Pressure")\nEVERY 1 SECONDS',
+    'IF max(player.1.y, 30 entries) - min(player.1.y, 30 entries) > 500 and ball.age < 0.5\n'
+    'FOR LAST 3 ENTRIES\nTHEN PRINT("Moving")\nEVERY 0.5 SECONDS',
+    'IF dist(player.1, ball) < 3000 and in_zone(player.1, offensive_half)\n'
+    'FOR LAST 5 ENTRIES\nTHEN PRINT("Attack")\nEVERY 1 SECONDS',
+    'IF closest_to_ball(any) == 2 or centroid_x(orange) > centroid_x(blue)\n'
+    'FOR LAST 2 ENTRIES\nTHEN PRINT("Closest")\nEVERY 0.5 SECONDS',
+    'IF last_touch.team == team.orange and since_kickoff > 5\nFOR LAST 1 SECONDS\nTHEN PRINT("Orange ball")\n'
+    'EVERY 1 SECONDS',
+]
+
+
+def evaluate_with_queries(queries_text: list, frame_table, player_info: list) -> list:
+    """
+    Plays the frames through the queries, one frame at a time, without a query manager.
+    """
+    queries = [Query(query_text) for query_text in queries_text]
+    for query in queries:
+        query.compiled_condition.bind_players(player_info)
+    results = []
+    for frame_index in range(len(frame_table)):
+        message = frame_table.frame(frame_index)
+        for query in queries:
+            result = query.add_message(message)
+            if result is not None:
+                results.append((message["time"], result))
+    return results
+
+
+def evaluate_with_query_manager(queries_text: list, frame_table, player_info: list) -> list:
+    query_sink = ListQuerySink()
+    query_manager = QueryManager(query_sink, player_info=player_info)
+    for query_text in queries_text:
+        query_manager.add_query(Query(query_text))
+    for frame_index in range(len(frame_table)):
+        query_manager.add_message(frame_table.frame(frame_index))
+    return query_sink.results
+
+
+@pytest.mark.parametrize("query_text", QUERIES)
+def test_offline_engine_matches_the_playback(generated_replay, query_text):
+    player_info, frame_table = generated_replay
+
+    results = evaluate_queries([Query(query_text)], frame_table, player_info)
+
+    assert results == evaluate_with_queries([query_text], frame_table, player_info)
+
+
+def test_offline_engine_matches_the_query_manager(generated_replay):
+    player_info, frame_table = generated_replay
+
+    results = evaluate_queries([Query(query_text) for query_text in QUERIES], frame_table, player_info)
+
+    assert len(results) > 0
+    assert results == evaluate_with_query_manager(QUERIES, frame_table, player_info)
+    assert results == evaluate_with_queries(QUERIES, frame_table, player_info)
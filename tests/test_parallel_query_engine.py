@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from benchmarks.run_benchmarks import generate_queries
+from src.frame_table import FrameTable
+from src.offline_query_engine import evaluate_queries
+from src.parallel_query_engine import ParallelQueryEvaluator, SharedFrameTable
+from src.query import Query
+from tests.test_offline_query_engine import QUERIES
+
+PARALLEL_QUERIES = generate_queries(40) + QUERIES
+
+
+@pytest.fixture(scope="module")
+def parallel_evaluator():
+    parallel_evaluator = ParallelQueryEvaluator("\n\n".join(PARALLEL_QUERIES), workers=2)
+    yield parallel_evaluator
+    parallel_evaluator.close()
+
+
+def evaluate_serially(frame_table: FrameTable, player_info: list) -> list:
+    return evaluate_queries([Query(query_text) for query_text in PARALLEL_QUERIES], frame_table, player_info)
+
+
+def test_parallel_evaluation_matches_the_serial_one(generated_replay, parallel_evaluator):
+    player_info, frame_table = generated_replay
+
+    events = parallel_evaluator.evaluate(frame_table, player_info)
+
+    assert len(parallel_evaluator.partitions()) > 2
+    assert len(events) > 0
+    assert events == evaluate_serially(frame_table, player_info)
+
+
+def test_workers_follow_the_replays(generated_replay, parallel_evaluator):
+    player_info, frame_table = generated_replay
+    resampled_table = frame_table.resample(20)
+
+    # the workers attach to every replay's shared frame table in turn
+    assert parallel_evaluator.evaluate(resampled_table, player_info) == \
+        evaluate_serially(resampled_table, player_info)
+    assert parallel_evaluator.evaluate(frame_table, player_info) == evaluate_serially(frame_table, player_info)
+
+
+def test_shared_frame_table_round_trip(generated_replay):
+    _, frame_table = generated_replay
+    shared_frame_table = SharedFrameTable(frame_table)
+    try:
+        shared_memory, attached_table = SharedFrameTable.attach(shared_frame_table.descriptor())
+        for column_name in FrameTable.COLUMNS:
+            assert np.array_equal(getattr(attached_table, column_name), getattr(frame_table, column_name))
+        assert (attached_table.events.times, attached_table.events.types, attached_table.events.players,
+                attached_table.events.teams) == \
+            (frame_table.events.times, frame_table.events.types, frame_table.events.players,
+             frame_table.events.teams)
+        with pytest.raises(ValueError):
+            attached_table.ball_x[0] = 0
+        attached_table = None
+        shared_memory.close()
+    finally:
+        shared_frame_table.close()
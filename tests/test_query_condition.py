@@ -0,0 +1,111 @@
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import generate_replay
+from src.query_condition import QueryCondition
+from src.query_parse_exception import QueryParseException
+
+PARSED_OPERANDS = ["ball.x", "ball.y"] + ["player." + str(player) + "." + axis
+                                         for player in range(1, 7) for axis in ("x", "y")]
+
+# conditions with a single clause, so even the ones with an error have the same result in any clause order
+SINGLE_CLAUSE_CONDITIONS = [
+    "ball.x > 0",
+    "ball.y <= midfield.x",
+    "-ball.x > player.1.x",
+    "(ball.x + ball.y) / 2 > player.3.x - 100",
+    "ball.x // 1000 == 2",
+    "player.1.x % 500 < 250",
+    "-2000 < player.2.y < 2000",
+    "not ball.x > player.4.x",
+    "ball.x / (player.1.x - player.1.x) > 0",
+]
+# conditions with multiple clauses, without errors
+MULTI_CLAUSE_CONDITIONS = [
+    ("and", ["ball.x > 0", "player.1.x > -2000"]),
+    ("and", ["ball.y < midfield.x", "player.2.y > 0", "player.4.x < ball.x"]),
+    ("or", ["player.1.y - player.2.y > 100", "ball.x < -3000"]),
+    ("or", ["ball.x > 3000", "player.3.x * 2 < -1000", "not player.4.y > 0"]),
+]
+
+
+def evaluate_with_eval(condition: str, message: dict) -> str:
+    """
+    The condition evaluation as it was before the conditions were compiled: the operands are replaced with their
+    values in the condition's text (after swapping the coordinates, which are reversed in the frames), which is
+    then evaluated.
+    """
+    for operand in ("ball", "player.1", "player.2", "player.3", "player.4", "player.5", "player.6"):
+        condition = condition.replace(operand + ".x", "PLACEHOLDER")
+        condition = condition.replace(operand + ".y", operand + ".x")
+        condition = condition.replace("PLACEHOLDER", operand + ".y")
+    enhanced_condition = condition.replace("midfield.x", "0")
+
+    for parsed_operand in PARSED_OPERANDS:
+        try:
+            parsed_operand_value = message
+            for operand_key in parsed_operand.split("."):
+                parsed_operand_value = parsed_operand_value[operand_key]
+            enhanced_condition = enhanced_condition.replace(parsed_operand, str(parsed_operand_value))
+        except KeyError:
+            if parsed_operand in condition:
+                return QueryCondition.INCOMPLETE
+
+    try:
+        if eval(enhanced_condition, {'__builtin__': None}):
+            return QueryCondition.CORRECT
+        else:
+            return QueryCondition.INCORRECT
+    except (SyntaxError, ZeroDivisionError, NameError, TypeError, KeyError):
+        return QueryCondition.ERROR
+
+
+def combine_clause_results(operator: str, clause_results: list) -> str:
+    # a clause which decides the result wins over the unknown ones
+    deciding_result = QueryCondition.CORRECT if operator == "or" else QueryCondition.INCORRECT
+    if deciding_result in clause_results:
+        return deciding_result
+    if QueryCondition.INCOMPLETE in clause_results:
+        return QueryCondition.INCOMPLETE
+    return QueryCondition.INCORRECT if operator == "or" else QueryCondition.CORRECT
+
+
+def generated_frames(carry_forward: bool) -> list:
+    replay_json = generate_replay(seconds=20, player_count=4, goal_count=1)
+    player_info = replay_parser.extract_player_info(replay_json[constants.FRAMES][0])
+    return replay_parser.extract_frames(replay_json, player_info, carry_forward=carry_forward)
+
+
+@pytest.mark.parametrize("carry_forward", [True, False])
+@pytest.mark.parametrize("condition", SINGLE_CLAUSE_CONDITIONS)
+def test_single_clause_matches_the_eval(condition, carry_forward):
+    extracted_frames = generated_frames(carry_forward)
+    query_condition = QueryCondition(condition)
+
+    results = [query_condition.evaluate(extracted_frame) for extracted_frame in extracted_frames]
+
+    assert results == [evaluate_with_eval(condition, extracted_frame) for extracted_frame in extracted_frames]
+
+
+@pytest.mark.parametrize("carry_forward", [True, False])
+@pytest.mark.parametrize("operator, clauses", MULTI_CLAUSE_CONDITIONS)
+def test_multiple_clauses_match_the_eval(operator, clauses, carry_forward):
+    extracted_frames = generated_frames(carry_forward)
+    condition = (" " + operator + " ").join(clauses)
+    query_condition = QueryCondition(condition)
+
+    for extracted_frame in extracted_frames:
+        result = query_condition.evaluate(extracted_frame)
+        eval_result = evaluate_with_eval(condition, extracted_frame)
+        # the eval made the whole condition incomplete as soon as an operand was missing
+        if eval_result != QueryCondition.INCOMPLETE:
+            assert result == eval_result
+        assert result == combine_clause_results(operator, [evaluate_with_eval(clause, extracted_frame)
+                                                            for clause in clauses])
+
+
+@pytest.mark.parametrize("condition", ["ball.z > 0", "ball.x >", "__import__('os')", "len(ball.x) > 0"])
+def test_invalid_conditions_are_rejected(condition):
+    with pytest.raises(QueryParseException):
+        QueryCondition(condition)
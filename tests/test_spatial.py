@@ -0,0 +1,126 @@
+import math
+
+import pytest
+
+import src.constants as constants
+import src.replay_parser as replay_parser
+from benchmarks.replay_generator import first_frame_updates
+from src.query_condition import QueryCondition
+from src.query_parse_exception import QueryParseException
+from src.spatial import SpatialOperand, SpatialPositions
+
+# players 1, 3 and 5 are orange, players 2, 4 and 6 are blue
+PLAYER_INFO = replay_parser.extract_player_info({constants.ACTOR_UPDATES: first_frame_updates(6)})
+
+
+def message(ball: tuple = None, players: dict = None) -> dict:
+    """
+    A message with the given positions, in the conditions' coordinates (the frames' coordinates are reversed).
+    """
+    extracted_frame = {constants.FRAME_TIME: 0.0, constants.FRAME_PLAYER: {}}
+    if ball is not None:
+        extracted_frame[constants.FRAME_BALL] = {constants.FRAME_X: ball[1], constants.FRAME_Y: ball[0],
+                                                 constants.FRAME_AGE: 0.0}
+    for player, (x, y) in (players or {}).items():
+        extracted_frame[constants.FRAME_PLAYER][str(player)] = {constants.FRAME_X: y, constants.FRAME_Y: x,
+                                                                constants.FRAME_AGE: 0.0}
+    return extracted_frame
+
+
+def evaluate(function: str, arguments: list, extracted_frame: dict, bind_players: bool = True):
+    spatial_operand = SpatialOperand(function, arguments)
+    if bind_players:
+        spatial_operand.bind_players(PLAYER_INFO)
+    return spatial_operand.evaluate_message(SpatialPositions.from_message(extracted_frame))
+
+
+KICKOFF = message(ball=(0, 0), players={1: (-3000, 0), 2: (3000, 400), 3: (-100, -300), 4: (2500, -2000),
+                                        5: (-4000, 100)})
+
+
+@pytest.mark.parametrize("function, arguments, expected_value", [
+    ("dist", ["ball", "player.1"], 3000),
+    ("dist", ["player.2", "player.4"], math.hypot(500, 2400)),
+    ("dist", ["orange", "blue"], math.hypot(2750 - (-7100 / 3), -800 - (-200 / 3))),
+    ("centroid_x", ["orange"], -7100 / 3),
+    ("centroid_y", ["blue"], -800),
+    ("closest_to_ball", ["any"], 3),
+    ("closest_to_ball", ["blue"], 2),
+    ("closest_dist_to_ball", ["orange"], math.hypot(100, 300)),
+    ("closest_dist_to_ball", ["blue"], math.hypot(3000, 400)),
+    ("in_zone", ["ball", "middle_third"], True),
+    ("in_zone", ["ball", "blue_half"], True),
+    ("in_zone", ["player.5", "orange_third"], True),
+    ("in_zone", ["player.1", "orange_third"], True),
+    ("in_zone", ["player.2", "defensive_third"], True),
+    ("in_zone", ["player.4", "offensive_half"], False),
+    ("in_zone", ["player.5", "defensive_third"], True),
+    ("in_zone", ["blue", "blue_third"], True),
+    ("in_zone", ["player.3", "offensive_third"], False),
+])
+def test_spatial_operand_values(function, arguments, expected_value):
+    assert evaluate(function, arguments, KICKOFF) == pytest.approx(expected_value)
+
+
+@pytest.mark.parametrize("function, arguments", [
+    ("dist", ["ball", "player.6"]),
+    ("in_zone", ["player.6", "blue_half"]),
+    ("centroid_x", ["orange"]),
+    ("closest_to_ball", ["any"]),
+])
+def test_missing_positions_have_no_value(function, arguments):
+    # no ball, and no player 6 nor orange player
+    extracted_frame = message(players={2: (0, 0), 4: (100, 100)})
+
+    assert evaluate(function, arguments, extracted_frame) is None
+
+
+@pytest.mark.parametrize("function, arguments", [
+    ("dist", ["ball", "orange"]),
+    ("in_zone", ["player.1", "offensive_half"]),
+    ("closest_to_ball", ["blue"]),
+])
+def test_teams_are_unknown_until_the_players_are_bound(function, arguments):
+    assert evaluate(function, arguments, KICKOFF, bind_players=False) is None
+    assert evaluate(function, arguments, KICKOFF) is not None
+
+
+def test_vectorized_operands_match_the_messages(generated_replay):
+    player_info, frame_table = generated_replay
+    positions = SpatialPositions.from_frame_table(frame_table)
+
+    for function, arguments in [("dist", ["player.2", "ball"]), ("dist", ["orange", "blue"]),
+                                ("in_zone", ["player.3", "offensive_third"]), ("in_zone", ["ball", "orange_half"]),
+                                ("closest_to_ball", ["any"]), ("closest_dist_to_ball", ["orange"]),
+                                ("centroid_x", ["blue"]), ("centroid_y", ["orange"])]:
+        spatial_operand = SpatialOperand(function, arguments)
+        spatial_operand.bind_players(player_info)
+        values, valid = spatial_operand.evaluate_columns(positions)
+
+        message_values = [spatial_operand.evaluate_message(SpatialPositions.from_message(frame_table.frame(index)))
+                          for index in range(len(frame_table))]
+        assert [value is not None for value in message_values] == list(valid)
+        assert [value for value in message_values if value is not None] == pytest.approx(list(values[valid]))
+
+
+def test_spatial_functions_in_conditions():
+    condition = QueryCondition("dist(player.1, ball) < 3500 and in_zone(player.2, offensive_half) "
+                               "and closest_to_ball(orange) == 3")
+    condition.bind_players(PLAYER_INFO)
+
+    assert condition.evaluate(KICKOFF) == QueryCondition.INCORRECT
+    assert condition.evaluate(message(ball=(0, 0), players={1: (-3000, 0), 2: (-3000, 400), 3: (-100, -300)})) \
+        == QueryCondition.CORRECT
+
+
+@pytest.mark.parametrize("condition", [
+    "dist(ball) > 0",
+    "dist(ball, player.7) > 0",
+    "in_zone(ball, defensive_half)",
+    "in_zone(player.1, penalty_box)",
+    "closest_to_ball(red) == 1",
+    "centroid_x(any) > 0",
+])
+def test_invalid_spatial_functions_are_rejected(condition):
+    with pytest.raises(QueryParseException):
+        QueryCondition(condition)